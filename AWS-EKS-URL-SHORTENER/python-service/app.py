@@ -1,12 +1,17 @@
 from flask import Flask, render_template, request, jsonify
 import sqlite3
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import logging
 import os
 import redis
 import json
 import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 # ... existing imports ...
 
@@ -21,13 +26,63 @@ EXTERNAL_GO_SERVICE_URL = os.getenv("EXTERNAL_GO_SERVICE_URL", "http://localhost
 # Use subdirectory for database file
 DATABASE = "data/python.db"
 
+# Background re-enrichment of failed/pending metadata
+ENRICH_INTERVAL_SECONDS = int(os.getenv("ENRICH_INTERVAL_SECONDS", "60"))
+ENRICH_BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "50"))
+ENRICH_MAX_WORKERS = int(os.getenv("ENRICH_MAX_WORKERS", "4"))
+ENRICH_MAX_ATTEMPTS = int(os.getenv("ENRICH_MAX_ATTEMPTS", "8"))
+ENRICH_BACKOFF_BASE_SECONDS = int(os.getenv("ENRICH_BACKOFF_BASE_SECONDS", "60"))
+ENRICH_BACKOFF_MAX_SECONDS = int(os.getenv("ENRICH_BACKOFF_MAX_SECONDS", "21600"))
+ENRICH_HOST_MIN_INTERVAL = float(os.getenv("ENRICH_HOST_MIN_INTERVAL", "2.0"))
+
+# Readiness thresholds for /ready
+READY_MAX_INGEST_LAG_SECONDS = float(os.getenv("READY_MAX_INGEST_LAG_SECONDS", "120"))
+READY_MAX_QUEUE_DEPTH = int(os.getenv("READY_MAX_QUEUE_DEPTH", "1000"))
+
+# Opt-in SQLite slow-query log (0 disables)
+SQLITE_SLOW_QUERY_MS = float(os.getenv("SQLITE_SLOW_QUERY_MS", "0"))
+SQLITE_SLOW_QUERY_LOG_SIZE = int(os.getenv("SQLITE_SLOW_QUERY_LOG_SIZE", "100"))
+
 # Initialize Redis client
 redis_client = None
 
+# Click events received from Redis, drained by the click worker thread
+click_queue = queue.Queue()
+subscriber_thread = None
+click_worker_thread = None
+
+# Ingest progress (exposed via /ready)
+ingest_state = {
+    "processed": 0,
+    "newest_clicked_at": None,
+    "last_processed_at": None,
+    "subscriber_error": None,
+}
+ingest_lock = threading.Lock()
+
+# Most recent statements slower than SQLITE_SLOW_QUERY_MS
+slow_queries = deque(maxlen=SQLITE_SLOW_QUERY_LOG_SIZE)
+
+# Re-enrichment throughput counters (exposed via /api/enrichment)
+enrichment_stats = {
+    "runs": 0,
+    "attempted": 0,
+    "fetched": 0,
+    "failed": 0,
+    "last_run_at": None,
+    "last_run_seconds": 0.0,
+    "last_batch_size": 0,
+}
+enrichment_lock = threading.Lock()
+
+# Per-host rate limiting: host -> earliest time the next request may start
+host_next_slot = {}
+host_slot_lock = threading.Lock()
+
 
 def init_redis():
     """Initialize Redis connection"""
-    global redis_client
+    global redis_client, subscriber_thread, click_worker_thread
     try:
         # Parse host and port
         host_port = REDIS_URL.split(":")
@@ -38,7 +93,9 @@ def init_redis():
         redis_client.ping()
         logging.info(f"✅ Redis connected successfully at {REDIS_URL}")
 
-        # Start Redis subscriber in background thread
+        # Start click worker and Redis subscriber in background threads
+        click_worker_thread = threading.Thread(target=click_worker, daemon=True)
+        click_worker_thread.start()
         subscriber_thread = threading.Thread(target=redis_subscriber, daemon=True)
         subscriber_thread.start()
         logging.info("Redis subscriber thread started")
@@ -58,12 +115,25 @@ def redis_subscriber():
         for message in pubsub.listen():
             if message["type"] == "message":
                 try:
-                    event_data = json.loads(message["data"])
-                    process_click_event(event_data)
+                    click_queue.put(json.loads(message["data"]))
                 except Exception as e:
-                    logging.error(f"Error processing Redis event: {e}")
+                    logging.error(f"Error decoding Redis event: {e}")
     except Exception as e:
         logging.error(f"Redis subscriber error: {e}")
+        with ingest_lock:
+            ingest_state["subscriber_error"] = str(e)
+
+
+def click_worker():
+    """Drain click events queued by the Redis subscriber"""
+    while True:
+        event_data = click_queue.get()
+        try:
+            process_click_event(event_data)
+        except Exception as e:
+            logging.error(f"Error processing Redis event: {e}")
+        finally:
+            click_queue.task_done()
 
 
 def process_click_event(data):
@@ -97,9 +167,28 @@ def process_click_event(data):
     conn.commit()
     conn.close()
 
+    try:
+        clicked_at_utc = parse_timestamp(clicked_at)
+    except (TypeError, ValueError):
+        clicked_at_utc = None
+    with ingest_lock:
+        ingest_state["processed"] += 1
+        ingest_state["last_processed_at"] = datetime.now().isoformat()
+        newest = ingest_state["newest_clicked_at"]
+        if clicked_at_utc and (newest is None or clicked_at_utc > newest):
+            ingest_state["newest_clicked_at"] = clicked_at_utc
+
     logging.info(f"📊 Processed click event for: {short_code}")
 
 
+def parse_timestamp(value):
+    """Parse an ISO-8601/RFC3339 timestamp into an aware UTC datetime"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.astimezone()
+    return parsed.astimezone(timezone.utc)
+
+
 def init_db():
     """Initialize the database with required tables"""
     conn = sqlite3.connect(DATABASE)
@@ -128,23 +217,307 @@ def init_db():
             title TEXT,
             description TEXT,
             favicon_url TEXT,
-            metadata_status TEXT DEFAULT 'pending'
+            metadata_status TEXT DEFAULT 'pending',
+            metadata_attempts INTEGER DEFAULT 0,
+            metadata_next_retry DATETIME
         )
     """
     )
 
+    # Add retry bookkeeping columns to databases created before they existed
+    cursor.execute("PRAGMA table_info(url_metadata)")
+    columns = {row[1] for row in cursor.fetchall()}
+    if "metadata_attempts" not in columns:
+        cursor.execute("ALTER TABLE url_metadata ADD COLUMN metadata_attempts INTEGER DEFAULT 0")
+    if "metadata_next_retry" not in columns:
+        cursor.execute("ALTER TABLE url_metadata ADD COLUMN metadata_next_retry DATETIME")
+
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_url_metadata_status
+        ON url_metadata (metadata_status, metadata_next_retry)
+    """
+    )
+
     conn.commit()
     conn.close()
     logging.info("Database initialized successfully")
 
 
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that records statements slower than SQLITE_SLOW_QUERY_MS.
+
+    SQLite steps through a result set lazily, so a statement's time is execute() plus
+    every fetch or iteration step until its rows run out, the cursor runs another
+    statement, or the cursor is closed or garbage-collected.
+    """
+
+    _statement = None
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._statement = sql
+            self._elapsed = time.perf_counter() - started
+            # Statements without a result set are done once they have run
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query_time(sql, time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._step(started, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._step(started, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._step(started, True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        exhausted = False
+        try:
+            return super().__next__()
+        except StopIteration:
+            exhausted = True
+            raise
+        finally:
+            self._step(started, exhausted)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Covers the common fetchone() lookup whose cursor is dropped before its rows run out
+        self._finish()
+
+    def _step(self, started, exhausted):
+        if self._statement is None:
+            return
+        self._elapsed += time.perf_counter() - started
+        if exhausted:
+            self._finish()
+
+    def _finish(self):
+        if self._statement is not None:
+            statement, self._statement = self._statement, None
+            record_query_time(statement, self._elapsed)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute) are timed"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def record_query_time(sql, elapsed):
+    """Log a statement if it took longer (in seconds, fetches included) than the slow-query threshold"""
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms < SQLITE_SLOW_QUERY_MS:
+        return
+    statement = " ".join(sql.split())
+    slow_queries.append(
+        {
+            "statement": statement,
+            "duration_ms": round(elapsed_ms, 2),
+            "thread": threading.current_thread().name,
+            "at": datetime.now().isoformat(),
+        }
+    )
+    logging.warning(f"🐢 Slow query ({elapsed_ms:.1f} ms): {statement}")
+
+
 def get_db():
     """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
+    if SQLITE_SLOW_QUERY_MS > 0:
+        conn = sqlite3.connect(DATABASE, factory=TimedConnection)
+    else:
+        conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def fetch_metadata(short_code, long_url):
+    """Ask the Node.js service to fetch metadata for a URL"""
+    metadata = {"status": "unavailable"}
+    try:
+        node_response = requests.post(
+            f"{NODE_SERVICE_URL}/api/metadata",
+            json={"short_code": short_code, "long_url": long_url},
+            timeout=7,
+        )
+        if node_response.status_code == 200:
+            metadata = node_response.json()
+            logging.info(f"✅ Metadata fetched: {metadata.get('title', 'N/A')}")
+        else:
+            logging.warning(
+                f"Node.js service returned status: {node_response.status_code}"
+            )
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Node.js service unavailable: {e}")
+    return metadata
+
+
+def next_retry_at(attempts):
+    """Exponential backoff for the next metadata retry"""
+    delay = min(
+        ENRICH_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)),
+        ENRICH_BACKOFF_MAX_SECONDS,
+    )
+    return datetime.now() + timedelta(seconds=delay)
+
+
+def wait_for_host_slot(long_url):
+    """Block until the target host may be fetched again (per-host rate limit)"""
+    host = urlparse(long_url).netloc.lower()
+    with host_slot_lock:
+        now = time.monotonic()
+        slot = max(now, host_next_slot.get(host, now))
+        host_next_slot[host] = slot + ENRICH_HOST_MIN_INTERVAL
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def enrich_row(row):
+    """Re-fetch metadata for a single url_metadata row"""
+    wait_for_host_slot(row["long_url"])
+    return row, fetch_metadata(row["short_code"], row["long_url"])
+
+
+def run_enrichment_batch():
+    """Retry one batch of failed/pending metadata rows; returns rows attempted"""
+    started = time.monotonic()
+    now = datetime.now().isoformat()
+
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT short_code, long_url, metadata_attempts
+        FROM url_metadata
+        WHERE metadata_status IN ('failed', 'pending')
+          AND metadata_attempts < ?
+          AND (metadata_next_retry IS NULL OR metadata_next_retry <= ?)
+        ORDER BY metadata_next_retry
+        LIMIT ?
+    """,
+        (ENRICH_MAX_ATTEMPTS, now, ENRICH_BATCH_SIZE),
+    )
+    rows = [dict(row) for row in cursor.fetchall()]
+
+    if not rows:
+        conn.close()
+        return 0
+
+    with ThreadPoolExecutor(max_workers=ENRICH_MAX_WORKERS) as executor:
+        results = list(executor.map(enrich_row, rows))
+
+    fetched = []
+    failed = []
+    for row, metadata in results:
+        if metadata.get("status") == "success":
+            fetched.append(
+                (
+                    metadata.get("title"),
+                    metadata.get("description"),
+                    metadata.get("favicon_url"),
+                    row["short_code"],
+                )
+            )
+        else:
+            attempts = (row["metadata_attempts"] or 0) + 1
+            failed.append((attempts, next_retry_at(attempts).isoformat(), row["short_code"]))
+
+    # Apply all updates for the batch in a single transaction
+    with conn:
+        conn.executemany(
+            """
+            UPDATE url_metadata
+            SET title = ?, description = ?, favicon_url = ?,
+                metadata_status = 'fetched', metadata_next_retry = NULL
+            WHERE short_code = ?
+        """,
+            fetched,
+        )
+        conn.executemany(
+            """
+            UPDATE url_metadata
+            SET metadata_status = 'failed', metadata_attempts = ?, metadata_next_retry = ?
+            WHERE short_code = ?
+        """,
+            failed,
+        )
+    conn.close()
+
+    elapsed = time.monotonic() - started
+    with enrichment_lock:
+        enrichment_stats["runs"] += 1
+        enrichment_stats["attempted"] += len(rows)
+        enrichment_stats["fetched"] += len(fetched)
+        enrichment_stats["failed"] += len(failed)
+        enrichment_stats["last_run_at"] = datetime.now().isoformat()
+        enrichment_stats["last_run_seconds"] = round(elapsed, 3)
+        enrichment_stats["last_batch_size"] = len(rows)
+
+    logging.info(
+        f"🔁 Re-enrichment batch: {len(fetched)} fetched, {len(failed)} failed "
+        f"of {len(rows)} in {elapsed:.2f}s"
+    )
+    return len(rows)
+
+
+def enrichment_scheduler():
+    """Periodically retry failed/pending metadata in the background"""
+    logging.info(f"Metadata re-enrichment scheduler running every {ENRICH_INTERVAL_SECONDS}s")
+    while True:
+        try:
+            # Drain full batches back-to-back, then sleep until the next tick
+            while run_enrichment_batch() >= ENRICH_BATCH_SIZE:
+                pass
+        except Exception as e:
+            logging.error(f"Re-enrichment scheduler error: {e}")
+        time.sleep(ENRICH_INTERVAL_SECONDS)
+
+
+def init_enrichment():
+    """Start the metadata re-enrichment scheduler thread"""
+    if ENRICH_INTERVAL_SECONDS <= 0:
+        logging.info("Metadata re-enrichment scheduler disabled")
+        return
+    scheduler_thread = threading.Thread(target=enrichment_scheduler, daemon=True)
+    scheduler_thread.start()
+
+
 @app.route("/")
 def dashboard():
     """Main dashboard page"""
@@ -172,22 +545,7 @@ def create_short_url():
             data["short_url"] = f"{EXTERNAL_GO_SERVICE_URL}/{data['short_code']}"
 
             # Call Node.js service to fetch metadata asynchronously
-            metadata = {"status": "unavailable"}
-            try:
-                node_response = requests.post(
-                    f"{NODE_SERVICE_URL}/api/metadata",
-                    json={"short_code": data["short_code"], "long_url": long_url},
-                    timeout=7,
-                )
-                if node_response.status_code == 200:
-                    metadata = node_response.json()
-                    logging.info(f"✅ Metadata fetched: {metadata.get('title', 'N/A')}")
-                else:
-                    logging.warning(
-                        f"Node.js service returned status: {node_response.status_code}"
-                    )
-            except requests.exceptions.RequestException as e:
-                logging.warning(f"Node.js service unavailable: {e}")
+            metadata = fetch_metadata(data["short_code"], long_url)
 
             # Store metadata in Python database
             conn = get_db()
@@ -210,12 +568,19 @@ def create_short_url():
                     ),
                 )
             else:
+                # First retry is picked up by the enrichment scheduler
                 cursor.execute(
                     """
-                    INSERT OR IGNORE INTO url_metadata (short_code, long_url, first_seen, metadata_status)
-                    VALUES (?, ?, ?, 'failed')
+                    INSERT OR IGNORE INTO url_metadata
+                    (short_code, long_url, first_seen, metadata_status, metadata_attempts, metadata_next_retry)
+                    VALUES (?, ?, ?, 'failed', 1, ?)
                 """,
-                    (data["short_code"], long_url, datetime.now().isoformat()),
+                    (
+                        data["short_code"],
+                        long_url,
+                        datetime.now().isoformat(),
+                        next_retry_at(1).isoformat(),
+                    ),
                 )
 
             conn.commit()
@@ -330,6 +695,117 @@ def get_stats():
     )
 
 
+@app.route("/api/enrichment")
+def get_enrichment_status():
+    """Metadata status counts and re-enrichment throughput"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT metadata_status, COUNT(*) as count
+        FROM url_metadata
+        GROUP BY metadata_status
+    """
+    )
+    status_counts = {row["metadata_status"]: row["count"] for row in cursor.fetchall()}
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM url_metadata
+        WHERE metadata_status IN ('failed', 'pending') AND metadata_attempts >= ?
+    """,
+        (ENRICH_MAX_ATTEMPTS,),
+    )
+    exhausted = cursor.fetchone()[0]
+    conn.close()
+
+    with enrichment_lock:
+        stats = dict(enrichment_stats)
+    stats["rows_per_second"] = (
+        round(stats["last_batch_size"] / stats["last_run_seconds"], 2)
+        if stats["last_run_seconds"]
+        else 0.0
+    )
+
+    return jsonify(
+        {
+            "status_counts": status_counts,
+            "retries_exhausted": exhausted,
+            "throughput": stats,
+        }
+    )
+
+
+@app.route("/api/slow-queries")
+def get_slow_queries():
+    """Recent SQLite statements slower than SQLITE_SLOW_QUERY_MS"""
+    return jsonify(
+        {
+            "enabled": SQLITE_SLOW_QUERY_MS > 0,
+            "threshold_ms": SQLITE_SLOW_QUERY_MS,
+            "queries": list(slow_queries),
+        }
+    )
+
+
+@app.route("/ready")
+def readiness_check():
+    """Readiness endpoint: subscriber liveness, ingest lag and queue depth"""
+    checks = {}
+
+    # Subscriber is only required when Redis is in use
+    if redis_client is None:
+        checks["subscriber"] = "disabled"
+        subscriber_ok = True
+    else:
+        subscriber_ok = (
+            subscriber_thread is not None
+            and subscriber_thread.is_alive()
+            and click_worker_thread is not None
+            and click_worker_thread.is_alive()
+        )
+        checks["subscriber"] = "alive" if subscriber_ok else "dead"
+
+    queue_depth = click_queue.qsize()
+    with ingest_lock:
+        state = dict(ingest_state)
+
+    newest = state["newest_clicked_at"]
+    ingest_lag = (
+        (datetime.now(timezone.utc) - newest).total_seconds() if newest else None
+    )
+    # An idle pod has nothing to catch up on, so lag only counts with a backlog
+    lag_ok = queue_depth == 0 or ingest_lag is None or ingest_lag <= READY_MAX_INGEST_LAG_SECONDS
+    queue_ok = queue_depth <= READY_MAX_QUEUE_DEPTH
+
+    try:
+        conn = get_db()
+        conn.execute("SELECT 1")
+        conn.close()
+        checks["database"] = "ok"
+        database_ok = True
+    except sqlite3.Error as e:
+        checks["database"] = f"error: {e}"
+        database_ok = False
+
+    ready = subscriber_ok and lag_ok and queue_ok and database_ok
+    return (
+        jsonify(
+            {
+                "status": "ready" if ready else "not_ready",
+                "checks": checks,
+                "subscriber_error": state["subscriber_error"],
+                "ingest_lag_seconds": round(ingest_lag, 3) if ingest_lag is not None else None,
+                "newest_clicked_at": newest.isoformat() if newest else None,
+                "last_processed_at": state["last_processed_at"],
+                "events_processed": state["processed"],
+                "queue_depth": queue_depth,
+                "timestamp": datetime.now().isoformat(),
+            }
+        ),
+        200 if ready else 503,
+    )
+
+
 @app.route("/health")
 def health_check():
     """Health check endpoint"""
@@ -344,5 +820,6 @@ def health_check():
 if __name__ == "__main__":
     init_db()
     init_redis()
+    init_enrichment()
     logging.info(f"🚀 Python Dashboard starting with external Go URL: {EXTERNAL_GO_SERVICE_URL}")
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
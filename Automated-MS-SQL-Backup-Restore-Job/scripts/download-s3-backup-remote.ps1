@@ -125,6 +125,27 @@ try {
                     $fileName = [System.IO.Path]::GetFileName($latestBackup.Key)
                     $localFilePath = Join-Path -Path $RemoteDirectory -ChildPath $fileName
 
+                    # Backups uploaded with --compress (.zst/.gz) carry the original size and SHA-256 as metadata
+                    $compression = $null
+                    if ($fileName -match '\.(zst|gz)$') {
+                        $compression = $Matches[1]
+                        $restoredFilePath = $localFilePath.Substring(0, $localFilePath.Length - $compression.Length - 1)
+                        $headCommand = "aws s3api head-object --bucket $S3BucketName --key $($latestBackup.Key) --query Metadata --output json"
+                        Write-Log "Executing: $headCommand" "DEBUG"
+                        $metadataJson = Invoke-Expression $headCommand 2>&1
+                        if ($LASTEXITCODE -ne 0) {
+                            throw "Failed to read backup metadata. AWS CLI error: $metadataJson"
+                        }
+                        $metadata = ($metadataJson | Out-String) | ConvertFrom-Json
+                        $originalSize = [int64]$metadata.'original-size'
+                        Write-Log "Compressed backup ($compression), original size: $([math]::Round($originalSize/1MB, 2)) MB" "INFO"
+
+                        if ((Test-Path $restoredFilePath) -and (Get-Item $restoredFilePath).Length -eq $originalSize) {
+                            Write-Log "Decompressed file already exists with same size. Skipping download." "WARN"
+                            return $restoredFilePath
+                        }
+                    }
+
                     # Check if file already exists and compare sizes
                     if (Test-Path $localFilePath) {
                         $existingFile = Get-Item $localFilePath
@@ -162,6 +183,46 @@ try {
                     Write-Log "File size: $([math]::Round($downloadedFile.Length/1MB, 2)) MB" "INFO"
                     Write-Log "Location: $localFilePath" "INFO"
 
+                    # Decompress next to the download and check it against the original size and SHA-256
+                    if ($compression) {
+                        Write-Log "Decompressing $localFilePath to $restoredFilePath" "INFO"
+                        if ($compression -eq 'gz') {
+                            $inputStream = [System.IO.File]::OpenRead($localFilePath)
+                            $outputStream = [System.IO.File]::Create($restoredFilePath)
+                            $gzipStream = New-Object System.IO.Compression.GZipStream($inputStream, [System.IO.Compression.CompressionMode]::Decompress)
+                            try {
+                                $gzipStream.CopyTo($outputStream, 4MB)
+                            } finally {
+                                $gzipStream.Dispose()
+                                $outputStream.Dispose()
+                                $inputStream.Dispose()
+                            }
+                        } else {
+                            if (-not (Get-Command zstd -ErrorAction SilentlyContinue)) {
+                                throw "zstd is required to decompress $fileName but was not found on PATH"
+                            }
+                            $zstdResult = & zstd -d -f -q $localFilePath -o $restoredFilePath 2>&1
+                            if ($LASTEXITCODE -ne 0) {
+                                throw "zstd decompression failed. Error: $zstdResult"
+                            }
+                        }
+
+                        $restoredFile = Get-Item $restoredFilePath
+                        if ($restoredFile.Length -ne $originalSize) {
+                            Remove-Item $restoredFilePath -Force
+                            throw "Decompressed size mismatch. Expected: $originalSize bytes, Actual: $($restoredFile.Length) bytes"
+                        }
+                        $restoredHash = (Get-FileHash -Path $restoredFilePath -Algorithm SHA256).Hash
+                        if ($restoredHash -ne $metadata.'original-sha256') {
+                            Remove-Item $restoredFilePath -Force
+                            throw "Decompressed SHA-256 mismatch. Expected: $($metadata.'original-sha256'), Actual: $restoredHash"
+                        }
+
+                        Remove-Item $localFilePath -Force
+                        $localFilePath = $restoredFilePath
+                        Write-Log "Decompressed and verified: $localFilePath ($([math]::Round($originalSize/1MB, 2)) MB)" "INFO"
+                    }
+
                     # Return the downloaded file path
                     $localFilePath
 
@@ -1,17 +1,61 @@
 import boto3
+import botocore.session
 import os
 import logging
 import argparse
 import tempfile
 import winrm
+import base64
+import hashlib
+import fnmatch
 import json
-from botocore.exceptions import ClientError, NoCredentialsError, EndpointConnectionError
+import math
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import (ClientError, NoCredentialsError, EndpointConnectionError, ConnectionClosedError,
+                                 IncompleteReadError, ReadTimeoutError, ResponseStreamingError)
 import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Multipart transfer settings (S3 allows at most 10,000 parts of at least 5 MiB each)
+DEFAULT_PART_SIZE_MB = 64
+DEFAULT_MAX_CONCURRENCY = 10
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Batch mode: backups copied at the same time (each one to all destinations)
+DEFAULT_MAX_OBJECTS = 2
+# Every part carries a SHA-256 checksum that S3 verifies on arrival
+CHECKSUM_ALGORITHM = 'SHA256'
+# Latest-backup discovery: how many days of date partitions to look back through
+DEFAULT_LOOKBACK_DAYS = 7
+# Optional compression stage: file suffix and default level per algorithm; gzip is compressed
+# in blocks of GZIP_BLOCK_SIZE, each primed with the last GZIP_WINDOW bytes of the block before it
+COMPRESSION_SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+DEFAULT_COMPRESSION_LEVELS = {'zstd': 3, 'gzip': 6}
+GZIP_BLOCK_SIZE = 4 * 1024 * 1024
+GZIP_WINDOW = 32 * 1024
+# Transfer progress (MB/s and ETA) is logged at most this often per transfer
+PROGRESS_INTERVAL_SECONDS = 15
+# A part whose stream breaks mid-transfer is retried this many times before the transfer fails
+PART_ATTEMPTS = 3
+PART_RETRY_ERRORS = (ConnectionClosedError, EndpointConnectionError, IncompleteReadError, ReadTimeoutError,
+                     ResponseStreamingError)
+
 def assume_role(role_arn, session_name="S3Session"):
     """
     Assume an IAM role and return credentials
@@ -32,22 +76,500 @@ def assume_role(role_arn, session_name="S3Session"):
         logger.error(f"Failed to assume role {role_arn}: {error_code} - {error_msg}")
         raise Exception(f"Failed to assume role: {error_code} - {error_msg}")
 
-def create_s3_client(credentials):
+def role_session(role_arn, session_name="S3Session"):
+    """
+    Return a boto3 session whose credentials re-assume role_arn shortly before they expire
+    (botocore refreshes them from the next request on), so transfers that outlive the role's
+    session duration keep running
+    """
+    def refresh():
+        credentials = assume_role(role_arn, session_name)
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat()
+        }
+    
+    botocore_session = botocore.session.get_session()
+    botocore_session._credentials = RefreshableCredentials.create_from_metadata(
+        metadata=refresh(),
+        refresh_using=refresh,
+        method='sts-assume-role'
+    )
+    return boto3.Session(botocore_session=botocore_session)
+
+def create_s3_client(session, max_concurrency=DEFAULT_MAX_CONCURRENCY):
     """
-    Create S3 client with given credentials
+    Create S3 client from the given session, with a connection pool sized for the transfer concurrency
     """
-    return boto3.client(
+    return session.client(
         's3',
-        aws_access_key_id=credentials['AccessKeyId'],
-        aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
+        config=Config(max_pool_connections=max_concurrency, retries={'mode': 'standard', 'max_attempts': 10})
+    )
+
+def effective_part_size(size, part_size):
+    """
+    Part size within S3's multipart limits: at least 5 MiB and no more than 10,000 parts
+    """
+    return max(part_size, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+
+def plan_parts(size, part_size):
+    """
+    Split an object of size bytes into (part_number, offset, length) ranges
+    """
+    return [
+        (number, offset, min(part_size, size - offset))
+        for number, offset in enumerate(range(0, size, part_size), 1)
+    ] or [(1, 0, 0)]
+
+class PartManifest:
+    """
+    Completed parts of one transfer, kept in a JSON file next to the local file so that a
+    failed transfer resumes with the missing parts only
+    """
+    def __init__(self, path, identity):
+        self.path = path
+        self.identity = identity
+        self.parts = {}
+        self.upload_id = None
+        self.lock = threading.Lock()
+    
+    def load(self):
+        """
+        Load the manifest; returns False when there is none or it belongs to another transfer
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('identity') != self.identity:
+            return False
+        self.parts = {int(number): value for number, value in data['parts'].items()}
+        self.upload_id = data.get('upload_id')
+        return True
+    
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'identity': self.identity, 'upload_id': self.upload_id, 'parts': self.parts}, f)
+        os.replace(temp_path, self.path)
+    
+    def mark(self, part_number, value=True):
+        with self.lock:
+            self.parts[part_number] = value
+            self.save()
+    
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class FileSlice:
+    """
+    Seekable read-only view of one part of a file, so upload_part streams from disk instead
+    of holding the part in memory (botocore seeks back to the start when it retries).
+    callback receives the bytes read, and a negative amount when botocore rewinds.
+    """
+    def __init__(self, f, offset, length, callback=None):
+        self.f = f
+        self.offset = offset
+        self.length = length
+        self.position = 0
+        self.callback = callback
+    
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self.f.seek(self.offset + self.position)
+        data = self.f.read(size)
+        self.position += len(data)
+        if self.callback:
+            self.callback(len(data))
+        return data
+    
+    def seek(self, position, whence=0):
+        if whence == 1:
+            position += self.position
+        elif whence == 2:
+            position += self.length
+        position = min(max(position, 0), self.length)
+        if self.callback and position < self.position:
+            self.callback(position - self.position)
+        self.position = position
+        return self.position
+    
+    def tell(self):
+        return self.position
+    
+    def __len__(self):
+        return self.length
+
+def run_parts(worker, parts, max_concurrency):
+    """
+    Run worker on every part with a bounded thread pool; a failed part is retried on
+    broken connections, and the first part that still fails cancels the parts not yet started
+    """
+    def attempt(part):
+        for attempt_number in range(1, PART_ATTEMPTS + 1):
+            try:
+                return worker(part)
+            except PART_RETRY_ERRORS as e:
+                if attempt_number == PART_ATTEMPTS:
+                    raise
+                logger.warning(f"Part {part[0]} failed ({e}), retrying ({attempt_number}/{PART_ATTEMPTS})")
+    
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [executor.submit(attempt, part) for part in parts]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+def transfer_stats(phase, size, parts, resumed_parts, part_size, max_concurrency, started):
+    """
+    Throughput summary for one transfer phase, also written to the log
+    """
+    seconds = max(time.time() - started, 1e-6)
+    transferred = sum(length for number, offset, length in parts)
+    stats = {
+        'phase': phase,
+        'bytes': size,
+        'bytes_transferred': transferred,
+        'seconds': round(seconds, 2),
+        'mb_per_s': round(transferred / seconds / (1024 * 1024), 2),
+        'parts': len(parts) + resumed_parts,
+        'resumed_parts': resumed_parts,
+        'part_size': part_size,
+        'max_concurrency': max_concurrency
+    }
+    logger.info(f"{phase.capitalize()} throughput: {transferred / (1024 * 1024):.1f} MB in {seconds:.1f}s "
+                f"({stats['mb_per_s']} MB/s, {len(parts)} part(s), {resumed_parts} resumed)")
+    return stats
+
+def format_duration(seconds):
+    """
+    h:mm:ss (or m:ss) for progress lines
+    """
+    if seconds is None:
+        return 'unknown'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+class TransferProgress:
+    """
+    Progress callback with the signature of boto3's transfer Callback: called from any thread with
+    the number of bytes moved since the previous call (negative when a retried part starts over).
+    Logs the progress, the rate since the transfer started and the ETA every PROGRESS_INTERVAL_SECONDS.
+    """
+    def __init__(self, label, total, done=0, interval=PROGRESS_INTERVAL_SECONDS):
+        self.label = label
+        self.total = total
+        self.done = done
+        self.initial = done
+        self.interval = interval
+        self.started = time.time()
+        self.last_logged = self.started
+        self.lock = threading.Lock()
+    
+    def __call__(self, bytes_amount):
+        with self.lock:
+            self.done += bytes_amount
+            now = time.time()
+            if now - self.last_logged < self.interval or self.done >= self.total:
+                return
+            self.last_logged = now
+            done = self.done
+        rate = (done - self.initial) / (now - self.started)
+        eta = (self.total - done) / rate if rate > 0 else None
+        logger.info(f"{self.label}: {done / (1024 * 1024):.1f}/{self.total / (1024 * 1024):.1f} MB "
+                    f"({done * 100 / self.total:.0f}%), {rate / (1024 * 1024):.1f} MB/s, ETA {format_duration(eta)}")
+
+def parallel_download(s3_client, bucket_name, object_key, local_path,
+                      part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                      part_checksums=None):
+    """
+    Download an object with concurrent ranged GETs, each written at its offset into a
+    preallocated file. Completed parts are recorded in <local_path>.download.json, so a rerun
+    after a failure only fetches what is missing. The SHA-256 of every part is computed as its
+    bytes arrive and stored in part_checksums (part number -> base64) when a dict is given.
+    Returns the transfer statistics.
+    """
+    head = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+    size = head['ContentLength']
+    etag = head['ETag']
+    part_size = effective_part_size(size, part_size)
+    parts = plan_parts(size, part_size)
+    
+    manifest = PartManifest(f"{local_path}.download.json", {
+        'bucket': bucket_name, 'key': object_key, 'etag': etag, 'size': size, 'part_size': part_size
+    })
+    resumed = manifest.load() and os.path.exists(local_path) and os.path.getsize(local_path) == size
+    if resumed:
+        logger.info(f"Resuming download: {len(manifest.parts)}/{len(parts)} parts already complete")
+    else:
+        if os.path.exists(local_path):
+            logger.warning(f"File already exists at {local_path}, it will be overwritten")
+        # Preallocate so every part can be written at its own offset
+        with open(local_path, 'wb') as f:
+            f.truncate(size)
+        manifest.parts = {}
+        manifest.save()
+    
+    pending = [part for part in parts if part[0] not in manifest.parts]
+    if part_checksums is not None:
+        part_checksums.update(
+            (number, checksum) for number, checksum in manifest.parts.items() if isinstance(checksum, str)
+        )
+    
+    progress = TransferProgress(f"Download {object_key}", size, size - sum(length for _, _, length in pending))
+    
+    def fetch(part):
+        part_number, offset, length = part
+        digest = hashlib.sha256()
+        if length:
+            # IfMatch fails the part if the object is replaced while it is being downloaded
+            response = s3_client.get_object(
+                Bucket=bucket_name, Key=object_key, Range=f"bytes={offset}-{offset + length - 1}", IfMatch=etag
+            )
+            written = 0
+            try:
+                with open(local_path, 'r+b') as f:
+                    f.seek(offset)
+                    for chunk in response['Body'].iter_chunks(STREAM_CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        written += len(chunk)
+                        progress(len(chunk))
+            except BaseException:
+                # The part starts over when it is retried
+                progress(-written)
+                raise
+        checksum = base64.b64encode(digest.digest()).decode()
+        if part_checksums is not None:
+            part_checksums[part_number] = checksum
+        manifest.mark(part_number, checksum)
+    
+    started = time.time()
+    run_parts(fetch, pending, max_concurrency)
+    return transfer_stats('download', size, pending, len(parts) - len(pending), part_size, max_concurrency, started)
+
+def parallel_upload(s3_client, local_path, bucket_name, object_key,
+                    part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                    metadata=None, part_checksums=None):
+    """
+    Upload a file as a multipart upload with concurrent part uploads. The upload id and part
+    ETags are recorded in <local_path>.upload-<id>.json; after a failure the multipart upload is kept
+    and a rerun uploads only the parts S3 does not have yet. Parts are sent with the SHA-256
+    from part_checksums (computed during the download), so S3 rejects a part whose bytes changed
+    on disk; checksums of parts without one are added to part_checksums. Returns the transfer statistics.
+    """
+    size = os.path.getsize(local_path)
+    part_size = effective_part_size(size, part_size)
+    parts = plan_parts(size, part_size)
+    
+    # One manifest per destination, so the same file can be uploaded to several buckets at once
+    destination_id = hashlib.sha1(f"{bucket_name}/{object_key}".encode()).hexdigest()[:12]
+    manifest = PartManifest(f"{local_path}.upload-{destination_id}.json", {
+        'bucket': bucket_name, 'key': object_key, 'size': size,
+        'mtime': os.path.getmtime(local_path), 'part_size': part_size, 'checksum_algorithm': CHECKSUM_ALGORITHM
+    })
+    if manifest.load() and manifest.upload_id:
+        # S3 is the source of truth for which parts arrived
+        try:
+            uploaded = {}
+            paginator = s3_client.get_paginator('list_parts')
+            for page in paginator.paginate(Bucket=bucket_name, Key=object_key, UploadId=manifest.upload_id):
+                for part in page.get('Parts', []):
+                    uploaded[part['PartNumber']] = {'ETag': part['ETag'], 'ChecksumSHA256': part.get('ChecksumSHA256')}
+            manifest.parts = uploaded
+            logger.info(f"Resuming upload {manifest.upload_id}: {len(uploaded)}/{len(parts)} parts already uploaded")
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchUpload':
+                raise
+            logger.warning(f"Multipart upload {manifest.upload_id} no longer exists, starting over")
+            manifest.upload_id = None
+    if not manifest.upload_id:
+        manifest.upload_id = s3_client.create_multipart_upload(
+            Bucket=bucket_name, Key=object_key, ChecksumAlgorithm=CHECKSUM_ALGORITHM, Metadata=metadata or {}
+        )['UploadId']
+        manifest.parts = {}
+        manifest.save()
+    
+    pending = [part for part in parts if part[0] not in manifest.parts]
+    
+    part_checksums = {} if part_checksums is None else part_checksums
+    progress = TransferProgress(f"Upload to s3://{bucket_name}/{object_key}", size,
+                                size - sum(length for _, _, length in pending))
+    
+    def send(part):
+        part_number, offset, length = part
+        with open(local_path, 'rb') as f:
+            body = FileSlice(f, offset, length, progress)
+            request = {
+                'Bucket': bucket_name, 'Key': object_key, 'UploadId': manifest.upload_id, 'PartNumber': part_number,
+                'Body': body, 'ContentLength': length, 'ChecksumAlgorithm': CHECKSUM_ALGORITHM
+            }
+            if part_number in part_checksums:
+                request['ChecksumSHA256'] = part_checksums[part_number]
+            try:
+                response = s3_client.upload_part(**request)
+            except BaseException:
+                body.seek(0)
+                raise
+        manifest.mark(part_number, {'ETag': response['ETag'], 'ChecksumSHA256': response.get('ChecksumSHA256')})
+    
+    started = time.time()
+    run_parts(send, pending, max_concurrency)
+    s3_client.complete_multipart_upload(
+        Bucket=bucket_name, Key=object_key, UploadId=manifest.upload_id,
+        MultipartUpload={'Parts': [
+            {'PartNumber': number, **manifest.parts[number]} for number in sorted(manifest.parts)
+        ]}
     )
+    for number, uploaded in manifest.parts.items():
+        part_checksums.setdefault(number, uploaded['ChecksumSHA256'])
+    manifest.remove()
+    return transfer_stats('upload', size, pending, len(parts) - len(pending), part_size, max_concurrency, started)
+
+def latest_in_listing(s3_client, bucket_name, prefix, start_after=None):
+    """
+    Return the listing entry of the last modified object under the prefix (only keys after
+    start_after when given), or None when there are none
+    """
+    # List objects in the prefix with pagination
+    logger.info(f"Listing objects in s3://{bucket_name}/{prefix}" + (f" after {start_after}" if start_after else ""))
+    paginator = s3_client.get_paginator('list_objects_v2')
+    request = {'Bucket': bucket_name, 'Prefix': prefix}
+    if start_after:
+        request['StartAfter'] = start_after
+    page_iterator = paginator.paginate(**request)
+    
+    latest_object = None
+    object_count = 0
+    
+    for page_num, page in enumerate(page_iterator, 1):
+        if 'Contents' in page:
+            object_count += len(page['Contents'])
+            for obj in page['Contents']:
+                if latest_object is None or obj['LastModified'] > latest_object['LastModified']:
+                    latest_object = obj
+            logger.info(f"Processed page {page_num}, found {len(page['Contents'])} objects")
+    
+    if latest_object is not None:
+        logger.info(f"Found {object_count} objects. Latest object: {latest_object['Key']}")
+    return latest_object
+
+class BackupIndex:
+    """
+    Newest known object per bucket and prefix, persisted as JSON between runs
+    """
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+    
+    def get(self, bucket_name, prefix):
+        return self.entries.get(f"{bucket_name}/{prefix}")
+    
+    def record(self, bucket_name, prefix, obj):
+        self.entries[f"{bucket_name}/{prefix}"] = {
+            'key': obj['Key'],
+            'etag': obj['ETag'],
+            'last_modified': obj['LastModified'].isoformat(),
+            'size': obj['Size']
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(temp_path, self.path)
 
-def download_last_modified_object(role_arn, bucket_name, prefix, local_dir):
+def latest_in_partitions(s3_client, bucket_name, prefix, partition_format, lookback_days):
     """
-    Find and download the last modified object from S3 prefix
+    Look for the newest object in date partitions (prefix + strftime(partition_format)),
+    from today (UTC) back lookback_days; returns None when they are all empty
+    """
+    today = datetime.now(timezone.utc).date()
+    for days_back in range(lookback_days + 1):
+        partition_prefix = prefix + (today - timedelta(days=days_back)).strftime(partition_format)
+        latest_object = latest_in_listing(s3_client, bucket_name, partition_prefix)
+        if latest_object is not None:
+            return latest_object
+    logger.info(f"No objects in the date partitions of the last {lookback_days} day(s)")
+    return None
+
+def latest_after_indexed(s3_client, bucket_name, prefix, index):
+    """
+    Newest object according to the local index: the indexed object (re-read in case it was
+    overwritten) and the keys sorting after it. Relies on backup names sorting chronologically,
+    as timestamped backup file names do. Returns None without an index entry.
+    """
+    entry = index.get(bucket_name, prefix)
+    if entry is None:
+        return None
+    
+    candidates = []
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=entry['key'])
+        candidates.append({
+            'Key': entry['key'], 'LastModified': head['LastModified'], 'ETag': head['ETag'],
+            'Size': head['ContentLength']
+        })
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+        logger.info(f"Indexed object {entry['key']} no longer exists")
+    newer_object = latest_in_listing(s3_client, bucket_name, prefix, start_after=entry['key'])
+    if newer_object is not None:
+        candidates.append(newer_object)
+    return max(candidates, key=lambda obj: obj['LastModified']) if candidates else None
+
+def find_last_modified_object(s3_client, bucket_name, prefix, partition_format=None,
+                              lookback_days=DEFAULT_LOOKBACK_DAYS, index_path=None, full_listing=False):
+    """
+    Return the listing entry of the last modified object under the prefix. Recent date
+    partitions are tried first, then the keys after the one recorded in the local index;
+    listing the whole prefix is the last resort. The index is updated with the result.
+    """
+    index = BackupIndex(index_path) if index_path else None
+    latest_object = None
+    if not full_listing:
+        if partition_format:
+            latest_object = latest_in_partitions(s3_client, bucket_name, prefix, partition_format, lookback_days)
+        if latest_object is None and index is not None:
+            latest_object = latest_after_indexed(s3_client, bucket_name, prefix, index)
+    if latest_object is None:
+        latest_object = latest_in_listing(s3_client, bucket_name, prefix)
+    
+    if latest_object is None:
+        raise Exception(f"No objects found in prefix: s3://{bucket_name}/{prefix}")
+    
+    logger.info(f"Latest object: {latest_object['Key']}")
+    logger.info(f"Last modified: {latest_object['LastModified']}, Size: {latest_object['Size']} bytes")
+    if index is not None:
+        index.record(bucket_name, prefix, latest_object)
+    return latest_object
+
+def download_last_modified_object(role_arn, bucket_name, prefix, local_dir,
+                                  part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024,
+                                  max_concurrency=DEFAULT_MAX_CONCURRENCY, discovery=None, s3_client=None,
+                                  latest_object=None, part_checksums=None):
+    """
+    Find and download the last modified object from S3 prefix; returns the local path,
+    the object name and the download statistics. discovery holds the keyword arguments
+    of find_last_modified_object; a client and an already discovered object can be passed in.
     """
-    s3_client = None
     try:
         logger.info(f"Starting process to download last modified object from s3://{bucket_name}/{prefix}")
         
@@ -66,48 +588,26 @@ def download_last_modified_object(role_arn, bucket_name, prefix, local_dir):
             raise OSError(f"Failed to create or access directory: {local_dir}")
         
         # Assume the IAM role and create S3 client
-        credentials = assume_role(role_arn, "S3DownloadSession")
-        s3_client = create_s3_client(credentials)
-        
-        # List objects in the prefix with pagination
-        logger.info(f"Listing objects in s3://{bucket_name}/{prefix}")
-        paginator = s3_client.get_paginator('list_objects_v2')
-        page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-        
-        latest_object = None
-        object_count = 0
-        
-        for page_num, page in enumerate(page_iterator, 1):
-            if 'Contents' in page:
-                object_count += len(page['Contents'])
-                for obj in page['Contents']:
-                    if latest_object is None or obj['LastModified'] > latest_object['LastModified']:
-                        latest_object = obj
-                logger.info(f"Processed page {page_num}, found {len(page['Contents'])} objects")
+        if s3_client is None:
+            s3_client = create_s3_client(role_session(role_arn, "S3DownloadSession"), max_concurrency)
         
         if latest_object is None:
-            raise Exception(f"No objects found in prefix: s3://{bucket_name}/{prefix}")
-        
-        logger.info(f"Found {object_count} total objects. Latest object: {latest_object['Key']}")
-        logger.info(f"Last modified: {latest_object['LastModified']}, Size: {latest_object['Size']} bytes")
+            latest_object = find_last_modified_object(s3_client, bucket_name, prefix, **(discovery or {}))
         
         object_key = latest_object['Key']
         object_name = os.path.basename(object_key)
         local_path = os.path.join(local_dir, object_name)
         
-        # Check if file already exists
-        if os.path.exists(local_path):
-            logger.warning(f"File already exists at {local_path}, it will be overwritten")
-        
         # Download the object
         logger.info(f"Downloading {object_key} to {local_path}...")
-        s3_client.download_file(bucket_name, object_key, local_path)
+        stats = parallel_download(s3_client, bucket_name, object_key, local_path, part_size, max_concurrency,
+                                  part_checksums)
         
         # Verify download
         if os.path.exists(local_path):
             file_size = os.path.getsize(local_path)
             logger.info(f"Successfully downloaded: {local_path} (Size: {file_size} bytes)")
-            return local_path, object_name
+            return local_path, object_name, stats
         else:
             raise Exception(f"Download failed: File not found at {local_path}")
             
@@ -115,25 +615,26 @@ def download_last_modified_object(role_arn, bucket_name, prefix, local_dir):
         logger.error(f"Download error: {str(e)}")
         raise
 
-def upload_to_destination_s3(role_arn, bucket_name, prefix, local_file_path):
+def upload_to_destination_s3(role_arn, bucket_name, prefix, local_file_path,
+                             part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                             s3_client=None, metadata=None, part_checksums=None):
     """
-    Upload a file to destination S3 bucket
+    Upload a file to destination S3 bucket; returns the destination key and the upload statistics
     """
-    s3_client = None
     try:
-        credentials = assume_role(role_arn, "S3UploadSession")
-        s3_client = create_s3_client(credentials)
+        if s3_client is None:
+            s3_client = create_s3_client(role_session(role_arn, "S3UploadSession"), max_concurrency)
         
         # Extract filename and construct destination key
-        filename = os.path.basename(local_file_path)
-        destination_key = f"{prefix.rstrip('/')}/{filename}" if prefix else filename
+        destination_key = destination_key_for(prefix, os.path.basename(local_file_path))
         
         # Upload the file
         logger.info(f"Uploading {local_file_path} to s3://{bucket_name}/{destination_key}")
-        s3_client.upload_file(local_file_path, bucket_name, destination_key)
+        stats = parallel_upload(s3_client, local_file_path, bucket_name, destination_key, part_size, max_concurrency,
+                                metadata, part_checksums)
         
         logger.info(f"Successfully uploaded to s3://{bucket_name}/{destination_key}")
-        return destination_key
+        return destination_key, stats
             
     except ClientError as e:
         error_code = e.response['Error']['Code']
@@ -141,45 +642,612 @@ def upload_to_destination_s3(role_arn, bucket_name, prefix, local_file_path):
         logger.error(f"AWS API error during upload ({error_code}): {error_msg}")
         raise Exception(f"Upload failed: {error_code} - {error_msg}")
 
-def copy_s3_object_across_accounts(source_role_arn, source_bucket, source_prefix,
-                                  dest_role_arn, dest_bucket, dest_prefix,
-                                  local_dir, cleanup=True):
+def resolve_compression(compression):
     """
-    Complete workflow: download from source, upload to destination, and remote download
+    Compression algorithm to use for 'none', 'auto', 'zstd' or 'gzip': zstd when the zstandard
+    package is installed, gzip otherwise. Returns None for no compression.
+    """
+    if compression in (None, 'none'):
+        return None
+    if compression in ('auto', 'zstd') and zstandard is None:
+        if compression == 'zstd':
+            logger.warning("zstandard is not installed (pip install zstandard); compressing with gzip instead")
+        return 'gzip'
+    return 'zstd' if compression == 'auto' else compression
+
+class HashingReader:
+    """
+    File wrapper that feeds everything read through it into a SHA-256 digest
     """
     
-    local_file_path = None
+    def __init__(self, fileobj, callback=None):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.callback = callback
+    
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        if self.callback:
+            self.callback(len(data))
+        return data
+
+def parallel_gzip(reader, out, level, threads):
+    """
+    Write reader to out as a single gzip member, deflating blocks on threads (zlib releases the GIL).
+    Every block is flushed to a byte boundary so the compressed blocks concatenate into one deflate
+    stream, which any gzip reader (including .NET's GZipStream) decompresses.
+    """
+    def deflate(block, window, last):
+        options = {'zdict': window} if window else {}
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, **options)
+        return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    
+    out.write(b'\x1f\x8b\x08\x00' + struct.pack('<I', int(time.time())) + b'\x00\xff')
+    crc = 0
+    size = 0
+    window = b''
+    block = reader.read(GZIP_BLOCK_SIZE)
+    # At most 2 blocks per thread are held in memory
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            next_block = reader.read(GZIP_BLOCK_SIZE)
+            last = not next_block
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            pending.append(executor.submit(deflate, block, window, last))
+            window = block[-GZIP_WINDOW:]
+            while pending and (last or len(pending) > 2 * threads):
+                out.write(pending.popleft().result())
+            if last:
+                break
+            block = next_block
+    out.write(struct.pack('<II', crc & 0xffffffff, size & 0xffffffff))
+
+def compress_file(local_path, compression, level=None, threads=DEFAULT_MAX_CONCURRENCY):
+    """
+    Compress a downloaded backup next to itself (<file>.zst or <file>.gz) on several threads.
+    The output is written under a temporary name and recorded in <compressed file>.json when
+    complete, so a resumed run reuses it instead of compressing the same backup again.
+    Returns the compressed path, the metadata describing the original (compression,
+    original-size, original-sha256) and the compression statistics.
+    """
+    level = DEFAULT_COMPRESSION_LEVELS[compression] if level is None else level
+    compressed_path = local_path + COMPRESSION_SUFFIXES[compression]
+    original_size = os.path.getsize(local_path)
+    started = time.time()
+    
+    identity = {'source': local_path, 'size': original_size, 'mtime': os.path.getmtime(local_path),
+                'compression': compression, 'level': level}
+    try:
+        with open(f"{compressed_path}.json") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        record = {}
+    original_sha256 = record.get('original-sha256') if record.get('identity') == identity else None
+    if original_sha256 and os.path.exists(compressed_path):
+        logger.info(f"Reusing {compressed_path} compressed by an earlier run")
+    else:
+        logger.info(f"Compressing {local_path} with {compression} (level {level}, {threads} threads)")
+        temporary_path = compressed_path + '.tmp'
+        with open(local_path, 'rb') as source, open(temporary_path, 'wb') as out:
+            reader = HashingReader(source, TransferProgress(f"Compress {local_path}", original_size))
+            if compression == 'zstd':
+                compressor = zstandard.ZstdCompressor(level=level, threads=threads, write_checksum=True)
+                compressor.copy_stream(reader, out, size=original_size, read_size=STREAM_CHUNK_SIZE)
+            else:
+                parallel_gzip(reader, out, level, threads)
+        os.replace(temporary_path, compressed_path)
+        original_sha256 = reader.digest.hexdigest()
+        with open(f"{compressed_path}.json", 'w') as f:
+            json.dump({'identity': identity, 'original-sha256': original_sha256}, f)
+    
+    compressed_size = os.path.getsize(compressed_path)
+    seconds = time.time() - started
+    stats = {
+        'phase': 'compress',
+        'algorithm': compression,
+        'level': level,
+        'bytes': original_size,
+        'compressed_bytes': compressed_size,
+        'ratio': round(original_size / compressed_size, 2) if compressed_size else 0.0,
+        'seconds': round(seconds, 2),
+        'mb_per_s': round(original_size / (1024 * 1024) / seconds, 2) if seconds else 0.0,
+        'threads': threads
+    }
+    logger.info(f"Compressed {original_size / (1024 * 1024):.1f} MB to {compressed_size / (1024 * 1024):.1f} MB "
+                f"({stats['ratio']}x) in {stats['seconds']}s")
+    metadata = {'compression': compression, 'original-size': str(original_size), 'original-sha256': original_sha256}
+    return compressed_path, metadata, stats
+
+def destination_key_for(prefix, filename):
+    """
+    Destination key of a file under the destination prefix
+    """
+    return f"{prefix.rstrip('/')}/{filename}" if prefix else filename
+
+def run_multipart_upload(s3_client, bucket_name, object_key, parts, upload_part, max_concurrency, metadata=None,
+                         progress=None):
+    """
+    Create a multipart upload, run upload_part(upload_id, part) -> (ETag, SHA-256) for every
+    part concurrently and complete it; the upload is aborted if any part fails.
+    progress, when given, is called with the length of every completed part.
+    Returns the part checksums.
+    """
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket_name, Key=object_key, ChecksumAlgorithm=CHECKSUM_ALGORITHM, Metadata=metadata or {}
+    )['UploadId']
+    uploaded = {}
+    
+    def send(part):
+        uploaded[part[0]] = upload_part(upload_id, part)
+        if progress:
+            progress(part[2])
+    
     try:
-        # Step 1: Download from source bucket to local machine
-        local_file_path, filename = download_last_modified_object(
+        run_parts(send, parts, max_concurrency)
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=object_key, UploadId=upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': number, 'ETag': etag, 'ChecksumSHA256': checksum}
+                for number, (etag, checksum) in sorted(uploaded.items())
+            ]}
+        )
+        return {number: checksum for number, (etag, checksum) in uploaded.items()}
+    except BaseException:
+        logger.info(f"Aborting multipart upload {upload_id}")
+        try:
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_key, UploadId=upload_id)
+        except ClientError as e:
+            logger.warning(f"Could not abort multipart upload {upload_id}: {e}")
+        raise
+
+def server_side_copy(dest_client, source_bucket, source_object, dest_bucket, destination_key,
+                     part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                     metadata=None):
+    """
+    Copy an object inside S3 with UploadPartCopy, called with the destination credentials.
+    No bytes pass through this machine; the destination role needs s3:GetObject on the
+    source object (granted by the source bucket policy). S3 computes the part checksums.
+    Returns the transfer statistics and the part checksums.
+    """
+    size = source_object['Size']
+    part_size = effective_part_size(size, part_size)
+    parts = plan_parts(size, part_size)
+    
+    def copy_part(upload_id, part):
+        part_number, offset, length = part
+        request = {
+            'Bucket': dest_bucket, 'Key': destination_key, 'UploadId': upload_id, 'PartNumber': part_number,
+            'CopySource': {'Bucket': source_bucket, 'Key': source_object['Key']},
+            'CopySourceIfMatch': source_object['ETag']
+        }
+        if length:
+            request['CopySourceRange'] = f"bytes={offset}-{offset + length - 1}"
+        result = dest_client.upload_part_copy(**request)['CopyPartResult']
+        return result['ETag'], result.get('ChecksumSHA256')
+    
+    logger.info(f"Server-side copy of s3://{source_bucket}/{source_object['Key']} "
+                f"to s3://{dest_bucket}/{destination_key} in {len(parts)} part(s)")
+    started = time.time()
+    progress = TransferProgress(f"Copy to s3://{dest_bucket}/{destination_key}", size)
+    part_checksums = run_multipart_upload(dest_client, dest_bucket, destination_key, parts, copy_part,
+                                          max_concurrency, metadata, progress)
+    return transfer_stats('copy', size, parts, 0, part_size, max_concurrency, started), part_checksums
+
+def stream_copy(source_client, source_bucket, source_object, targets,
+                part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                metadata=None):
+    """
+    Pipe an object to one or more destinations without a temporary file: every worker fetches
+    one part with a ranged GET (source credentials) and uploads it as a multipart part to each
+    destination (destination credentials), so the source is read once and downloads and uploads
+    overlap. At most max_concurrency parts are held in memory at a time. Each part is sent with
+    the SHA-256 of the bytes as read from the source.
+    targets is a list of (client, bucket, key); a destination that fails, with any error, is aborted
+    and the others continue; only a failed source read aborts them all. Returns, per target, the transfer statistics and part checksums, or the exception
+    that failed it.
+    """
+    size = source_object['Size']
+    part_size = effective_part_size(size, part_size)
+    parts = plan_parts(size, part_size)
+    
+    uploads = []
+    for client, bucket_name, object_key in targets:
+        upload = {'client': client, 'bucket': bucket_name, 'key': object_key, 'upload_id': None, 'etags': {},
+                  'error': None}
+        try:
+            upload['upload_id'] = client.create_multipart_upload(
+                Bucket=bucket_name, Key=object_key, ChecksumAlgorithm=CHECKSUM_ALGORITHM, Metadata=metadata or {}
+            )['UploadId']
+        except Exception as e:
+            upload['error'] = e
+        uploads.append(upload)
+    part_checksums = {}
+    progress = TransferProgress(f"Stream s3://{source_bucket}/{source_object['Key']}", size)
+    
+    def pipe_part(part):
+        part_number, offset, length = part
+        live = [upload for upload in uploads if upload['error'] is None]
+        if not live:
+            return
+        data = b''
+        if length:
+            response = source_client.get_object(
+                Bucket=source_bucket, Key=source_object['Key'],
+                Range=f"bytes={offset}-{offset + length - 1}", IfMatch=source_object['ETag']
+            )
+            data = response['Body'].read()
+        checksum = base64.b64encode(hashlib.sha256(data).digest()).decode()
+        part_checksums[part_number] = checksum
+        for upload in live:
+            try:
+                upload['etags'][part_number] = upload['client'].upload_part(
+                    Bucket=upload['bucket'], Key=upload['key'], UploadId=upload['upload_id'],
+                    PartNumber=part_number, Body=data, ChecksumAlgorithm=CHECKSUM_ALGORITHM, ChecksumSHA256=checksum
+                )['ETag']
+            except Exception as e:
+                # Any error, after botocore's retries, fails this destination only
+                if upload['error'] is None:
+                    logger.error(f"Streaming to s3://{upload['bucket']}/{upload['key']} failed: {e}")
+                    upload['error'] = e
+        progress(length)
+    
+    def abort(upload):
+        if upload['upload_id']:
+            try:
+                upload['client'].abort_multipart_upload(
+                    Bucket=upload['bucket'], Key=upload['key'], UploadId=upload['upload_id']
+                )
+            except Exception as e:
+                logger.warning(f"Could not abort multipart upload {upload['upload_id']}: {e}")
+    
+    logger.info(f"Streaming s3://{source_bucket}/{source_object['Key']} to {len(targets)} destination(s) "
+                f"in {len(parts)} part(s), up to {max_concurrency * part_size / (1024 * 1024):.0f} MB buffered")
+    started = time.time()
+    try:
+        run_parts(pipe_part, parts, max_concurrency)
+    except BaseException:
+        # Only the source read raises out of a part: no destination can be completed
+        for upload in uploads:
+            abort(upload)
+        raise
+    
+    outcomes = []
+    for upload in uploads:
+        if upload['error'] is None:
+            try:
+                upload['client'].complete_multipart_upload(
+                    Bucket=upload['bucket'], Key=upload['key'], UploadId=upload['upload_id'],
+                    MultipartUpload={'Parts': [
+                        {'PartNumber': number, 'ETag': upload['etags'][number],
+                         'ChecksumSHA256': part_checksums[number]}
+                        for number in sorted(upload['etags'])
+                    ]}
+                )
+            except Exception as e:
+                upload['error'] = e
+        if upload['error'] is not None:
+            abort(upload)
+            outcomes.append(upload['error'])
+        else:
+            outcomes.append((transfer_stats('stream', size, parts, 0, part_size, max_concurrency, started),
+                             dict(part_checksums)))
+    return outcomes
+
+def source_metadata(source_object):
+    """
+    Metadata recorded on the destination object: identifies the source backup it was copied from
+    """
+    return {
+        'source-etag': source_object['ETag'].strip('"'),
+        'source-size': str(source_object['Size']),
+        'source-last-modified': source_object['LastModified'].isoformat()
+    }
+
+def destination_is_current(dest_client, dest_bucket, destination_key, source_object):
+    """
+    True when the destination already holds a copy of this exact source object (same size and
+    the source ETag recorded at copy time, or the same ETag for plain copies); the destination key
+    of a compressed copy carries the compression suffix
+    """
+    try:
+        head = dest_client.head_object(Bucket=dest_bucket, Key=destination_key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return False
+        raise
+    # Compressed copies record the size of the original
+    if int(head.get('Metadata', {}).get('original-size', head['ContentLength'])) != source_object['Size']:
+        return False
+    source_etag = source_object['ETag'].strip('"')
+    return head.get('Metadata', {}).get('source-etag') == source_etag or head['ETag'].strip('"') == source_etag
+
+def composite_checksum(part_checksums):
+    """
+    S3's checksum of a multipart object: the SHA-256 of the concatenated part digests, suffixed with the part count
+    """
+    digests = b''.join(base64.b64decode(part_checksums[number]) for number in sorted(part_checksums))
+    return f"{base64.b64encode(hashlib.sha256(digests).digest()).decode()}-{len(part_checksums)}"
+
+def verify_destination(dest_client, dest_bucket, destination_key, size, part_checksums):
+    """
+    Compare the stored object with the size and part checksums computed during the transfer
+    """
+    head = dest_client.head_object(Bucket=dest_bucket, Key=destination_key, ChecksumMode='ENABLED')
+    missing = [number for number, checksum in part_checksums.items() if not checksum]
+    expected = composite_checksum(part_checksums) if part_checksums and not missing else None
+    integrity = {
+        'algorithm': CHECKSUM_ALGORITHM,
+        'parts': len(part_checksums),
+        'expected_checksum': expected,
+        'destination_checksum': head.get('ChecksumSHA256'),
+        'size': size,
+        'destination_size': head['ContentLength']
+    }
+    integrity['verified'] = (
+        integrity['destination_size'] == size and expected is not None and integrity['destination_checksum'] == expected
+    )
+    if integrity['verified']:
+        logger.info(f"Integrity verified: {size} bytes, {CHECKSUM_ALGORITHM} {expected}")
+    else:
+        logger.error(f"Integrity check failed for s3://{dest_bucket}/{destination_key}: {integrity}")
+    return integrity
+
+def copy_without_local_file(source_client, source_bucket, source_object, targets, mode,
+                            part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Copy an object straight from bucket to bucket. mode is 'server-copy', 'stream', or
+    'auto' (server-side copy, falling back to streaming for destinations that are denied).
+    targets is a list of (client, bucket, key). Returns, per target, the transfer statistics
+    and part checksums, or the exception that failed it.
+    """
+    metadata = source_metadata(source_object)
+    outcomes = [None] * len(targets)
+    streamed = list(range(len(targets))) if mode == 'stream' else []
+    if mode in ('server-copy', 'auto'):
+        def copy(target):
+            client, bucket_name, object_key = target
+            try:
+                return server_side_copy(client, source_bucket, source_object, bucket_name, object_key,
+                                        part_size, max_concurrency, metadata)
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            for index, outcome in enumerate(executor.map(copy, targets)):
+                if (mode == 'auto' and isinstance(outcome, ClientError)
+                        and outcome.response['Error']['Code'] == 'AccessDenied'):
+                    logger.warning(f"Server-side copy to s3://{targets[index][1]} denied (the destination role "
+                                   f"cannot read the source object); falling back to streaming")
+                    streamed.append(index)
+                else:
+                    outcomes[index] = outcome
+    if streamed:
+        stream_outcomes = stream_copy(source_client, source_bucket, source_object,
+                                      [targets[index] for index in streamed], part_size, max_concurrency, metadata)
+        for index, outcome in zip(streamed, stream_outcomes):
+            outcomes[index] = outcome
+    return outcomes
+
+def create_destination(role_arn, bucket_name, prefix, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Destination account: role, bucket, prefix and an S3 client under the assumed role
+    """
+    return {
+        'role_arn': role_arn,
+        'bucket': bucket_name,
+        'prefix': prefix,
+        'client': create_s3_client(role_session(role_arn, "S3UploadSession"), max_concurrency)
+    }
+
+def copy_object_to_destinations(source_client, source_role_arn, source_bucket, source_prefix, source_object,
+                                destinations, local_dir, cleanup=True,
+                                part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024,
+                                max_concurrency=DEFAULT_MAX_CONCURRENCY, mode='local', force=False,
+                                compression=None, compression_level=None):
+    """
+    Copy one source object to every destination, reading the source only once: in 'local' mode
+    the downloaded file is uploaded to all destinations concurrently, and a stream fans each
+    part out to all of them. Destinations that already hold the object are skipped.
+    With compression ('zstd' or 'gzip', 'local' mode only) the downloaded file is compressed once
+    and the compressed file is uploaded under the name with the compression suffix.
+    Returns one result per destination (in order) and the local file path, if one is kept.
+    A failed source read raises.
+    """
+    if compression and mode != 'local':
+        raise ValueError(f"Compression requires the 'local' mode, not '{mode}'")
+    filename = os.path.basename(source_object['Key'])
+    uploaded_name = filename + COMPRESSION_SUFFIXES[compression] if compression else filename
+    results = []
+    pending = []
+    for destination in destinations:
+        destination_key = destination_key_for(destination['prefix'], uploaded_name)
+        result = {
+            'source': f"s3://{source_bucket}/{source_object['Key']}",
+            'source_size': source_object['Size'],
+            'source_last_modified': source_object['LastModified'].isoformat(),
+            'destination_bucket': destination['bucket'],
+            'destination_key': destination_key,
+            'filename': filename,
+            'status': 'failed',
+            'success': False,
+            'skipped': False,
+            'transfer': {},
+            'phases': {}
+        }
+        results.append(result)
+        try:
+            if not force and destination_is_current(destination['client'], destination['bucket'],
+                                                    destination_key, source_object):
+                logger.info(f"s3://{destination['bucket']}/{destination_key} already holds this backup - skipping")
+                result.update(status='skipped', success=True, skipped=True)
+                continue
+        except Exception as e:
+            result['error'] = str(e)
+            continue
+        pending.append((destination, result))
+    if not pending:
+        return results, None
+    
+    local_file_path = None
+    compressed_path = None
+    upload_size = source_object['Size']
+    if mode == 'local':
+        # Download once, then upload to every destination from the same file
+        part_checksums = {}
+        local_file_path, _, download_stats = download_last_modified_object(
             role_arn=source_role_arn,
             bucket_name=source_bucket,
             prefix=source_prefix,
-            local_dir=local_dir
-        )
-        
-        # Step 2: Upload to destination bucket from local machine
-        destination_key = upload_to_destination_s3(
-            role_arn=dest_role_arn,
-            bucket_name=dest_bucket,
-            prefix=dest_prefix,
-            local_file_path=local_file_path
+            local_dir=local_dir,
+            part_size=part_size,
+            max_concurrency=max_concurrency,
+            s3_client=source_client,
+            latest_object=source_object,
+            part_checksums=part_checksums
         )
+        metadata = source_metadata(source_object)
+        transfer = {'download': download_stats}
+        upload_path = local_file_path
+        if compression:
+            # The upload checksums are computed from the compressed file; original-sha256 covers the backup itself
+            compressed_path, compression_metadata, transfer['compress'] = compress_file(
+                local_file_path, compression, compression_level, max_concurrency
+            )
+            metadata.update(compression_metadata)
+            upload_path = compressed_path
+            upload_size = os.path.getsize(compressed_path)
+            part_checksums = {}
         
+        def upload(item):
+            destination, result = item
+            checksums = dict(part_checksums)
+            try:
+                _, upload_stats = upload_to_destination_s3(
+                    role_arn=destination['role_arn'],
+                    bucket_name=destination['bucket'],
+                    prefix=destination['prefix'],
+                    local_file_path=upload_path,
+                    part_size=part_size,
+                    max_concurrency=max_concurrency,
+                    s3_client=destination['client'],
+                    metadata=metadata,
+                    part_checksums=checksums
+                )
+                return dict(transfer, upload=upload_stats), checksums
+            except Exception as e:
+                return e
         
-        # Step 4: Cleanup if requested
-        if cleanup and local_file_path and os.path.exists(local_file_path):
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            outcomes = list(executor.map(upload, pending))
+    else:
+        targets = [(destination['client'], destination['bucket'], result['destination_key'])
+                   for destination, result in pending]
+        outcomes = [
+            outcome if isinstance(outcome, Exception) else ({outcome[0]['phase']: outcome[0]}, outcome[1])
+            for outcome in copy_without_local_file(source_client, source_bucket, source_object, targets, mode,
+                                                   part_size, max_concurrency)
+        ]
+    
+    # End-to-end integrity check of every destination against the checksums computed while streaming
+    for (destination, result), outcome in zip(pending, outcomes):
+        if isinstance(outcome, Exception):
+            result['error'] = str(outcome)
+            continue
+        transfer, part_checksums = outcome
+        result['transfer'] = transfer
+        result['phases'] = {phase: stats['seconds'] for phase, stats in transfer.items()}
+        result['mode'] = 'server-copy' if 'copy' in transfer else 'stream' if 'stream' in transfer else 'local'
+        started = time.time()
+        try:
+            result['integrity'] = verify_destination(destination['client'], destination['bucket'],
+                                                     result['destination_key'], upload_size, part_checksums)
+        except ClientError as e:
+            result['error'] = f"Integrity check failed: {e}"
+            continue
+        finally:
+            result['phases']['verify'] = round(time.time() - started, 2)
+        if result['integrity']['verified']:
+            result.update(status='copied', success=True)
+            if compression:
+                result['compression'] = {key: value for key, value in metadata.items() if key not in
+                                         ('source-etag', 'source-size', 'source-last-modified')}
+            logger.info(f"Successfully copied to s3://{destination['bucket']}/{result['destination_key']}")
+        else:
+            result['error'] = f"Integrity check failed for s3://{destination['bucket']}/{result['destination_key']}"
+    
+    if local_file_path and all(result['success'] for destination, result in pending):
+        if cleanup and os.path.exists(local_file_path):
+            started = time.time()
             logger.info(f"Cleaning up local file: {local_file_path}")
             os.remove(local_file_path)
+            # The download manifest marks the local file as complete; it goes with the file
+            PartManifest(f"{local_file_path}.download.json", None).remove()
+            if compressed_path:
+                os.remove(compressed_path)
+                PartManifest(f"{compressed_path}.json", None).remove()
+            local_file_path = None
+            for destination, result in pending:
+                result['phases']['cleanup'] = round(time.time() - started, 2)
+    elif local_file_path:
+        logger.info(f"Local file retained for debugging and resuming: {local_file_path}")
+    return results, local_file_path
+
+def copy_s3_object_across_accounts(source_role_arn, source_bucket, source_prefix,
+                                  dest_role_arn, dest_bucket, dest_prefix,
+                                  local_dir, cleanup=True, part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024,
+                                  max_concurrency=DEFAULT_MAX_CONCURRENCY, mode='local', discovery=None,
+                                  force=False, compression=None, compression_level=None):
+    """
+    Complete workflow: download from source, upload to destination, and remote download.
+    A failed run keeps the local file and its part manifests, so rerunning it resumes the transfer.
+    Modes other than 'local' copy bucket to bucket without a temporary file. The copy is skipped
+    when the destination already holds the same backup, unless force is set. In 'local' mode the
+    backup can be compressed ('zstd' or 'gzip') before the upload.
+    """
+    
+    local_file_path = None
+    phases = {}
+    try:
+        source_client = create_s3_client(role_session(source_role_arn, "S3DownloadSession"), max_concurrency)
+        destination = create_destination(dest_role_arn, dest_bucket, dest_prefix, max_concurrency)
         
-        return {
+        # Step 1: Find the newest backup
+        started = time.time()
+        source_object = find_last_modified_object(source_client, source_bucket, source_prefix, **(discovery or {}))
+        phases['list'] = round(time.time() - started, 2)
+        
+        # Steps 2-4: Copy it (unless the destination already has it) and verify the copy
+        results, local_file_path = copy_object_to_destinations(
+            source_client, source_role_arn, source_bucket, source_prefix, source_object, [destination],
+            local_dir, cleanup, part_size, max_concurrency, mode, force, compression, compression_level
+        )
+        result = results[0]
+        phases.update(result['phases'])
+        if not result['success']:
+            raise Exception(result['error'])
+        
+        summary = {
             'success': True,
-            'source_file': local_file_path,
+            'skipped': result['skipped'],
+            'source_file': result['source'],
             'destination_bucket': dest_bucket,
-            'destination_key': destination_key,
-            'local_file_cleaned': cleanup,
-            'filename': filename
+            'destination_key': result['destination_key'],
+            'local_file_cleaned': mode == 'local' and not result['skipped'] and local_file_path is None,
+            'filename': result['filename'],
+            'transfer': result['transfer'],
+            'phases': phases
         }
+        if not result['skipped']:
+            summary['mode'] = result['mode']
+            summary['integrity'] = result['integrity']
+            if compression:
+                summary['compression'] = result['compression']
+        return summary
         
     except Exception as e:
         logger.error(f"Cross-account copy failed: {str(e)}")
@@ -192,9 +1260,178 @@ def copy_s3_object_across_accounts(source_role_arn, source_bucket, source_prefix
             'success': False,
             'error': str(e),
             'source_file': local_file_path,
-            'remote_download_success': False
+            'remote_download_success': False,
+            'phases': phases
         }
 
+def list_backups(s3_client, bucket_name, prefix, pattern=None, since=None, until=None):
+    """
+    Every object under the prefix whose file name matches the glob pattern and whose
+    LastModified falls in [since, until), oldest first (the order backups are restored in).
+    Raises ValueError when two selected objects share a file name.
+    """
+    logger.info(f"Listing backups in s3://{bucket_name}/{prefix} (pattern={pattern}, since={since}, until={until})")
+    paginator = s3_client.get_paginator('list_objects_v2')
+    objects = []
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if pattern and not fnmatch.fnmatch(os.path.basename(obj['Key']), pattern):
+                continue
+            if (since and obj['LastModified'] < since) or (until and obj['LastModified'] >= until):
+                continue
+            objects.append(obj)
+    # Local files and destination keys are named after the file name alone: two objects with the
+    # same name (e.g. under different date partitions) would overwrite each other
+    keys_by_name = {}
+    for obj in objects:
+        keys_by_name.setdefault(os.path.basename(obj['Key']), []).append(obj['Key'])
+    duplicates = {name: keys for name, keys in keys_by_name.items() if len(keys) > 1}
+    if duplicates:
+        raise ValueError(f"Selected backups share a file name and would overwrite each other: {duplicates}; "
+                         f"narrow --source-prefix, --pattern or the date range")
+    objects.sort(key=lambda obj: obj['LastModified'])
+    logger.info(f"Selected {len(objects)} backup(s)")
+    return objects
+
+def copy_backups_batch(source_role_arn, source_bucket, source_prefix, destinations, local_dir,
+                       pattern=None, since=None, until=None, cleanup=True,
+                       part_size=DEFAULT_PART_SIZE_MB * 1024 * 1024, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                       max_objects=DEFAULT_MAX_OBJECTS, mode='local', discovery=None, force=False,
+                       compression=None, compression_level=None):
+    """
+    Copy backups to several destination accounts. With a pattern or date range every matching
+    object is copied, otherwise only the newest one. Each object is read once and fanned out to
+    all destinations; up to max_objects objects are copied at a time. destinations is a list of
+    {'role_arn', 'bucket', 'prefix'}. Returns a summary with one result per object and destination.
+    """
+    source_client = create_s3_client(role_session(source_role_arn, "S3DownloadSession"), max_concurrency)
+    destinations = [
+        create_destination(destination['role_arn'], destination['bucket'], destination.get('prefix', ''),
+                           max_concurrency)
+        for destination in destinations
+    ]
+    started = time.time()
+    if pattern or since or until:
+        objects = list_backups(source_client, source_bucket, source_prefix, pattern, since, until)
+    else:
+        objects = [find_last_modified_object(source_client, source_bucket, source_prefix, **(discovery or {}))]
+    list_seconds = round(time.time() - started, 2)
+    
+    def copy(source_object):
+        try:
+            results, _ = copy_object_to_destinations(
+                source_client, source_role_arn, source_bucket, source_prefix, source_object, destinations,
+                local_dir, cleanup, part_size, max_concurrency, mode, force, compression, compression_level
+            )
+            return results
+        except Exception as e:
+            logger.error(f"Copy of s3://{source_bucket}/{source_object['Key']} failed: {e}")
+            return [{
+                'source': f"s3://{source_bucket}/{source_object['Key']}",
+                'source_size': source_object['Size'],
+                'source_last_modified': source_object['LastModified'].isoformat(),
+                'destination_bucket': destination['bucket'],
+                'destination_key': destination_key_for(
+                    destination['prefix'],
+                    os.path.basename(source_object['Key']) + (COMPRESSION_SUFFIXES[compression] if compression else '')
+                ),
+                'filename': os.path.basename(source_object['Key']),
+                'status': 'failed',
+                'success': False,
+                'skipped': False,
+                'transfer': {},
+                'phases': {},
+                'error': str(e)
+            } for destination in destinations]
+    
+    rows = []
+    if objects:
+        with ThreadPoolExecutor(max_workers=min(max_objects, len(objects))) as executor:
+            for results in executor.map(copy, objects):
+                rows.extend(results)
+    
+    return {
+        'success': bool(objects) and all(row['success'] for row in rows),
+        'error': None if objects else f"No backups selected in s3://{source_bucket}/{source_prefix}",
+        'objects': len(objects),
+        'destinations': len(destinations),
+        'copied': sum(1 for row in rows if row['status'] == 'copied'),
+        'skipped': sum(1 for row in rows if row['status'] == 'skipped'),
+        'failed': sum(1 for row in rows if row['status'] == 'failed'),
+        'phases': {'list': list_seconds},
+        'results': rows
+    }
+
+def transfer_report(result, started, finished, settings):
+    """
+    Machine-readable summary of a run for the build to archive: the settings, seconds spent per
+    phase and throughput per phase, summed over every backup and destination (a backup's download,
+    compression and cleanup count once however many destinations it went to), and every transfer
+    """
+    rows = result.get('results', [result] if 'transfer' in result else [])
+    phases = {'list': result.get('phases', {}).get('list', 0.0)}
+    throughput = {}
+    counted = set()
+    transfers = []
+    for row in rows:
+        source = row.get('source', row.get('source_file'))
+        destination = f"s3://{row['destination_bucket']}/{row['destination_key']}"
+        for phase, seconds in row.get('phases', {}).items():
+            if phase == 'list':
+                continue
+            key = (source, phase) if phase in ('download', 'compress', 'cleanup') else (source, destination, phase)
+            if key in counted:
+                continue
+            counted.add(key)
+            phases[phase] = phases.get(phase, 0.0) + seconds
+            stats = row['transfer'].get(phase)
+            if stats:
+                totals = throughput.setdefault(phase, {'bytes': 0, 'seconds': 0.0})
+                totals['bytes'] += stats.get('bytes_transferred', stats.get('bytes', 0))
+                totals['seconds'] += stats['seconds']
+        transfers.append({
+            'source': source,
+            'destination': destination,
+            'status': row.get('status') or ('skipped' if row.get('skipped') else 'copied'),
+            'phases': {phase: seconds for phase, seconds in row.get('phases', {}).items() if phase != 'list'},
+            'transfer': row['transfer']
+        })
+    for totals in throughput.values():
+        totals['mb_per_s'] = round(totals['bytes'] / (1024 * 1024) / totals['seconds'], 2) if totals['seconds'] else 0.0
+        totals['seconds'] = round(totals['seconds'], 2)
+    return {
+        'started_at': started.isoformat(),
+        'finished_at': finished.isoformat(),
+        'seconds': round((finished - started).total_seconds(), 2),
+        'success': bool(result.get('success')),
+        'error': result.get('error'),
+        **settings,
+        'phases': {phase: round(seconds, 2) for phase, seconds in phases.items()},
+        'throughput': throughput,
+        'transfers': transfers
+    }
+
+def write_transfer_report(path, result, started, settings):
+    """
+    Write the run report as JSON; a report that cannot be written does not fail the run
+    """
+    report = transfer_report(result, started, datetime.now(timezone.utc), settings)
+    try:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    except OSError as e:
+        logger.warning(f"Could not write the transfer report to {path}: {e}")
+        return
+    logger.info(f"Transfer report written to {path}: "
+                + ", ".join(f"{phase} {seconds}s" for phase, seconds in report['phases'].items()))
+
+def parse_timestamp(value):
+    """ISO 8601 date or date/time for --since/--until; naive values are UTC"""
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
 def main():
     """Main function with command line arguments"""
     parser = argparse.ArgumentParser(description='Copy the last modified object between S3 buckets across accounts with remote download using AWS CLI')
@@ -205,16 +1442,74 @@ def main():
     parser.add_argument('--source-prefix', required=True, help='Source S3 prefix/path')
     
     # Destination arguments
-    parser.add_argument('--dest-role-arn', required=True, help='Destination AWS IAM Role ARN to assume')
-    parser.add_argument('--dest-bucket', required=True, help='Destination S3 bucket name')
-    parser.add_argument('--dest-prefix', required=True, help='Destination S3 prefix/path')
+    parser.add_argument('--dest-role-arn', help='Destination AWS IAM Role ARN to assume')
+    parser.add_argument('--dest-bucket', help='Destination S3 bucket name')
+    parser.add_argument('--dest-prefix', help='Destination S3 prefix/path')
+    parser.add_argument('--destinations-file',
+                        help='JSON list of destinations ({"role_arn", "bucket", "prefix"}) to copy to at once; '
+                             'replaces --dest-role-arn/--dest-bucket/--dest-prefix')
+    
+    # Batch arguments
+    parser.add_argument('--pattern', help='Copy every backup whose file name matches this glob (e.g. "*.trn")')
+    parser.add_argument('--since', type=parse_timestamp,
+                        help='Copy every backup modified at or after this date/time (ISO 8601, UTC if no offset)')
+    parser.add_argument('--until', type=parse_timestamp,
+                        help='Copy every backup modified before this date/time (ISO 8601, UTC if no offset)')
+    parser.add_argument('--max-objects', type=int, default=DEFAULT_MAX_OBJECTS,
+                        help='Backups copied at the same time in batch mode')
+    parser.add_argument('--results-file', default='transfer-results.json',
+                        help='Batch mode: per-backup, per-destination results table (JSON)')
     
     # Common arguments
     parser.add_argument('--local-dir', default='C:\\YOUR_REMOTE-DIR\\', help='Local directory for temporary storage')
     parser.add_argument('--region', default='us-east-1', help='AWS region')
     parser.add_argument('--no-cleanup', action='store_true', help='Keep local file after upload')
+    parser.add_argument('--part-size-mb', type=int, default=DEFAULT_PART_SIZE_MB,
+                        help='Multipart part size in MiB (raised automatically to stay within 10,000 parts)')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help='Parts transferred in parallel')
+    parser.add_argument('--mode', choices=['local', 'server-copy', 'stream', 'auto'], default='local',
+                        help='local: download to --local-dir, then upload; server-copy: UploadPartCopy inside S3; '
+                             'stream: pipe parts from source to destination in memory; '
+                             'auto: server-copy, falling back to stream when denied')
+    parser.add_argument('--date-partition-format',
+                        help='strftime pattern of date partitions under the source prefix (e.g. %%Y/%%m/%%d/); '
+                             'recent partitions are listed instead of the whole prefix')
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS,
+                        help='Days of date partitions to search')
+    parser.add_argument('--index-file',
+                        help='Local index of the newest known backup (default: <local-dir>/latest-backup-index.json)')
+    parser.add_argument('--force', action='store_true',
+                        help='Copy even when the destination already holds the same backup')
+    parser.add_argument('--full-listing', action='store_true',
+                        help='Always list the whole source prefix to find the newest backup')
+    parser.add_argument('--compress', choices=['none', 'auto', 'zstd', 'gzip'], default='none',
+                        help='Compress the backup between download and upload (local mode); '
+                             'auto: zstd when the zstandard package is installed, gzip otherwise')
+    parser.add_argument('--compression-level', type=int,
+                        help='Compression level (default: 3 for zstd, 6 for gzip)')
+    parser.add_argument('--report-file', default='transfer-report.json',
+                        help='JSON report of time and throughput per phase, for the build to archive')
     
     args = parser.parse_args()
+    single_destination = [args.dest_role_arn, args.dest_bucket, args.dest_prefix]
+    if args.destinations_file and any(value is not None for value in single_destination):
+        parser.error("--destinations-file cannot be combined with --dest-role-arn/--dest-bucket/--dest-prefix")
+    if not args.destinations_file and any(value is None for value in single_destination):
+        parser.error("--dest-role-arn, --dest-bucket and --dest-prefix are required without --destinations-file")
+    if args.compress != 'none' and args.mode != 'local':
+        parser.error("--compress requires --mode local")
+    batch = bool(args.destinations_file or args.pattern or args.since or args.until)
+    started = datetime.now(timezone.utc)
+    # The report records the algorithm actually used: 'auto' and 'zstd' fall back to gzip without zstandard
+    compression = resolve_compression(args.compress)
+    settings = {
+        'mode': args.mode,
+        'compression': compression or 'none',
+        'part_size_mb': args.part_size_mb,
+        'max_concurrency': args.max_concurrency,
+        'batch': batch
+    }
     
     try:
         logger.info("=" * 80)
@@ -228,21 +1523,77 @@ def main():
         logger.info(f"  Prefix: {args.source_prefix}")
         
         # Destination info
-        logger.info(f"DESTINATION:-")
-        logger.info(f"  Role ARN: {args.dest_role_arn}")
-        logger.info(f"  Bucket: {args.dest_bucket}")
-        logger.info(f"  Prefix: {args.dest_prefix}")
+        if args.destinations_file:
+            with open(args.destinations_file) as f:
+                destinations = json.load(f)
+        else:
+            destinations = [{'role_arn': args.dest_role_arn, 'bucket': args.dest_bucket, 'prefix': args.dest_prefix}]
+        for number, destination in enumerate(destinations, 1):
+            logger.info(f"DESTINATION {number}:-")
+            logger.info(f"  Role ARN: {destination['role_arn']}")
+            logger.info(f"  Bucket: {destination['bucket']}")
+            logger.info(f"  Prefix: {destination.get('prefix', '')}")
+        if batch:
+            logger.info(f"BATCH: pattern={args.pattern}, since={args.since}, until={args.until}, "
+                        f"objects at a time={args.max_objects}")
         
         # Common info
         logger.info(f"LOCAL TEMP DIR: {args.local_dir}")
         logger.info(f"REGION: {args.region}")
         logger.info(f"CLEANUP: {not args.no_cleanup}")
+        logger.info(f"PART SIZE: {args.part_size_mb} MiB, CONCURRENCY: {args.max_concurrency}")
+        logger.info(f"MODE: {args.mode}")
+        logger.info(f"COMPRESSION: {compression or 'none'}")
+        
+        discovery = {
+            'partition_format': args.date_partition_format,
+            'lookback_days': args.lookback_days,
+            'index_path': args.index_file or os.path.join(args.local_dir, 'latest-backup-index.json'),
+            'full_listing': args.full_listing
+        }
+        logger.info(f"DISCOVERY: partitions={args.date_partition_format}, index={discovery['index_path']}, "
+                    f"full listing={args.full_listing}")
         logger.info("=" * 80)
         
         # Set AWS region if provided
         if args.region:
             os.environ['AWS_DEFAULT_REGION'] = args.region.strip()  # Strip any extra spaces
         
+        if batch:
+            result = copy_backups_batch(
+                source_role_arn=args.source_role_arn,
+                source_bucket=args.source_bucket,
+                source_prefix=args.source_prefix,
+                destinations=destinations,
+                local_dir=args.local_dir,
+                pattern=args.pattern,
+                since=args.since,
+                until=args.until,
+                cleanup=not args.no_cleanup,
+                part_size=args.part_size_mb * 1024 * 1024,
+                max_concurrency=args.max_concurrency,
+                max_objects=args.max_objects,
+                mode=args.mode,
+                discovery=discovery,
+                force=args.force,
+                compression=compression,
+                compression_level=args.compression_level
+            )
+            with open(args.results_file, 'w') as f:
+                json.dump(result['results'], f, indent=2)
+            
+            logger.info("=" * 80)
+            for row in result['results']:
+                logger.info(f"{row['status'].upper():8} {row['filename']} -> "
+                            f"s3://{row['destination_bucket']}/{row['destination_key']}"
+                            + (f" ({row['error']})" if row.get('error') else ""))
+            logger.info(f"{result['objects']} backup(s) x {result['destinations']} destination(s): "
+                        f"{result['copied']} copied, {result['skipped']} skipped, {result['failed']} failed")
+            logger.info(f"Results written to {args.results_file}")
+            write_transfer_report(args.report_file, result, started, settings)
+            logger.info("=" * 80)
+            return result
+        
         # Execute the complete process
         result = copy_s3_object_across_accounts(
             source_role_arn=args.source_role_arn,
@@ -252,11 +1603,20 @@ def main():
             dest_bucket=args.dest_bucket,
             dest_prefix=args.dest_prefix,
             local_dir=args.local_dir,
-            cleanup=not args.no_cleanup
+            cleanup=not args.no_cleanup,
+            part_size=args.part_size_mb * 1024 * 1024,
+            max_concurrency=args.max_concurrency,
+            mode=args.mode,
+            discovery=discovery,
+            force=args.force,
+            compression=compression,
+            compression_level=args.compression_level
         )
         
         logger.info("=" * 80)
-        if result['success']:
+        if result['success'] and result.get('skipped'):
+            logger.info("Destination already up to date - nothing copied")
+        elif result['success']:
             logger.info("Complete process finished successfully!")
             logger.info(f"File: {result.get('filename')}")
             logger.info(f"Destination: s3://{result['destination_bucket']}/{result['destination_key']}")
@@ -264,17 +1624,23 @@ def main():
                 logger.info("Local temporary file cleaned up")
         else:
             logger.error(f"Process failed: {result['error']}")
+        write_transfer_report(args.report_file, result, started, settings)
         logger.info("=" * 80)
         
         return result
         
     except Exception as e:
         logger.error(f"Process failed: {str(e)}", exc_info=True)
-        return {'success': False, 'error': str(e)}
+        result = {'success': False, 'error': str(e)}
+        write_transfer_report(args.report_file, result, started, settings)
+        return result
 
 if __name__ == "__main__":
     result = main()
-    if result and result.get('success'):
+    if result and result.get('success') and 'results' in result:
+        print(f"\nSuccess! {result['copied']} copied, {result['skipped']} skipped "
+              f"across {result['destinations']} destination(s)")
+    elif result and result.get('success'):
         print(f"\nSuccess! Complete process finished successfully!")
         print(f"File: {result.get('filename')}")
         print(f"Destination: s3://{result['destination_bucket']}/{result['destination_key']}")
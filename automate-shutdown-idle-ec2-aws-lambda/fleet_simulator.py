@@ -0,0 +1,541 @@
+"""
+Offline fleet-scale simulator for the EC2 auto-shutdown Lambda.
+
+Runs lambda_handler in-process against a synthetic fleet. Every AWS call
+(STS, EC2, CloudWatch, DynamoDB, SES and S3) is answered by an in-memory backend
+through botocore's before-send event, in place of the HTTP request, so request
+parameters are still validated and no network is touched. Everything around the
+request still runs: botocore's retries, the client-side rate limiter and the run
+metrics see every attempt and its real status code.
+
+Usage:
+    python fleet_simulator.py --instances 5000 --runs 2
+    python fleet_simulator.py --instances 500 --write-golden golden.json
+    python fleet_simulator.py --instances 500 --check-golden golden.json --env INSTANCE_WORKERS=16
+"""
+import argparse
+import contextlib
+import copy
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from botocore.awsrequest import AWSResponse
+
+
+
+def empty_body(model, status):
+    """Smallest body the operation's response parser accepts; the content comes from the canned response"""
+    if model.service_model.resolved_protocol in ('json', 'rest-json'):
+        return b'{}'
+    # Query protocols (STS, SES, CloudWatch XML) look for the result element inside the response
+    wrapper = model.output_shape.serialization.get('resultWrapper') if model.output_shape else None
+    if status < 300 and wrapper:
+        return f"<{model.name}Response><{wrapper}/></{model.name}Response>".encode()
+    return b'<Response/>'
+
+
+class CannedBody:
+    """Raw body of a simulated HTTP response (AWSResponse reads it through stream())"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+class SimulatedContext:
+    """Minimal stand-in for the Lambda context object"""
+
+    def __init__(self, timeout_seconds=300):
+        self.deadline = time.monotonic() + timeout_seconds
+        self.function_name = 'ec2-auto-shutdown'
+        self.invoked_function_arn = 'arn:aws:lambda:us-west-2:111111111111:function:ec2-auto-shutdown'
+        self.aws_request_id = 'simulated-request'
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+class SyntheticFleet:
+    """Synthetic instances, volumes and metric curves"""
+
+    def __init__(self, instance_count, volumes_per_instance=2, idle_fraction=0.4, missing_fraction=0.02, seed=42):
+        self.seed = seed
+        self.missing_fraction = missing_fraction
+        rnd = random.Random(seed)
+        self.instances = []
+        self.idle = {}
+        for index in range(instance_count):
+            instance_id = f"i-{index:017x}"
+            tags = [
+                {'Key': 'Name', 'Value': f"sim-{index}"},
+                {'Key': 'Environment', 'Value': 'Mainline'},
+                {'Key': 'System', 'Value': 'Xbox'},
+            ]
+            if rnd.random() < 0.3:
+                tags.append({'Key': 'Owner', 'Value': f"owner{index % 7}@example.com"})
+            self.instances.append({
+                'InstanceId': instance_id,
+                'InstanceType': 't3.medium',
+                'LaunchTime': datetime(2024, 1, 1, tzinfo=timezone.utc),
+                'State': {'Code': 16, 'Name': 'running'},
+                'Tags': tags,
+                'BlockDeviceMappings': [
+                    {'DeviceName': f"/dev/sd{chr(97 + v)}", 'Ebs': {'VolumeId': f"vol-{index:012x}{v:05x}"}}
+                    for v in range(volumes_per_instance)
+                ],
+            })
+            self.idle[instance_id] = rnd.random() < idle_fraction
+        self.volume_owner = {
+            mapping['Ebs']['VolumeId']: instance['InstanceId']
+            for instance in self.instances
+            for mapping in instance['BlockDeviceMappings']
+        }
+
+    def series(self, resource_id, metric_name, start_time, end_time, period):
+        """Datapoints for a metric between start_time and end_time; each value depends only on its timestamp"""
+        digest = hashlib.md5(f"{self.seed}:{resource_id}:{metric_name}".encode()).hexdigest()
+        rnd = random.Random(digest)
+        if rnd.random() < self.missing_fraction:
+            return []
+
+        owner = self.volume_owner.get(resource_id, resource_id)
+        idle = self.idle.get(owner, False)
+        base = {
+            'CPUUtilization': (0.8, 35.0),
+            'NetworkIn': (2500, 2.5e6),
+            'NetworkOut': (2500, 1.5e6),
+            'VolumeReadBytes': (5000, 4e7),
+            'VolumeWriteBytes': (8000, 6e7),
+        }[metric_name][0 if idle else 1]
+        phase = rnd.uniform(0, 2 * math.pi)
+
+        # CloudWatch returns UTC timestamps aligned to the period
+        start = int(start_time.replace(tzinfo=timezone.utc).timestamp())
+        end = int(end_time.replace(tzinfo=timezone.utc).timestamp())
+        points = []
+        for epoch in range(start + (-start % period), end, period):
+            curve = 1 + 0.5 * math.sin(phase + epoch / 3600)
+            noise = random.Random(f"{digest}:{epoch}").uniform(0.7, 1.3)
+            points.append((datetime.fromtimestamp(epoch, timezone.utc), base * curve * noise))
+        return points
+
+
+class SimulatedAWS:
+    """In-memory AWS backend answering botocore calls for the Lambda"""
+
+    def __init__(self, fleet, throttle_fraction=0.0, seed=42, stop_failure_fraction=0.0, stop_throttle_fraction=0.0,
+                 metric_latency_ms=0):
+        self.fleet = fleet
+        # Simulated GetMetricData latency, so metric collection can outlast the time budget
+        self.metric_latency_ms = metric_latency_ms
+        self.throttle_fraction = throttle_fraction
+        self.throttle_random = random.Random(seed)
+        self.stop_throttle_fraction = stop_throttle_fraction
+        self.stop_throttle_random = random.Random(seed + 2)
+        # Throttled StopInstances chunks, and later requests that stopped part of one (a bisected chunk)
+        self.throttled_stop_chunks = []
+        self.bisected_throttled_chunks = 0
+        stop_random = random.Random(seed + 1)
+        self.unstoppable = {
+            instance['InstanceId'] for instance in fleet.instances if stop_random.random() < stop_failure_fraction
+        }
+        self.calls = Counter()
+        # Throttling errors answered, one per attempt
+        self.throttles_injected = 0
+        self.is_throttling_error = None
+        # Canned responses waiting for botocore to parse them, by response id
+        self.responses = {}
+        self.response_ids = itertools.count()
+        self.datapoints = 0
+        self.table = {}
+        self.objects = {}
+        self.invocations = []
+        self.emails = []
+        self.stopped = set()
+
+    def install(self, lambda_module):
+        """Route every client the Lambda creates to this backend"""
+        self.is_throttling_error = lambda_module.is_throttling_error
+        lambda_module.register_client_hook('before-parameter-build', self.capture_params)
+        lambda_module.register_client_hook('before-send', self.respond)
+        lambda_module.register_client_hook('before-parse', self.parse)
+
+    def capture_params(self, params, model, context, **kwargs):
+        context['simulated_params'] = params
+        context['simulated_operation'] = model
+
+    def respond(self, request, **kwargs):
+        """Answer one HTTP attempt; the parsed result is handed to parse() through a response id header"""
+        model = request.context['simulated_operation']
+        service = model.service_model.service_name
+        operation = model.name
+        self.calls[(service, operation)] += 1
+        handler = getattr(self, f"{service}_{operation}", None)
+        if handler is None:
+            raise NotImplementedError(f"Simulator does not implement {service}.{operation}")
+        parsed = handler(request.context.get('simulated_params', {}))
+        status = 200
+        if 'Error' in parsed:
+            status = 404 if parsed['Error']['Code'] == 'NoSuchKey' else 400
+            if self.is_throttling_error(parsed['Error']['Code']):
+                self.throttles_injected += 1
+        response_id = str(next(self.response_ids))
+        self.responses[response_id] = parsed
+        return AWSResponse('https://simulated.amazonaws.com', status, {'x-simulated-response-id': response_id},
+                           CannedBody(empty_body(model, status)))
+
+    def parse(self, response_dict, customized_response_dict, **kwargs):
+        response_id = response_dict['headers'].get('x-simulated-response-id')
+        if response_id is not None:
+            customized_response_dict.update(self.responses.pop(response_id))
+
+    # STS
+    def sts_AssumeRole(self, params):
+        return {'Credentials': {
+            'AccessKeyId': 'ASIASIMULATED',
+            'SecretAccessKey': 'simulated',
+            'SessionToken': 'simulated',
+            'Expiration': datetime.now(timezone.utc) + timedelta(seconds=params.get('DurationSeconds', 3600)),
+        }}
+
+    # EC2
+    def ec2_DescribeInstances(self, params):
+        if params.get('InstanceIds'):
+            requested = set(params['InstanceIds'])
+            instances = []
+            for instance in self.fleet.instances:
+                if instance['InstanceId'] in requested:
+                    state = 'stopping' if instance['InstanceId'] in self.stopped else 'running'
+                    instances.append({**instance, 'State': {'Code': 64 if state == 'stopping' else 16, 'Name': state}})
+            return {'Reservations': [{'ReservationId': 'r-00000000000000000', 'Instances': instances}]}
+        page_size = params.get('MaxResults', 1000)
+        start = int(params.get('NextToken', 0))
+        running = [i for i in self.fleet.instances if i['InstanceId'] not in self.stopped]
+        page = running[start:start + page_size]
+        response = {'Reservations': [{'ReservationId': f"r-{start:017x}", 'Instances': page}]}
+        if start + page_size < len(running):
+            response['NextToken'] = str(start + page_size)
+        return response
+
+    def ec2_StopInstances(self, params):
+        requested = set(params['InstanceIds'])
+        if self.stop_throttle_fraction and self.stop_throttle_random.random() < self.stop_throttle_fraction:
+            self.throttled_stop_chunks.append(requested)
+            return {'Error': {'Code': 'RequestLimitExceeded', 'Message': 'Request limit exceeded.'}}
+        if any(requested < chunk for chunk in self.throttled_stop_chunks):
+            self.bisected_throttled_chunks += 1
+        # Like EC2, one instance that cannot be stopped fails the whole request
+        blocked = sorted(self.unstoppable.intersection(params['InstanceIds']))
+        if blocked:
+            return {'Error': {'Code': 'IncorrectInstanceState',
+                              'Message': f"The instance '{blocked[0]}' is not in a state from which it can be stopped."}}
+        changes = []
+        for instance_id in params['InstanceIds']:
+            self.stopped.add(instance_id)
+            changes.append({
+                'InstanceId': instance_id,
+                'CurrentState': {'Code': 64, 'Name': 'stopping'},
+                'PreviousState': {'Code': 16, 'Name': 'running'},
+            })
+        return {'StoppingInstances': changes}
+
+    # CloudWatch
+    def cloudwatch_GetMetricData(self, params):
+        if self.metric_latency_ms:
+            time.sleep(self.metric_latency_ms / 1000)
+        if self.throttle_random.random() < self.throttle_fraction:
+            return {'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}
+        queries = params['MetricDataQueries']
+        if len(queries) > 500:
+            return {'Error': {'Code': 'ValidationError', 'Message': 'Too many metric data queries'}}
+        start_time, end_time = params['StartTime'], params['EndTime']
+        results = []
+        for query in queries:
+            stat = query['MetricStat']
+            metric = stat['Metric']
+            points = self.fleet.series(
+                metric['Dimensions'][0]['Value'], metric['MetricName'], start_time, end_time, stat['Period']
+            )
+            if params.get('ScanBy') != 'TimestampAscending':
+                points = points[::-1]
+            self.datapoints += len(points)
+            results.append({
+                'Id': query['Id'],
+                'Label': metric['MetricName'],
+                'Timestamps': [t for t, _ in points],
+                'Values': [v for _, v in points],
+                'StatusCode': 'Complete',
+            })
+        return {'MetricDataResults': results}
+
+    # DynamoDB (items are stored in wire format; boto3 deserializes responses in place, so copies are returned)
+    def dynamodb_BatchGetItem(self, params):
+        responses = {}
+        for table_name, request in params['RequestItems'].items():
+            responses[table_name] = [
+                copy.deepcopy(self.table[key['InstanceId']['S']])
+                for key in request['Keys'] if key['InstanceId']['S'] in self.table
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def dynamodb_BatchWriteItem(self, params):
+        for requests in params['RequestItems'].values():
+            for request in requests:
+                if 'PutRequest' in request:
+                    item = request['PutRequest']['Item']
+                    self.table[item['InstanceId']['S']] = item
+                else:
+                    self.table.pop(request['DeleteRequest']['Key']['InstanceId']['S'], None)
+        return {'UnprocessedItems': {}}
+
+    def dynamodb_GetItem(self, params):
+        item = self.table.get(params['Key']['InstanceId']['S'])
+        return {'Item': copy.deepcopy(item)} if item else {}
+
+    def dynamodb_PutItem(self, params):
+        self.table[params['Item']['InstanceId']['S']] = params['Item']
+        return {}
+
+    def dynamodb_DeleteItem(self, params):
+        self.table.pop(params['Key']['InstanceId']['S'], None)
+        return {}
+
+    # Lambda (asynchronous continuations are queued and run by the simulator)
+    def lambda_Invoke(self, params):
+        self.invocations.append(json.loads(params['Payload']))
+        return {'StatusCode': 202}
+
+    # S3 (metric cache)
+    def s3_GetObject(self, params):
+        key = (params['Bucket'], params['Key'])
+        if key not in self.objects:
+            return {'Error': {'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'}}
+        return {'Body': io.BytesIO(self.objects[key]), 'ContentLength': len(self.objects[key])}
+
+    def s3_PutObject(self, params):
+        body = params['Body']
+        # botocore wraps bytes bodies in a file-like object before the call
+        body = body.read() if hasattr(body, 'read') else body
+        self.objects[(params['Bucket'], params['Key'])] = body
+        return {'ETag': hashlib.md5(body).hexdigest()}
+
+    # SES
+    def ses_SendEmail(self, params):
+        self.emails.append(params)
+        return {'MessageId': f"simulated-{len(self.emails)}"}
+
+    def ses_GetSendQuota(self, params):
+        return {'Max24HourSend': 50000.0, 'MaxSendRate': 14.0, 'SentLast24Hours': 0.0}
+
+    def age_warnings(self, minutes):
+        """Move every warning timestamp back in time, as if the next scheduled run had arrived"""
+        for item in self.table.values():
+            if 'warning_sent' in item:
+                warning_sent = datetime.fromisoformat(item['warning_sent']['S']) - timedelta(minutes=minutes)
+                item['warning_sent'] = {'S': warning_sent.isoformat()}
+
+
+def run_simulation(args):
+    """Run the Lambda against the synthetic fleet and return the report"""
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'simulated')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'simulated')
+    os.environ.setdefault('MONITORING_ROLE_ARN', 'arn:aws:iam::111111111111:role/EC2MonitoringRole')
+    os.environ.setdefault('SES_ROLE_ARN', 'arn:aws:iam::111111111111:role/SESEmailRole')
+    os.environ.setdefault('SES_MAX_SEND_RATE', '1000')
+    for assignment in args.env:
+        key, _, value = assignment.partition('=')
+        os.environ[key] = value
+
+    # Import after the environment is set: the Lambda reads configuration at import time
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    lambda_function = importlib.import_module('lambda_function')
+
+    fleet = SyntheticFleet(args.instances, args.volumes_per_instance, args.idle_fraction, args.missing_fraction, args.seed)
+    backend = SimulatedAWS(fleet, args.throttle_fraction, args.seed, args.stop_failure_fraction,
+                           args.stop_throttle_fraction, args.metric_latency_ms)
+    backend.install(lambda_function)
+
+    report = {'instances': args.instances, 'volumes_per_instance': args.volumes_per_instance, 'runs': []}
+    decisions = []
+    for run in range(args.runs):
+        backend.calls.clear()
+        backend.datapoints = 0
+        backend.throttles_injected = 0
+        limiter_throttles = sum(limiter.throttles for limiter in lambda_function.rate_limiters.values())
+        backend.throttled_stop_chunks.clear()
+        backend.bisected_throttled_chunks = 0
+        stopped_before = set(backend.stopped)
+        output = io.StringIO()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        # A scheduled invocation plus any continuations it chains when the time budget runs out
+        bodies = []
+        events = [{}]
+        overruns = 0
+        with contextlib.redirect_stdout(output):
+            while events:
+                context = SimulatedContext(args.timeout_seconds)
+                response = lambda_function.lambda_handler(events.pop(0), context)
+                # A real invocation would have been killed at the timeout
+                overruns += int(time.monotonic() > context.deadline)
+                bodies.append(json.loads(response['body']))
+                events.extend(backend.invocations)
+                backend.invocations.clear()
+        wall_time = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results = {}
+        phases = Counter()
+        instrumentation = Counter()
+        for body in bodies:
+            instrumentation.update({key: body['instrumentation'][key] for key in ('api_throttles', 'api_retries')})
+            for key, value in body['results'].items():
+                if isinstance(value, (int, list)) and not isinstance(value, bool):
+                    results[key] = results.get(key, 0 if isinstance(value, int) else []) + value
+            phases.update(body['instrumentation']['phases_ms'])
+        calls_by_service = Counter()
+        for (service, _), count in backend.calls.items():
+            calls_by_service[service] += count
+
+        report['runs'].append({
+            'run': run + 1,
+            'invocations': len(bodies),
+            'invocations_over_timeout': overruns,
+            # Work still deferred when the chain of continuations ended
+            'unfinished_instances': bodies[-1]['results'].get('instances_deferred', 0),
+            'unfinished_targets': bodies[-1]['results'].get('targets_deferred', 0),
+            'wall_time_seconds': round(wall_time, 3),
+            'peak_memory_mb': round(peak_memory / (1024 * 1024), 2),
+            'api_calls_total': sum(backend.calls.values()),
+            'metric_datapoints': backend.datapoints,
+            # Every injected throttle must reach the run metrics and the rate limiter
+            'throttles_injected': backend.throttles_injected,
+            'api_throttles': instrumentation['api_throttles'],
+            'api_retries': instrumentation['api_retries'],
+            'limiter_throttles': sum(limiter.throttles for limiter in lambda_function.rate_limiters.values())
+                                 - limiter_throttles,
+            'throttled_stop_chunks': len(backend.throttled_stop_chunks),
+            'bisected_throttled_chunks': backend.bisected_throttled_chunks,
+            'api_calls_by_service': dict(sorted(calls_by_service.items())),
+            'api_calls_by_operation': {f"{s}.{o}": c for (s, o), c in sorted(backend.calls.items())},
+            'results': {key: value for key, value in results.items() if key != 'targets'},
+            'phases_ms': {name: round(ms, 1) for name, ms in phases.items()},
+        })
+        decisions.append({
+            'warned': sorted(key for key in backend.table if not key.startswith('checkpoint#')),
+            'stopped': sorted(backend.stopped - stopped_before),
+        })
+        if args.verbose:
+            sys.stdout.write(output.getvalue())
+
+        # Next scheduled run: warnings are now past the 15-minute grace period
+        backend.age_warnings(args.run_interval_minutes)
+
+    report['decisions'] = decisions
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the EC2 auto-shutdown Lambda against a synthetic fleet')
+    parser.add_argument('--instances', type=int, default=1000)
+    parser.add_argument('--volumes-per-instance', type=int, default=2)
+    parser.add_argument('--idle-fraction', type=float, default=0.4)
+    parser.add_argument('--missing-fraction', type=float, default=0.02,
+                        help='Fraction of metric series returned without datapoints')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--throttle-fraction', type=float, default=0.0,
+                        help='Fraction of GetMetricData requests answered with a Throttling error')
+    parser.add_argument('--stop-failure-fraction', type=float, default=0.0,
+                        help='Fraction of instances whose StopInstances request fails (IncorrectInstanceState)')
+    parser.add_argument('--stop-throttle-fraction', type=float, default=0.0,
+                        help='Fraction of StopInstances requests answered with RequestLimitExceeded')
+    parser.add_argument('--metric-latency-ms', type=int, default=0,
+                        help='Simulated latency of every GetMetricData request')
+    parser.add_argument('--runs', type=int, default=2, help='Consecutive scheduled runs to simulate')
+    parser.add_argument('--run-interval-minutes', type=int, default=15)
+    parser.add_argument('--timeout-seconds', type=int, default=900, help='Simulated Lambda timeout')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Environment override for the Lambda (repeatable)')
+    parser.add_argument('--report', help='Write the full JSON report to this path')
+    parser.add_argument('--write-golden', help='Write warn/stop decisions to this golden file')
+    parser.add_argument('--check-golden', help='Compare warn/stop decisions with this golden file')
+    parser.add_argument('--verbose', action='store_true', help='Print the Lambda output')
+    args = parser.parse_args()
+
+    report = run_simulation(args)
+
+    for run in report['runs']:
+        print(f"Run {run['run']} ({run['invocations']} invocation(s)): {run['wall_time_seconds']:.2f}s, peak {run['peak_memory_mb']:.1f} MB, "
+              f"{run['api_calls_total']} API calls {run['api_calls_by_service']}, "
+              f"{run['metric_datapoints']} metric datapoints")
+        print(f"  results: {run['results']}")
+        print(f"  phases (ms): {run['phases_ms']}")
+        if run['throttles_injected']:
+            print(f"  throttles injected: {run['throttles_injected']}, counted by run metrics: {run['api_throttles']}, "
+                  f"by the rate limiter: {run['limiter_throttles']}, retries: {run['api_retries']}")
+        if run['throttled_stop_chunks']:
+            print(f"  throttled StopInstances chunks: {run['throttled_stop_chunks']}, "
+                  f"bisected afterwards: {run['bisected_throttled_chunks']}")
+
+    # Throttles are answered per HTTP attempt, so each must be seen by the retry hooks exactly once
+    if any(run['api_throttles'] != run['throttles_injected'] or run['limiter_throttles'] != run['throttles_injected']
+           for run in report['runs']):
+        print("Injected throttles were not counted once each by the run metrics and the rate limiter")
+        sys.exit(1)
+
+    # Slow metric collection must be checkpointed, not run past the timeout or dropped
+    if any(run['invocations_over_timeout'] for run in report['runs']):
+        print("An invocation ran past the simulated Lambda timeout")
+        sys.exit(1)
+    if any(run['unfinished_instances'] or run['unfinished_targets'] for run in report['runs']):
+        print("Work was still deferred when the chain of continuations ended")
+        sys.exit(1)
+
+    # A throttled chunk must be reported as failed, not split into more requests
+    if any(run['bisected_throttled_chunks'] for run in report['runs']):
+        print("Throttled StopInstances chunks were bisected")
+        sys.exit(1)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+    if args.write_golden:
+        with open(args.write_golden, 'w') as f:
+            json.dump({'seed': args.seed, 'instances': args.instances, 'decisions': report['decisions']}, f, indent=2)
+        print(f"Golden decisions written to {args.write_golden}")
+
+    if args.check_golden:
+        with open(args.check_golden) as f:
+            golden = json.load(f)
+        if golden['decisions'] != report['decisions']:
+            for run, (expected, actual) in enumerate(zip(golden['decisions'], report['decisions']), start=1):
+                for kind in ('warned', 'stopped'):
+                    missing = sorted(set(expected[kind]) - set(actual[kind]))
+                    extra = sorted(set(actual[kind]) - set(expected[kind]))
+                    if missing or extra:
+                        print(f"Run {run} {kind}: missing {missing[:10]}, unexpected {extra[:10]}")
+            print("Decisions differ from the golden file")
+            sys.exit(1)
+        print("Decisions match the golden file")
+
+
+if __name__ == '__main__':
+    main()
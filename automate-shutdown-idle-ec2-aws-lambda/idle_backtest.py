@@ -0,0 +1,359 @@
+"""
+Offline backtest of idle-detection policies against exported metric history.
+
+Loads CloudWatch history for the fleet into per-metric numpy arrays and replays
+the Lambda's decision loop for every candidate policy: every run scores each
+instance against the idle policy, warns the first time it is idle, and stops it
+when it is still idle once the 15-minute grace period has passed.
+
+Instances are scored with the policy the Lambda would pick for them: the first
+override in IDLE_POLICY / IDLE_POLICY_FILE whose tag expression matches the
+instance's tags, else the default. Tags are not part of the metric export and
+come from --tags; without it every instance is scored with the default policy.
+Candidate policies are applied to the default, and overrides are layered on top
+as in the Lambda.
+
+A replayed stop lasts until the recorded history shows the instance in use
+again; that gap is the saved instance time. A stop is counted as false when
+activity resumed within --false-stop-minutes.
+
+Input: CSV (optionally .gz) or Parquet (needs pandas and pyarrow), one row per
+resource, metric and timestamp:
+    timestamp    ISO 8601 or epoch seconds, aligned to the 5-minute period
+    instance_id  instance the row belongs to
+    metric       CPUUtilization, NetworkIn, NetworkOut (Average),
+                 VolumeReadBytes or VolumeWriteBytes (Sum)
+    value        datapoint value
+    resource_id  volume id for the EBS metrics (ignored for instance metrics)
+
+Tags: JSON object mapping instance id to its tags, e.g.
+    {"i-0123456789abcdef0": {"env": "dev", "team": "data"}}
+
+Usage:
+    python idle_backtest.py history.csv.gz
+    python idle_backtest.py history.csv.gz --tags tags.json
+    python idle_backtest.py history.parquet --sweep CPUUtilization=1,3,5,10
+    python idle_backtest.py history.csv --policy strict='{"min_low_score": 4}' --policy relaxed=@relaxed.json
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from lambda_function import INSTANCE_METRICS, METRIC_PERIOD_SECONDS, IdlePolicyEngine, merge_policy
+
+VOLUME_METRICS = ('VolumeReadBytes', 'VolumeWriteBytes')
+# Runs are aggregated in chunks to bound the size of the sliding-window copies
+RUN_CHUNK = 256
+
+
+def parse_timestamp(text):
+    """Epoch seconds from an ISO 8601 string or a number; naive times are UTC"""
+    try:
+        return float(text)
+    except ValueError:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+def load_columns(path):
+    """Read the export into columns of equal length"""
+    names = ('timestamp', 'instance_id', 'metric', 'value', 'resource_id')
+    if path.endswith('.parquet'):
+        try:
+            import pandas as pd
+        except ImportError:
+            sys.exit('Reading Parquet needs pandas and pyarrow: pip install pandas pyarrow')
+        frame = pd.read_parquet(path)
+        if 'resource_id' not in frame.columns:
+            frame['resource_id'] = frame['instance_id']
+        timestamps = frame['timestamp']
+        if str(timestamps.dtype).startswith('datetime64'):
+            epochs = pd.to_datetime(timestamps, utc=True).astype('int64').to_numpy() / 1e9
+        else:
+            epochs = np.array([parse_timestamp(str(value)) for value in timestamps])
+        return (epochs, frame['instance_id'].astype(str).to_numpy(), frame['metric'].astype(str).to_numpy(),
+                frame['value'].to_numpy(dtype=float), frame['resource_id'].fillna('').astype(str).to_numpy())
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        missing = [name for name in names[:4] if name not in header]
+        if missing:
+            sys.exit(f"{path} is missing column(s): {', '.join(missing)}")
+        index = {name: header.index(name) for name in names if name in header}
+        columns = {name: [] for name in names}
+        for row in reader:
+            for name in names[:4]:
+                columns[name].append(row[index[name]])
+            columns['resource_id'].append(row[index['resource_id']] if 'resource_id' in index else '')
+
+    # The same timestamps repeat for every series: parse each distinct string once
+    parsed = {}
+    epochs = np.array([
+        parsed[text] if text in parsed else parsed.setdefault(text, parse_timestamp(text))
+        for text in columns['timestamp']
+    ])
+    return (epochs, np.array(columns['instance_id']), np.array(columns['metric']),
+            np.array(columns['value'], dtype=float), np.array(columns['resource_id']))
+
+
+class MetricHistory:
+    """Fleet history on a regular period grid: one [series, step] array per metric, NaN where no datapoint"""
+
+    def __init__(self, epochs, instance_ids, metrics, values, resource_ids, period=METRIC_PERIOD_SECONDS):
+        self.period = period
+        self.start = float(epochs.min()) // period * period
+        steps = ((epochs - self.start) // period).astype(np.int64)
+        self.steps = int(steps.max()) + 1
+        self.instance_ids, instance_rows = np.unique(instance_ids, return_inverse=True)
+
+        self.instance_metrics = {}
+        for metric_name in INSTANCE_METRICS:
+            matrix = np.full((len(self.instance_ids), self.steps), np.nan)
+            mask = metrics == metric_name
+            matrix[instance_rows[mask], steps[mask]] = values[mask]
+            self.instance_metrics[metric_name] = matrix
+
+        volume_mask = np.isin(metrics, VOLUME_METRICS)
+        self.volume_ids, volume_rows = np.unique(resource_ids[volume_mask], return_inverse=True)
+        # Owning instance row of every volume
+        self.volume_owner = np.zeros(len(self.volume_ids), dtype=np.int64)
+        self.volume_owner[volume_rows] = instance_rows[volume_mask]
+        self.volume_metrics = {}
+        for metric_name in VOLUME_METRICS:
+            matrix = np.full((len(self.volume_ids), self.steps), np.nan)
+            mask = metrics[volume_mask] == metric_name
+            matrix[volume_rows[mask], steps[volume_mask][mask]] = values[volume_mask][mask]
+            self.volume_metrics[metric_name] = matrix
+
+    @classmethod
+    def load(cls, path):
+        return cls(*load_columns(path))
+
+    def policy_indexes(self, engine, tags):
+        """Index into engine.policies of the policy for every instance, resolved from its tags"""
+        return np.array([
+            engine.policy_for({'Tags': [{'Key': key, 'Value': value}
+                                        for key, value in tags.get(instance_id, {}).items()]})
+            for instance_id in self.instance_ids
+        ], dtype=np.int64)
+
+    def hours(self):
+        return self.steps * self.period / 3600
+
+
+def aggregate_runs(matrix, run_steps, lookback_points, window_points, aggregation):
+    """
+    Aggregate every series at every run, the way the Lambda does: of the datapoints
+    in the lookback ending at the run, the newest window_points are aggregated.
+    Returns a [series, run] array; NaN marks a series without data in the window.
+    """
+    padded = np.concatenate([np.full((matrix.shape[0], lookback_points - 1), np.nan), matrix], axis=1)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, lookback_points, axis=1)
+    result = np.empty((matrix.shape[0], len(run_steps)))
+    for start in range(0, len(run_steps), RUN_CHUNK):
+        chunk = windows[:, run_steps[start:start + RUN_CHUNK]].copy()
+        present = ~np.isnan(chunk)
+        # Count of datapoints at or after each slot; older ones beyond window_points are dropped
+        newer = np.cumsum(present[..., ::-1], axis=-1)[..., ::-1]
+        chunk[newer > window_points] = np.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            if aggregation == 'average':
+                values = np.nanmean(chunk, axis=-1)
+            elif aggregation == 'max':
+                values = np.nanmax(chunk, axis=-1)
+            elif aggregation == 'min':
+                values = np.nanmin(chunk, axis=-1)
+            else:
+                values = np.nanpercentile(chunk, float(aggregation[1:]), axis=-1)
+        result[:, start:start + RUN_CHUNK] = values
+    return result
+
+
+def idle_matrix(history, policy, run_steps):
+    """[instance, run] booleans: the instance scores as unused at that run"""
+    lookback_points = max(1, policy['lookback_minutes'] * 60 // history.period)
+    window_points = policy['window_points']
+    scores = np.zeros((len(history.instance_ids), len(run_steps)))
+
+    for metric_name in INSTANCE_METRICS:
+        settings = policy['metrics'][metric_name]
+        values = aggregate_runs(history.instance_metrics[metric_name], run_steps, lookback_points, window_points,
+                                settings['aggregation'])
+        # Missing data counts as low, as in the Lambda (NO_DATA)
+        scores += settings['weight'] * ~(values >= settings['threshold'])
+
+    settings = policy['metrics']['EBSDiskActivity']
+    any_active = np.zeros((len(history.instance_ids), len(run_steps)), dtype=bool)
+    if len(history.volume_ids):
+        activity = sum(
+            np.nan_to_num(aggregate_runs(history.volume_metrics[metric_name], run_steps, lookback_points,
+                                         window_points, settings['aggregation']))
+            for metric_name in VOLUME_METRICS
+        )
+        np.logical_or.at(any_active, history.volume_owner, activity > settings['threshold'])
+    scores += settings['weight'] * ~any_active
+
+    return scores >= policy['min_low_score']
+
+
+def replay(history, engine, policy_indexes, run_interval_minutes, grace_minutes, false_stop_minutes):
+    """Replay the warn/stop state machine for one policy engine and summarize it"""
+    steps_per_run = max(1, run_interval_minutes * 60 // history.period)
+    # The first run has a full window of history behind it, for every policy in use
+    used = np.unique(policy_indexes)
+    window_points = max(engine.policies[index]['window_points'] for index in used) if len(used) else 1
+    first_step = min(window_points, history.steps) - 1
+    run_steps = np.arange(first_step, history.steps, steps_per_run)
+    idle = np.zeros((len(history.instance_ids), len(run_steps)), dtype=bool)
+    for index in used:
+        rows = policy_indexes == index
+        idle[rows] = idle_matrix(history, engine.policies[index], run_steps)[rows]
+
+    instance_count = len(history.instance_ids)
+    warned_at = np.full(instance_count, -1)
+    stopped_at = np.full(instance_count, -1)
+    grace_runs = -(-grace_minutes // run_interval_minutes)
+    warnings_sent = 0
+    stopped_runs = []
+    false_stops = 0
+    for run in range(len(run_steps)):
+        idle_now = idle[:, run]
+        stopped = stopped_at >= 0
+
+        # A stopped instance that shows activity again was started back up
+        resumed = stopped & ~idle_now
+        gaps = run - stopped_at[resumed]
+        stopped_runs.extend(gaps.tolist())
+        false_stops += int(np.count_nonzero(gaps * run_interval_minutes <= false_stop_minutes))
+        stopped_at[resumed] = -1
+
+        running = ~stopped
+        warned_at[running & ~idle_now] = -1
+        due = running & idle_now & (warned_at >= 0) & (run - warned_at >= grace_runs)
+        stopped_at[due] = run
+        warned_at[due] = -1
+        new_warnings = running & idle_now & (warned_at < 0) & ~due
+        warned_at[new_warnings] = run
+        warnings_sent += int(np.count_nonzero(new_warnings))
+
+    # Instances still stopped at the end of the history saved time up to its last run
+    still_stopped = stopped_at >= 0
+    stopped_runs.extend((len(run_steps) - stopped_at[still_stopped]).tolist())
+    stops = len(stopped_runs)
+    saved_hours = sum(stopped_runs) * run_interval_minutes / 60
+    return {
+        'runs': len(run_steps),
+        'warnings': warnings_sent,
+        'stops': stops,
+        'false_stops': false_stops,
+        'false_stop_rate': round(false_stops / stops, 4) if stops else 0.0,
+        'instances_stopped_at_end': int(np.count_nonzero(still_stopped)),
+        'saved_instance_hours': round(saved_hours, 1),
+        'saved_fraction': round(saved_hours / (instance_count * history.hours()), 4) if instance_count else 0.0,
+    }
+
+
+def candidate_policies(args):
+    """
+    Policy engines to compare: the current one first, then --policy entries, then one
+    candidate per --sweep value. Candidates change the default; tag overrides are kept.
+    """
+    config = IdlePolicyEngine.config_from_environment() or {}
+    current = IdlePolicyEngine(config)
+
+    def candidate(override):
+        return IdlePolicyEngine({**config, 'default': merge_policy(current.default, override)})
+
+    candidates = [('current', current)]
+    for entry in args.policy:
+        name, _, spec = entry.partition('=')
+        if spec.startswith('@'):
+            with open(spec[1:]) as f:
+                override = json.load(f)
+        else:
+            override = json.loads(spec)
+        candidates.append((name, candidate(override)))
+    for entry in args.sweep:
+        metric_name, _, thresholds = entry.partition('=')
+        for threshold in thresholds.split(','):
+            override = {'metrics': {metric_name: {'threshold': float(threshold)}}}
+            candidates.append((f"{metric_name}={threshold}", candidate(override)))
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest idle-detection policies against exported metric history')
+    parser.add_argument('history', help='CSV (optionally .gz) or Parquet export, one row per resource/metric/timestamp')
+    parser.add_argument('--policy', action='append', default=[], metavar='NAME=JSON|@FILE',
+                        help='Candidate policy: overrides applied to the current policy (repeatable)')
+    parser.add_argument('--sweep', action='append', default=[], metavar='METRIC=T1,T2,...',
+                        help='One candidate per threshold for a metric, e.g. CPUUtilization=1,3,5 (repeatable)')
+    parser.add_argument('--tags', metavar='FILE',
+                        help='JSON object of instance id to tags, used to resolve tag overrides in the policy')
+    parser.add_argument('--run-interval-minutes', type=int, default=15, help='Schedule of the Lambda')
+    parser.add_argument('--grace-minutes', type=int, default=15, help='Time between warning and stop')
+    parser.add_argument('--false-stop-minutes', type=int, default=60,
+                        help='A stop is false when activity resumes within this many minutes')
+    parser.add_argument('--report', help='Write the JSON report to this path')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    history = MetricHistory.load(args.history)
+    load_seconds = time.perf_counter() - started
+    print(f"Loaded {len(history.instance_ids)} instances, {len(history.volume_ids)} volumes, "
+          f"{history.hours():.0f} hours of history in {load_seconds:.2f}s")
+
+    tags = {}
+    if args.tags:
+        with open(args.tags) as f:
+            tags = json.load(f)
+    candidates = candidate_policies(args)
+    if candidates[0][1].overrides and not args.tags:
+        print("WARNING: the policy has tag overrides but no --tags were given; "
+              "every instance is scored with the default policy")
+
+    report = {
+        'history': args.history,
+        'instances': len(history.instance_ids),
+        'volumes': len(history.volume_ids),
+        'hours': round(history.hours(), 1),
+        'tags': args.tags,
+        'policies': []
+    }
+    print(f"{'policy':<28}{'warnings':>10}{'stops':>8}{'false':>8}{'false %':>9}{'saved h':>11}{'saved %':>9}")
+    for name, engine in candidates:
+        started = time.perf_counter()
+        policy_indexes = history.policy_indexes(engine, tags)
+        summary = replay(history, engine, policy_indexes, args.run_interval_minutes, args.grace_minutes,
+                         args.false_stop_minutes)
+        summary['replay_seconds'] = round(time.perf_counter() - started, 3)
+        # Instances scored with each policy: default first, then the overrides in order
+        summary['instances_per_policy'] = np.bincount(policy_indexes, minlength=len(engine.policies)).tolist()
+        report['policies'].append({'name': name, 'policy': engine.default,
+                                   'overrides': engine.policies[1:], **summary})
+        print(f"{name:<28}{summary['warnings']:>10}{summary['stops']:>8}{summary['false_stops']:>8}"
+              f"{summary['false_stop_rate'] * 100:>8.1f}%{summary['saved_instance_hours']:>11.1f}"
+              f"{summary['saved_fraction'] * 100:>8.1f}%")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,424 @@
 import boto3
+import botocore.session
+import fnmatch
+import gzip
+import hashlib
+import io
 import json
 import os
-from datetime import datetime, timedelta
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from html import escape
+from string import Template
+import warnings
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import ClientError
 
+try:
+    import numpy as np
+except ImportError:
+    # numpy is not part of the Lambda Python runtime; without a layer the policy engine falls back to pure Python
+    np = None
+
+# CloudWatch GetMetricData accepts at most 500 queries per request
+GET_METRIC_DATA_MAX_QUERIES = 500
+METRIC_PERIOD_SECONDS = 300
+METRIC_LOOKBACK_MINUTES = 70
+DESCRIBE_INSTANCES_PAGE_SIZE = 1000
+# Due stops are sent in multi-instance StopInstances calls of this many ids
+STOP_INSTANCES_CHUNK_SIZE = int(os.environ.get('STOP_INSTANCES_CHUNK_SIZE', '50'))
+# Optional pass confirming stopped instances report stopping/stopped (describe attempts, seconds between them)
+VERIFY_STOPS = os.environ.get('VERIFY_STOPS', 'false').lower() == 'true'
+VERIFY_STOPS_ATTEMPTS = int(os.environ.get('VERIFY_STOPS_ATTEMPTS', '3'))
+VERIFY_STOPS_DELAY_SECONDS = float(os.environ.get('VERIFY_STOPS_DELAY_SECONDS', '5'))
+
+# Rolling metric windows cached in S3 between runs (disabled unless a bucket is set)
+METRIC_CACHE_BUCKET = os.environ.get('METRIC_CACHE_BUCKET')
+METRIC_CACHE_PREFIX = os.environ.get('METRIC_CACHE_PREFIX', 'ec2-auto-shutdown/metric-cache/')
+# Re-fetch this much of the cached window: CloudWatch datapoints can arrive a few minutes late
+METRIC_CACHE_OVERLAP_MINUTES = int(os.environ.get('METRIC_CACHE_OVERLAP_MINUTES', '10'))
+DYNAMODB_BATCH_GET_MAX_KEYS = 100
+
+# Notification settings
+SES_REGION = 'us-east-1'
+DEFAULT_RECIPIENTS = [
+    address.strip()
+    for address in os.environ.get('NOTIFY_DEFAULT_RECIPIENTS', 'your_name@your_company.com').split(',')
+    if address.strip()
+]
+OWNER_TAG_KEY = os.environ.get('OWNER_TAG_KEY', 'Owner')
+SES_MAX_SEND_RATE = float(os.environ.get('SES_MAX_SEND_RATE', '0'))
+NOTIFY_WORKERS = int(os.environ.get('NOTIFY_WORKERS', '4'))
+
+# Time budget: stop scheduling work once this much of the invocation is left,
+# checkpoint the remainder and continue in a new asynchronous invocation
+TIME_BUDGET_RESERVE_SECONDS = int(os.environ.get('TIME_BUDGET_RESERVE_SECONDS', '60'))
+# Metric collection stops this much earlier, leaving time to process the instances it collected
+METRIC_COLLECTION_RESERVE_SECONDS = int(os.environ.get('METRIC_COLLECTION_RESERVE_SECONDS', '60'))
+MAX_CONTINUATIONS = int(os.environ.get('MAX_CONTINUATIONS', '10'))
+
+# Logging and run metrics (CloudWatch Embedded Metric Format)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+EMIT_METRICS = os.environ.get('EMIT_METRICS', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'EC2AutoShutdown')
+THROTTLING_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled', 'RequestThrottledException',
+    'RequestLimitExceeded', 'TooManyRequestsException', 'ProvisionedThroughputExceededException',
+    'SlowDown', 'PriorRequestNotComplete'
+}
+
+# Client-side rate limits (requests/second) shared by every client of a service in a region.
+# Throttling halves a limiter's rate; successful calls bring it back up to the configured limit.
+API_RATE_LIMITS = {
+    'cloudwatch': 20, 'ec2': 20, 'dynamodb': 50, 'sts': 10, 'ses': 14, 's3': 50, 'lambda': 10,
+    **json.loads(os.environ.get('API_RATE_LIMITS', '{}'))
+}
+DEFAULT_API_RATE_LIMIT = 10
+# botocore standard retry mode: exponential backoff with full jitter, retried on throttling
+CLIENT_CONFIG = Config(retries={'mode': 'standard', 'max_attempts': int(os.environ.get('API_MAX_ATTEMPTS', '8'))})
+
+# Module-level caches survive across warm invocations of the same container.
+# boto3 sessions are not thread-safe, so sessions and clients are created under a lock.
+# STS round-trips happen outside it, serialized only per role (role_session_locks).
+client_creation_lock = threading.RLock()
+role_sessions = {}
+role_session_locks = {}
+client_cache = {}
+resource_cache = threading.local()
+client_event_hooks = []
+rate_limiters = {}
+
+def register_client_hook(event_name, handler):
+    """Register a botocore event handler on every cached and future client"""
+    with client_creation_lock:
+        client_event_hooks.append((event_name, handler))
+        for client in client_cache.values():
+            client.meta.events.register(event_name, handler)
+
+def apply_client_hooks(client):
+    """Attach the rate limiter and registered event hooks to a newly created client"""
+    # The limiter goes first so no other before-send handler runs ahead of it
+    get_rate_limiter(client.meta.service_model.service_name, client.meta.region_name).attach(client)
+    for event_name, handler in client_event_hooks:
+        client.meta.events.register(event_name, handler)
+    return client
+
+def get_role_session(role_arn, session_name):
+    """Return a cached boto3 session whose credentials re-assume role_arn before they expire"""
+    if not role_arn:
+        return boto3.DEFAULT_SESSION or boto3.Session()
+    
+    session = role_sessions.get(role_arn)
+    if session is not None:
+        return session
+    
+    with client_creation_lock:
+        role_lock = role_session_locks.setdefault(role_arn, threading.Lock())
+    # Targets assume their roles concurrently; only callers for the same role wait on each other
+    with role_lock:
+        session = role_sessions.get(role_arn)
+        if session is not None:
+            return session
+        
+        def refresh():
+            credentials = assume_role(role_arn, session_name)
+            return {
+                'access_key': credentials['AccessKeyId'],
+                'secret_key': credentials['SecretAccessKey'],
+                'token': credentials['SessionToken'],
+                'expiry_time': credentials['Expiration'].isoformat()
+            }
+        
+        metadata = refresh()
+        with client_creation_lock:
+            botocore_session = botocore.session.get_session()
+            botocore_session._credentials = RefreshableCredentials.create_from_metadata(
+                metadata=metadata,
+                refresh_using=refresh,
+                method='sts-assume-role'
+            )
+            session = boto3.Session(botocore_session=botocore_session)
+            role_sessions[role_arn] = session
+        return session
+
+def get_client(service_name, region_name=None, role_arn=None, session_name='EC2AutoShutdownSession'):
+    """Return a cached client for (service, region, role); role_arn=None uses the Lambda's own role"""
+    key = (service_name, region_name, role_arn)
+    client = client_cache.get(key)
+    if client is not None:
+        return client
+    
+    # Assumes the role (an STS call) before taking the process-wide lock
+    session = get_role_session(role_arn, session_name) if role_arn else None
+    with client_creation_lock:
+        if key not in client_cache:
+            if session is not None:
+                client = session.client(service_name, region_name=region_name, config=CLIENT_CONFIG)
+            else:
+                client = boto3.client(service_name, region_name=region_name, config=CLIENT_CONFIG)
+            client_cache[key] = apply_client_hooks(client)
+        return client_cache[key]
+
+def get_resource(service_name, region_name=None):
+    """Return a boto3 resource for the Lambda's own role, cached per thread (resources are not thread-safe)"""
+    resources = resource_cache.__dict__.setdefault('resources', {})
+    key = (service_name, region_name)
+    if key not in resources:
+        with client_creation_lock:
+            resource = boto3.resource(service_name, region_name=region_name, config=CLIENT_CONFIG)
+            apply_client_hooks(resource.meta.client)
+        resources[key] = resource
+    return resources[key]
+
+def is_throttling_error(error_code):
+    return error_code in THROTTLING_ERROR_CODES
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by all clients of one service and region; the rate adapts to throttling (AIMD)"""
+
+    def __init__(self, max_rate, min_rate=0.5):
+        self.max_rate = float(max_rate)
+        self.min_rate = min(min_rate, self.max_rate)
+        self.rate = self.max_rate
+        self.burst = max(1.0, self.max_rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.throttles = 0
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take one token, sleeping until it is available; returns the seconds waited"""
+        with self.lock:
+            self.refill()
+            # Reserve the token now so concurrent callers queue up behind each other
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_throttle(self):
+        with self.lock:
+            self.refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.throttles += 1
+
+    def on_success(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def attach(self, client):
+        # before-send fires once per HTTP attempt, so botocore's retries take tokens too
+        client.meta.events.register('before-send', self.before_send)
+        client.meta.events.register('needs-retry', self.needs_retry)
+        client.meta.events.register('after-call', self.after_call)
+
+    def before_send(self, **kwargs):
+        wait = self.acquire()
+        if wait > 0:
+            run_metrics.add_phase_time('rate_limit_wait', wait * 1000)
+
+    def needs_retry(self, response=None, **kwargs):
+        # Once per attempt: throttles absorbed by botocore's jittered retries still slow the bucket down
+        if response and is_throttling_error(response[1].get('Error', {}).get('Code')):
+            self.on_throttle()
+        return None
+
+    def after_call(self, http_response, parsed, **kwargs):
+        # Throttled attempts, the last one included, were already counted by needs_retry
+        if http_response.status_code < 300:
+            self.on_success()
+
+def get_rate_limiter(service_name, region_name):
+    """Limiter for (service, region), created on first use with the API_RATE_LIMITS rate"""
+    key = (service_name, region_name)
+    with client_creation_lock:
+        if key not in rate_limiters:
+            rate_limiters[key] = AdaptiveRateLimiter(API_RATE_LIMITS.get(service_name, DEFAULT_API_RATE_LIMIT))
+        return rate_limiters[key]
+
+class RunMetrics:
+    """Per-invocation AWS API call statistics and phase timings, collected through botocore events"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new invocation (the module-level instance outlives warm invocations)"""
+        with self.lock:
+            self.started = time.perf_counter()
+            self.operations = {}
+            self.phases = {}
+
+    def operation(self, service_name, operation_name):
+        key = (service_name, operation_name)
+        if key not in self.operations:
+            self.operations[key] = {
+                'calls': 0, 'errors': 0, 'throttles': 0, 'retries': 0, 'latency_ms': 0.0, 'max_latency_ms': 0.0
+            }
+        return self.operations[key]
+
+    def before_call(self, model, context, **kwargs):
+        context['run_metrics_started'] = time.perf_counter()
+        # after-call-error only passes the exception and the context
+        context['run_metrics_operation'] = (model.service_model.service_name, model.name)
+
+    def after_call(self, http_response, parsed, model, context, **kwargs):
+        latency_ms = (time.perf_counter() - context.get('run_metrics_started', time.perf_counter())) * 1000
+        error_code = parsed.get('Error', {}).get('Code') if http_response.status_code >= 300 else None
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        self.record(model.service_model.service_name, model.name, latency_ms, error_code, retries)
+
+    def after_call_error(self, context, **kwargs):
+        # Connection-level failures never produce a parsed response
+        if 'run_metrics_operation' not in context:
+            return
+        latency_ms = (time.perf_counter() - context.get('run_metrics_started', time.perf_counter())) * 1000
+        self.record(*context['run_metrics_operation'], latency_ms, 'ConnectionError', 0)
+
+    def needs_retry(self, response=None, operation=None, **kwargs):
+        # Called once per attempt, so throttles that a later retry absorbed are still counted
+        if not response or operation is None:
+            return None
+        if is_throttling_error(response[1].get('Error', {}).get('Code')):
+            with self.lock:
+                self.operation(operation.service_model.service_name, operation.name)['throttles'] += 1
+        return None
+
+    def record(self, service_name, operation_name, latency_ms, error_code=None, retries=0):
+        with self.lock:
+            stats = self.operation(service_name, operation_name)
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['latency_ms'] += latency_ms
+            stats['max_latency_ms'] = max(stats['max_latency_ms'], latency_ms)
+            if error_code:
+                stats['errors'] += 1
+
+    @contextmanager
+    def phase(self, name):
+        """Accumulate time spent in a phase; parallel targets add up, so phases can exceed wall time"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, (time.perf_counter() - started) * 1000)
+
+    def add_phase_time(self, name, elapsed_ms):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    def summary(self):
+        """Plain-dict view of the invocation's metrics"""
+        with self.lock:
+            operations = {
+                f"{service}.{operation}": dict(stats)
+                for (service, operation), stats in sorted(self.operations.items())
+            }
+            phases = {name: round(ms, 1) for name, ms in self.phases.items()}
+        for stats in operations.values():
+            stats['latency_ms'] = round(stats['latency_ms'], 1)
+            stats['max_latency_ms'] = round(stats['max_latency_ms'], 1)
+        return {
+            'duration_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'api_calls': sum(stats['calls'] for stats in operations.values()),
+            'api_errors': sum(stats['errors'] for stats in operations.values()),
+            'api_throttles': sum(stats['throttles'] for stats in operations.values()),
+            'api_retries': sum(stats['retries'] for stats in operations.values()),
+            'operations': operations,
+            'phases_ms': phases
+        }
+
+    def emf_documents(self, function_name, results):
+        """CloudWatch Embedded Metric Format documents: one per run, per phase and per API operation"""
+        summary = self.summary()
+        timestamp = int(time.time() * 1000)
+
+        def document(dimensions, metrics, values):
+            return {
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': METRICS_NAMESPACE,
+                        'Dimensions': [list(dimensions)],
+                        'Metrics': [{'Name': name, 'Unit': unit} for name, unit in metrics]
+                    }]
+                },
+                **dimensions,
+                **values
+            }
+
+        documents = [document(
+            {'FunctionName': function_name},
+            [('RunDuration', 'Milliseconds'), ('CheckedInstances', 'Count'), ('WarningsSent', 'Count'),
+             ('InstancesStopped', 'Count'), ('InstancesDeferred', 'Count'), ('InstancesUndecided', 'Count'),
+             ('RunErrors', 'Count'),
+             ('ApiCalls', 'Count'), ('ApiErrors', 'Count'), ('ApiThrottles', 'Count'), ('ApiRetries', 'Count')],
+            {
+                'RunDuration': summary['duration_ms'],
+                'CheckedInstances': results['checked_instances'],
+                'WarningsSent': results['warnings_sent'],
+                'InstancesStopped': results['instances_stopped'],
+                'InstancesDeferred': results.get('instances_deferred', 0),
+                'InstancesUndecided': results['instances_undecided'],
+                'RunErrors': len(results['errors']),
+                'ApiCalls': summary['api_calls'],
+                'ApiErrors': summary['api_errors'],
+                'ApiThrottles': summary['api_throttles'],
+                'ApiRetries': summary['api_retries']
+            }
+        )]
+        for name, elapsed_ms in summary['phases_ms'].items():
+            documents.append(document(
+                {'FunctionName': function_name, 'Phase': name},
+                [('PhaseDuration', 'Milliseconds')],
+                {'PhaseDuration': elapsed_ms}
+            ))
+        for name, stats in summary['operations'].items():
+            documents.append(document(
+                {'FunctionName': function_name, 'Operation': name},
+                [('Calls', 'Count'), ('Errors', 'Count'), ('Throttles', 'Count'), ('Retries', 'Count'),
+                 ('Latency', 'Milliseconds'), ('MaxLatency', 'Milliseconds')],
+                {
+                    'Calls': stats['calls'],
+                    'Errors': stats['errors'],
+                    'Throttles': stats['throttles'],
+                    'Retries': stats['retries'],
+                    'Latency': round(stats['latency_ms'] / max(stats['calls'], 1), 1),
+                    'MaxLatency': stats['max_latency_ms']
+                }
+            ))
+        return documents
+
+run_metrics = RunMetrics()
+# Registered at import so these run before any other before-call handler can short-circuit the request
+register_client_hook('before-call', run_metrics.before_call)
+register_client_hook('after-call', run_metrics.after_call)
+register_client_hook('after-call-error', run_metrics.after_call_error)
+register_client_hook('needs-retry', run_metrics.needs_retry)
+
+def debug_enabled():
+    """Per-metric and per-volume detail is only printed at LOG_LEVEL=DEBUG"""
+    return LOG_LEVEL == 'DEBUG'
+
 def assume_role(role_arn, session_name, duration_seconds=3600, validate_credentials=True):
     """Assume IAM role and return credentials"""
     try:
-        sts_client = boto3.client('sts')
+        sts_client = get_client('sts')
         response = sts_client.assume_role(
             RoleArn=role_arn,
             RoleSessionName=session_name,
@@ -18,28 +429,16 @@ def assume_role(role_arn, session_name, duration_seconds=3600, validate_credenti
         print(f"Failed to assume role {role_arn}: {e}")
         raise
 
-def send_email_SES(html_body, ses_role_arn, instance_id):
+def send_email_SES(html_body, ses_role_arn, subject, recipients=None):
     """Send email using SES with assumed role"""
     try:
-        # Assume role for SES
-        credentials_ses = assume_role(
-            ses_role_arn,
-            session_name="SESSendEmailSession",
-            duration_seconds=3600
-        )
-        
-        AWS_REGION = 'us-east-1'
+        AWS_REGION = SES_REGION
         SENDER_EMAIL = 'DevOps_Automation <noreply@your_company.com>'
-        RECIPIENT_EMAIL = ['your_name@your_company.com']
-        SUBJECT = f'[Automation] EC2 Found idle in AWS - Instance {instance_id}'
-        
-        ses_client = boto3.client(
-            'ses',
-            region_name=AWS_REGION,
-            aws_access_key_id=credentials_ses['AccessKeyId'],
-            aws_secret_access_key=credentials_ses['SecretAccessKey'],
-            aws_session_token=credentials_ses['SessionToken']
-        )
+        RECIPIENT_EMAIL = recipients or DEFAULT_RECIPIENTS
+        SUBJECT = subject
+        
+        # Cached client for the SES role; credentials refresh before expiry
+        ses_client = get_client('ses', AWS_REGION, ses_role_arn, session_name="SESSendEmailSession")
 
         response = ses_client.send_email(
             Destination={'ToAddresses': RECIPIENT_EMAIL},
@@ -63,6 +462,209 @@ def send_email_SES(html_body, ses_role_arn, instance_id):
         print("Email sending failed:", e)
         return False
 
+# Digest templates are compiled once per container, not rendered from f-strings per instance
+DIGEST_TEMPLATE = Template("""
+        <html>
+        <head>
+            <style>
+                body { font-family: Arial, sans-serif; }
+                .header { font-size: 18px; font-weight: bold; }
+                .warning-header { color: #ff6600; }
+                .stop-header { color: #cc0000; }
+                table { border-collapse: collapse; margin-bottom: 15px; }
+                th, td { border: 1px solid #ddd; padding: 6px 10px; text-align: left; }
+                th { background-color: #f5f5f5; }
+                .warning { color: #cc0000; font-weight: bold; }
+            </style>
+        </head>
+        <body>
+            $warning_section
+            $stop_section
+            <p>This is an automated message from EC2 Auto-Shutdown System.</p>
+        </body>
+        </html>
+""")
+
+WARNING_SECTION_TEMPLATE = Template("""
+            <div class="header warning-header">🚨 EC2 Instance Auto-Stop Warning ($count)</div>
+            <p>The following EC2 instances have been detected as inactive and will be automatically stopped in 15 minutes.</p>
+            <table>
+                <tr><th>Name</th><th>ID</th><th>Region</th><th>Detection Time</th><th>Scheduled Stop</th><th>Console</th></tr>
+                $rows
+            </table>
+            <p class="warning">⚠️ To prevent shutdown, simply use the instance (SSH/RDP or run commands) to generate activity.</p>
+""")
+
+STOP_SECTION_TEMPLATE = Template("""
+            <div class="header stop-header">🛑 EC2 Instances Stopped ($count)</div>
+            <p>The following EC2 instances have been stopped after remaining inactive for 75+ minutes total.
+            You can start them again when needed from the AWS Console.</p>
+            <table>
+                <tr><th>Name</th><th>ID</th><th>Region</th><th>Stop Time</th><th>Console</th></tr>
+                $rows
+            </table>
+""")
+
+WARNING_ROW_TEMPLATE = Template(
+    '<tr><td>$name</td><td>$instance_id</td><td>$region</td><td>$detected</td><td>$scheduled_stop</td>'
+    '<td><a href="$console_url">View</a></td></tr>'
+)
+
+STOP_ROW_TEMPLATE = Template(
+    '<tr><td>$name</td><td>$instance_id</td><td>$region</td><td>$stopped</td>'
+    '<td><a href="$console_url">View</a></td></tr>'
+)
+
+class NotificationDigest:
+    """Collect warnings and stops during a sweep and send one digest email per recipient"""
+    
+    def __init__(self, ses_role_arn, owner_tag_key=OWNER_TAG_KEY):
+        self.ses_role_arn = ses_role_arn
+        self.owner_tag_key = owner_tag_key
+        self.entries = {}
+        self.lock = threading.Lock()
+    
+    def recipients_for(self, instance):
+        """Owner tag value when it is an email address, otherwise the default recipients"""
+        for tag in instance.get('Tags', []):
+            if tag['Key'] == self.owner_tag_key and '@' in tag['Value']:
+                return (tag['Value'].strip(),)
+        return tuple(DEFAULT_RECIPIENTS)
+    
+    def add(self, kind, instance, region):
+        """Queue a 'warning' or 'stop' entry for the instance's recipients"""
+        now = datetime.now()
+        entry = {
+            'name': escape(instance['Name']),
+            'instance_id': instance['InstanceId'],
+            'region': region,
+            'console_url': (f"https://{region}.console.aws.amazon.com/ec2/home?region={region}"
+                            f"#InstanceDetails:instanceId={instance['InstanceId']}"),
+            'detected': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'scheduled_stop': (now + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S'),
+            'stopped': now.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with self.lock:
+            digest = self.entries.setdefault(self.recipients_for(instance), {'warning': [], 'stop': []})
+            digest[kind].append(entry)
+    
+    def add_warning(self, instance, region):
+        self.add('warning', instance, region)
+    
+    def add_stop(self, instance, region):
+        self.add('stop', instance, region)
+    
+    def render(self, digest):
+        """Render one recipient's digest from the precompiled templates"""
+        warning_section = ''
+        stop_section = ''
+        if digest['warning']:
+            rows = '\n'.join(WARNING_ROW_TEMPLATE.substitute(entry) for entry in digest['warning'])
+            warning_section = WARNING_SECTION_TEMPLATE.substitute(count=len(digest['warning']), rows=rows)
+        if digest['stop']:
+            rows = '\n'.join(STOP_ROW_TEMPLATE.substitute(entry) for entry in digest['stop'])
+            stop_section = STOP_SECTION_TEMPLATE.substitute(count=len(digest['stop']), rows=rows)
+        return DIGEST_TEMPLATE.substitute(warning_section=warning_section, stop_section=stop_section)
+    
+    def subject(self, digest):
+        parts = []
+        if digest['warning']:
+            parts.append(f"{len(digest['warning'])} idle instance(s) will be stopped")
+        if digest['stop']:
+            parts.append(f"{len(digest['stop'])} instance(s) stopped")
+        return f"[Automation] EC2 Found idle in AWS - {', '.join(parts)}"
+    
+    def max_send_rate(self):
+        """SES account send rate (emails/second), falling back to SES_MAX_SEND_RATE"""
+        if SES_MAX_SEND_RATE > 0:
+            return SES_MAX_SEND_RATE
+        try:
+            ses_client = get_client('ses', SES_REGION, self.ses_role_arn, session_name="SESSendEmailSession")
+            return max(ses_client.get_send_quota()['MaxSendRate'], 1.0)
+        except Exception as e:
+            print(f"Could not read SES send quota, assuming 1 email/second: {e}")
+            return 1.0
+    
+    def send(self, max_workers=NOTIFY_WORKERS):
+        """Send all digests concurrently within the SES send rate; returns a delivery summary"""
+        with self.lock:
+            digests = list(self.entries.items())
+            self.entries = {}
+        
+        summary = {'digests_sent': 0, 'warnings_delivered': 0, 'stops_delivered': 0, 'errors': []}
+        if not digests:
+            return summary
+        
+        interval = 1.0 / self.max_send_rate()
+        slot_lock = threading.Lock()
+        next_slot = [time.monotonic()]
+        
+        def send_one(item):
+            recipients, digest = item
+            # Space sends out so the whole pool stays within the SES send rate
+            with slot_lock:
+                now = time.monotonic()
+                slot = max(now, next_slot[0])
+                next_slot[0] = slot + interval
+            if slot > now:
+                time.sleep(slot - now)
+            return send_email_SES(self.render(digest), self.ses_role_arn, self.subject(digest), list(recipients))
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(digests)))) as executor:
+            for (recipients, digest), sent in zip(digests, executor.map(send_one, digests)):
+                if sent:
+                    summary['digests_sent'] += 1
+                    summary['warnings_delivered'] += len(digest['warning'])
+                    summary['stops_delivered'] += len(digest['stop'])
+                else:
+                    summary['errors'].append(
+                        f"Failed to send digest to {', '.join(recipients)} "
+                        f"({len(digest['warning'])} warning(s), {len(digest['stop'])} stop(s))"
+                    )
+        print(f"Sent {summary['digests_sent']}/{len(digests)} notification digest(s)")
+        return summary
+
+class ThreadLocalStdout:
+    """sys.stdout proxy that lets worker threads capture their own print output"""
+    
+    def __init__(self):
+        self.local = threading.local()
+        self.stream = sys.stdout
+    
+    def write(self, text):
+        target = getattr(self.local, 'buffer', None) or self.stream
+        return target.write(text)
+    
+    def flush(self):
+        target = getattr(self.local, 'buffer', None) or self.stream
+        target.flush()
+    
+    @contextmanager
+    def installed(self):
+        """Route sys.stdout through this proxy for the duration of a worker pool"""
+        if sys.stdout is self:
+            # Nested pool (e.g. instance workers inside a sweep target)
+            yield self
+            return
+        self.stream = sys.stdout
+        sys.stdout = self
+        try:
+            yield self
+        finally:
+            sys.stdout = self.stream
+    
+    @contextmanager
+    def capture(self, buffer):
+        """Send the current thread's output to buffer"""
+        self.local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self.local.buffer = None
+
+
+thread_stdout = ThreadLocalStdout()
+
 def format_bytes_to_readable(value_bytes):
     """Convert bytes to human readable format"""
     if value_bytes >= 1024 * 1024:
@@ -72,290 +674,746 @@ def format_bytes_to_readable(value_bytes):
     else:
         return f"{value_bytes:.0f} Bytes"
 
-class EC2AutoShutdown:
-    def __init__(self, monitoring_role_arn, ses_role_arn, region='us-west-2'):
-        self.region = region
-        self.monitoring_role_arn = monitoring_role_arn
-        self.ses_role_arn = ses_role_arn
-        self.ec2_client = None
-        self.cloudwatch_client = None
-        self.setup_clients()
-        
-    def setup_clients(self):
-        """Setup AWS clients with assumed role"""
-        credentials = assume_role(
-            self.monitoring_role_arn, 
-            "EC2MonitoringSession"
-        )
-        
-        self.ec2_client = boto3.client(
-            'ec2',
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken'],
-            region_name=self.region
-        )
-        
-        self.cloudwatch_client = boto3.client(
-            'cloudwatch',
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken'],
-            region_name=self.region
+def compile_tag_expression(expression):
+    """
+    Compile a tag expression into (server-side EC2 filters, client-side predicate).
+    
+    A plain mapping ANDs its keys; a list of values ORs them (EC2 wildcards allowed):
+        {"Environment": "Mainline", "System": ["Xbox", "PS*"]}
+    Mappings can be combined with {"all": [...]} (AND) and {"any": [...]} (OR).
+    """
+    if not isinstance(expression, dict):
+        raise ValueError(f"Tag expression must be a JSON object, got: {expression!r}")
+    
+    if set(expression) == {'all'}:
+        compiled = [compile_tag_expression(child) for child in expression['all']]
+        # Filters of every AND branch narrow the API query
+        filters = [f for child_filters, _ in compiled for f in child_filters]
+        predicates = [predicate for _, predicate in compiled]
+        return filters, lambda tags: all(predicate(tags) for predicate in predicates)
+    
+    if set(expression) == {'any'}:
+        compiled = [compile_tag_expression(child) for child in expression['any']]
+        predicates = [predicate for _, predicate in compiled]
+        # OR branches cannot be expressed as EC2 filters; match them client-side
+        return [], lambda tags: any(predicate(tags) for predicate in predicates)
+    
+    conditions = {
+        key: [str(v) for v in value] if isinstance(value, list) else [str(value)]
+        for key, value in expression.items()
+    }
+    filters = [{'Name': f'tag:{key}', 'Values': values} for key, values in conditions.items()]
+    
+    def predicate(tags):
+        return all(
+            key in tags and any(fnmatch.fnmatchcase(tags[key], value) for value in values)
+            for key, values in conditions.items()
         )
     
-    def get_instances_by_tags(self, tags):
-        """Get instances matching specific tags"""
-        filters = [
-            {'Name': 'instance-state-name', 'Values': ['running']}
+    return filters, predicate
+
+class MetricQueryError(Exception):
+    """Raised when a batched metric query returned no usable result"""
+
+    def __init__(self, message, throttled=False):
+        super().__init__(message)
+        # Throttled queries say nothing about the instance and must never count as low activity
+        self.throttled = throttled
+
+
+def epoch_seconds(timestamp):
+    """Epoch seconds for a CloudWatch timestamp; naive datetimes are UTC"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp())
+
+class MetricWindowCache:
+    """Recent datapoints per metric series from the previous run, kept as one gzip JSON object per target in S3"""
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self.series = {}
+        self.end_time = None
+        self.period = None
+        # Series in the loaded object that its run carried over without collecting them
+        self.carried = set()
+        self.updated = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_target(cls, role_arn, region, tags=None):
+        """
+        Cache for one sweep target, or None when METRIC_CACHE_BUCKET is not set. Targets in the same
+        account and region with other tags or roles run concurrently, so each gets its own object.
+        """
+        if not METRIC_CACHE_BUCKET:
+            return None
+        account = role_arn.split(':')[4] if role_arn else 'default'
+        scope = hashlib.sha256(json.dumps([role_arn, tags], sort_keys=True).encode()).hexdigest()[:16]
+        return cls(METRIC_CACHE_BUCKET, f"{METRIC_CACHE_PREFIX}{account}/{region}/{scope}.json.gz")
+
+    def load(self):
+        """Read the previous run's windows; a missing or unreadable object means a full fetch"""
+        try:
+            response = get_client('s3').get_object(Bucket=self.bucket, Key=self.key)
+            data = json.loads(gzip.decompress(response['Body'].read()))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                print(f"No metric cache at s3://{self.bucket}/{self.key} yet - fetching full windows")
+            else:
+                print(f"Could not read metric cache, fetching full windows: {e}")
+            return self
+        except Exception as e:
+            print(f"Could not read metric cache, fetching full windows: {e}")
+            return self
+        
+        if data.get('version') == 1:
+            self.end_time = data['end_time']
+            self.period = data['period']
+            self.series = {tuple(key.split('|', 1)): points for key, points in data['series'].items()}
+            self.carried = {tuple(key.split('|', 1)) for key in data.get('carried', [])}
+            print(f"Loaded metric cache with {len(self.series)} series")
+        return self
+
+    def delta_start(self, start_time, end_time, period):
+        """Start of the incremental fetch window, or None when the cache cannot cover this run"""
+        if self.end_time is None or self.period != period:
+            return None
+        delta_start = self.end_time - METRIC_CACHE_OVERLAP_MINUTES * 60
+        if delta_start <= epoch_seconds(start_time) or delta_start >= epoch_seconds(end_time):
+            return None
+        return datetime.fromtimestamp(delta_start, timezone.utc).replace(tzinfo=None)
+
+    def covers(self, key):
+        return key in self.series
+
+    def merge(self, key, fetched, delta_start, window_start):
+        """Cached points older than delta_start plus the freshly fetched points, trimmed to the window"""
+        cutoff = epoch_seconds(delta_start)
+        floor = epoch_seconds(window_start)
+        merged = {timestamp: value for timestamp, value in self.series.get(key, []) if floor <= timestamp < cutoff}
+        for timestamp, value in fetched:
+            merged[epoch_seconds(timestamp)] = value
+        return [
+            (datetime.fromtimestamp(timestamp, timezone.utc), value)
+            for timestamp, value in sorted(merged.items())
+            if timestamp >= floor
         ]
+
+    def update(self, key, points):
+        """Record a series' current window for the next run"""
+        with self.lock:
+            self.updated[key] = [[epoch_seconds(timestamp), value] for timestamp, value in points]
+
+    def save(self, start_time, end_time, period):
+        """
+        Write this run's windows merged into the loaded ones. A continuation only collects part of
+        the fleet, so series it did not collect are carried over from the loaded object, once: a
+        series carried before (e.g. a terminated instance) is dropped. While anything is carried,
+        end_time stays at the loaded end time so the next run fetches the gap for those series too.
+        """
+        with self.lock:
+            updated = dict(self.updated)
+        carried = {}
+        if self.end_time is not None and self.period == period and self.end_time > epoch_seconds(start_time):
+            carried = {
+                key: points for key, points in self.series.items()
+                if key not in updated and key not in self.carried
+            }
+        series = {f"{resource_id}|{metric_name}": points for (resource_id, metric_name), points in updated.items()}
+        series.update({f"{resource_id}|{metric_name}": points for (resource_id, metric_name), points in carried.items()})
+        body = json.dumps({
+            'version': 1,
+            'end_time': min(self.end_time, epoch_seconds(end_time)) if carried else epoch_seconds(end_time),
+            'period': period,
+            'series': series,
+            'carried': [f"{resource_id}|{metric_name}" for resource_id, metric_name in carried]
+        }, separators=(',', ':')).encode()
+        try:
+            get_client('s3').put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=gzip.compress(body),
+                ContentType='application/json',
+                ContentEncoding='gzip'
+            )
+            print(f"Saved metric cache with {len(series)} series ({len(carried)} carried over) "
+                  f"to s3://{self.bucket}/{self.key}")
+        except Exception as e:
+            print(f"Failed to save metric cache: {e}")
+
+class MetricDataCollector:
+    """Collect CloudWatch metrics for many resources with batched GetMetricData calls"""
+
+    def __init__(self, cloudwatch_client, start_time, end_time, period=METRIC_PERIOD_SECONDS, cache=None):
+        self.cloudwatch_client = cloudwatch_client
+        self.start_time = start_time
+        self.end_time = end_time
+        self.period = period
+        self.pending = []
+        self.query_keys = {}
+        self.queued = set()
+        self.results = {}
+        self.api_calls = 0
+        self.datapoints_fetched = 0
+        # Series found in the cache only fetch [delta_start, end_time) and are merged with the cached points
+        self.cache = cache
+        self.delta_start = cache.delta_start(start_time, end_time, period) if cache else None
+        self.delta_pending = []
+        self.delta_keys = set()
+
+    def add(self, namespace, metric_name, dimension_name, dimension_value, stat):
+        """Queue a metric query; it is sent once a full batch is pending or on flush()"""
+        key = (dimension_value, metric_name)
+        if key in self.queued:
+            return key
         
-        for key, value in tags.items():
-            filters.append({'Name': f'tag:{key}', 'Values': [value]})
+        # Query ids must start with a lowercase letter and be unique per request
+        query_id = f"q{len(self.query_keys)}"
+        self.query_keys[query_id] = key
+        self.queued.add(key)
+        pending = self.pending
+        if self.delta_start is not None and self.cache.covers(key):
+            pending = self.delta_pending
+            self.delta_keys.add(key)
+        pending.append({
+            'Id': query_id,
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': namespace,
+                    'MetricName': metric_name,
+                    'Dimensions': [{'Name': dimension_name, 'Value': dimension_value}]
+                },
+                'Period': self.period,
+                'Stat': stat
+            },
+            'ReturnData': True
+        })
+        
+        if len(pending) >= GET_METRIC_DATA_MAX_QUERIES:
+            self.flush()
+        return key
+    
+    def flush(self):
+        """Send all pending queries in chunks of up to 500"""
+        while self.pending:
+            batch = self.pending[:GET_METRIC_DATA_MAX_QUERIES]
+            self.pending = self.pending[GET_METRIC_DATA_MAX_QUERIES:]
+            self.fetch_batch(batch, self.start_time)
+        while self.delta_pending:
+            batch = self.delta_pending[:GET_METRIC_DATA_MAX_QUERIES]
+            self.delta_pending = self.delta_pending[GET_METRIC_DATA_MAX_QUERIES:]
+            self.fetch_batch(batch, self.delta_start)
+    
+    def fetch_batch(self, batch, start_time):
+        """Run one GetMetricData request (following NextToken) and map results back"""
+        stats = {query['Id']: query['MetricStat']['Stat'] for query in batch}
+        collected = {query_id: [] for query_id in stats}
+        failed = {}
         
         try:
-            response = self.ec2_client.describe_instances(Filters=filters)
-            instances = []
+            with run_metrics.phase('metric_fetch'):
+                self.fetch_pages(batch, start_time, collected, failed)
+        except Exception as e:
+            throttled = isinstance(e, ClientError) and is_throttling_error(e.response['Error']['Code'])
+            print(f"Error fetching batch of {len(batch)} metric queries: {e}")
+            for query_id in stats:
+                self.results[self.query_keys[query_id]] = MetricQueryError(str(e), throttled)
+            return
+        
+        for query_id, points in collected.items():
+            key = self.query_keys[query_id]
+            self.datapoints_fetched += len(points)
+            if query_id in failed:
+                self.results[key] = MetricQueryError(failed[query_id])
+                continue
+            if key in self.delta_keys:
+                points = self.cache.merge(key, points, self.delta_start, self.start_time)
+            if self.cache:
+                self.cache.update(key, points)
+            # Same shape as get_metric_statistics datapoints
+            stat = stats[query_id]
+            self.results[key] = [{'Timestamp': ts, stat: value} for ts, value in points]
+    
+    def fetch_pages(self, batch, start_time, collected, failed):
+        """Follow NextToken for one batch, filling collected points and failed query messages"""
+        kwargs = {
+            'MetricDataQueries': batch,
+            'StartTime': start_time,
+            'EndTime': self.end_time,
+            'ScanBy': 'TimestampAscending'
+        }
+        while True:
+            response = self.cloudwatch_client.get_metric_data(**kwargs)
+            self.api_calls += 1
             
-            for reservation in response['Reservations']:
-                for instance in reservation['Instances']:
-                    # Get EBS volume IDs for this instance
-                    volume_ids = []
-                    for block_device in instance.get('BlockDeviceMappings', []):
-                        if 'Ebs' in block_device:
-                            volume_ids.append(block_device['Ebs']['VolumeId'])
-                    
-                    instance_info = {
-                        'InstanceId': instance['InstanceId'],
-                        'InstanceType': instance['InstanceType'],
-                        'LaunchTime': instance['LaunchTime'],
-                        'Name': self.get_instance_name(instance),
-                        'Tags': instance.get('Tags', []),
-                        'VolumeIds': volume_ids
-                    }
-                    instances.append(instance_info)
+            for result in response.get('MetricDataResults', []):
+                query_id = result['Id']
+                if result.get('StatusCode') in ('InternalError', 'Forbidden'):
+                    messages = [m.get('Value', '') for m in result.get('Messages', [])]
+                    failed[query_id] = f"{result['StatusCode']}: {'; '.join(messages)}"
+                collected[query_id].extend(zip(result.get('Timestamps', []), result.get('Values', [])))
             
-            return instances
-        except Exception as e:
-            print(f"Error getting instances by tags: {e}")
-            return []
+            next_token = response.get('NextToken')
+            if not next_token:
+                break
+            kwargs['NextToken'] = next_token
     
-    def get_instance_name(self, instance):
-        """Extract instance name from tags"""
-        for tag in instance.get('Tags', []):
-            if tag['Key'] == 'Name':
-                return tag['Value']
-        return 'No-Name'
+    def datapoints(self, resource_id, metric_name):
+        """Return datapoints for a collected metric, raising if its query failed"""
+        key = (resource_id, metric_name)
+        if key not in self.results:
+            self.flush()
+        result = self.results.get(key)
+        if result is None:
+            raise MetricQueryError(f"No query was collected for {metric_name} of {resource_id}")
+        if isinstance(result, MetricQueryError):
+            raise result
+        return list(result)
+
+
+# Default idle policy: the original hard-coded rule (3 of 4 signals low over the last hour)
+DEFAULT_IDLE_POLICY = {
+    'lookback_minutes': METRIC_LOOKBACK_MINUTES,
+    'window_points': 12,
+    'min_low_score': 3,
+    'metrics': {
+        'CPUUtilization': {'threshold': 3.0, 'aggregation': 'average', 'weight': 1},
+        'NetworkIn': {'threshold': 10000, 'aggregation': 'average', 'weight': 1},
+        'NetworkOut': {'threshold': 10000, 'aggregation': 'average', 'weight': 1},
+        # A volume is active above the threshold (read + write); the signal is low when no volume is active
+        'EBSDiskActivity': {'threshold': 102400, 'aggregation': 'average', 'weight': 1}
+    }
+}
+
+INSTANCE_METRICS = ('CPUUtilization', 'NetworkIn', 'NetworkOut')
+
+def merge_policy(base, override):
+    """Return base with override applied; metric settings are merged per metric"""
+    merged = {key: value for key, value in base.items() if key != 'metrics'}
+    merged.update({key: value for key, value in override.items() if key != 'metrics'})
+    merged['metrics'] = {name: dict(settings) for name, settings in base['metrics'].items()}
+    for name, settings in override.get('metrics', {}).items():
+        if name not in merged['metrics']:
+            raise ValueError(f"Unknown metric in idle policy: {name}")
+        merged['metrics'][name].update(settings)
+    for name, settings in merged['metrics'].items():
+        aggregation = settings['aggregation']
+        if aggregation not in ('average', 'max', 'min') and not (
+                aggregation.startswith('p') and aggregation[1:].replace('.', '', 1).isdigit()):
+            raise ValueError(f"Unsupported aggregation '{aggregation}' for {name}")
+    return merged
+
+def percentile(values, q):
+    """Linear-interpolated percentile (same method as numpy's default)"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def aggregate_windows(windows, window_points, aggregation):
+    """
+    Aggregate the last window_points values of every series in one pass.
+    Returns one value per series; None/NaN marks a series without data.
+    """
+    if np is not None:
+        matrix = np.full((len(windows), window_points), np.nan)
+        for row, values in enumerate(windows):
+            if values:
+                tail = values[-window_points:]
+                matrix[row, window_points - len(tail):] = tail
+        with warnings.catch_warnings():
+            # All-NaN rows (no datapoints) legitimately aggregate to NaN
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            if aggregation == 'average':
+                return np.nanmean(matrix, axis=1)
+            if aggregation == 'max':
+                return np.nanmax(matrix, axis=1)
+            if aggregation == 'min':
+                return np.nanmin(matrix, axis=1)
+            return np.nanpercentile(matrix, float(aggregation[1:]), axis=1)
     
-    def calculate_average_from_datapoints(self, datapoints):
-        """Calculate average from CloudWatch datapoints"""
-        if not datapoints:
-            return None
-        
-        datapoints.sort(key=lambda x: x['Timestamp'])
-        last_hour_points = datapoints[-12:] if len(datapoints) >= 12 else datapoints
+    aggregated = []
+    for values in windows:
+        tail = values[-window_points:] if values else []
+        if not tail:
+            aggregated.append(None)
+        elif aggregation == 'average':
+            aggregated.append(sum(tail) / len(tail))
+        elif aggregation == 'max':
+            aggregated.append(max(tail))
+        elif aggregation == 'min':
+            aggregated.append(min(tail))
+        else:
+            aggregated.append(percentile(tail, float(aggregation[1:])))
+    return aggregated
+
+def is_missing(value):
+    return value is None or value != value
+
+class IdlePolicyEngine:
+    """Score the whole fleet against configurable idle policies"""
+    
+    def __init__(self, config=None):
+        config = config or {}
+        self.default = merge_policy(DEFAULT_IDLE_POLICY, config.get('default', {}))
+        self.overrides = []
+        for override in config.get('overrides', []):
+            _, matches = compile_tag_expression(override['tags'])
+            self.overrides.append((matches, merge_policy(self.default, override.get('policy', {}))))
+        self.policies = [self.default] + [policy for _, policy in self.overrides]
+    
+    @staticmethod
+    def config_from_environment():
+        """Policy config from IDLE_POLICY_FILE or IDLE_POLICY (JSON); None means the built-in rule"""
+        policy_file = os.environ.get('IDLE_POLICY_FILE')
+        if policy_file:
+            with open(policy_file) as f:
+                return json.load(f)
+        policy_json = os.environ.get('IDLE_POLICY')
+        return json.loads(policy_json) if policy_json else None
+    
+    @classmethod
+    def from_environment(cls):
+        """Load the policy from IDLE_POLICY_FILE or IDLE_POLICY (JSON); default is the built-in rule"""
+        return cls(cls.config_from_environment())
+    
+    def lookback_minutes(self):
+        return max(policy['lookback_minutes'] for policy in self.policies)
+    
+    def policy_for(self, instance):
+        """Index of the first override whose tag expression matches, else 0 (default)"""
+        tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+        for index, (matches, _) in enumerate(self.overrides, start=1):
+            if matches(tags):
+                return index
+        return 0
+    
+    def evaluate(self, instances, metric_data):
+        """Evaluate every instance; returns {instance_id: evaluation}"""
+        groups = {}
+        for instance in instances:
+            groups.setdefault(self.policy_for(instance), []).append(instance)
         
-        total = sum(point.get('Sum', 0) for point in last_hour_points)
-        return total / len(last_hour_points)
+        evaluations = {}
+        for policy_index, group in groups.items():
+            evaluations.update(self.evaluate_group(self.policies[policy_index], group, metric_data))
+        return evaluations
     
-    def check_ebs_metrics_detailed(self, volume_ids):
-        """Check EBS volume metrics with per-volume details - ANY volume active approach"""
-        if not volume_ids:
-            return {
-                'status': 'NO_VOLUMES', 
-                'value': 0, 
-                'is_low': True,
-                'volume_details': [],
-                'any_volume_active': False,
-                'active_volumes_count': 0
-            }
+    def load_windows(self, metric_data, resource_ids, metric_name, since=None):
+        """
+        Datapoint values (oldest first) per resource, None where the query failed, and the throttled rows.
+        With since (epoch seconds), older datapoints are dropped.
+        """
+        windows = []
+        throttled = set()
+        for row, resource_id in enumerate(resource_ids):
+            try:
+                points = metric_data.datapoints(resource_id, metric_name)
+            except MetricQueryError as e:
+                print(f"Error checking {metric_name} for {resource_id}: {e}")
+                windows.append(None)
+                if e.throttled:
+                    throttled.add(row)
+                continue
+            if since is not None:
+                points = [point for point in points if epoch_seconds(point['Timestamp']) >= since]
+            points.sort(key=lambda point: point['Timestamp'])
+            windows.append([value for point in points for key, value in point.items() if key != 'Timestamp'])
+        return windows, throttled
+    
+    def evaluate_group(self, policy, instances, metric_data):
+        """Vectorized evaluation of all instances sharing one policy"""
+        window_points = policy['window_points']
+        # Metrics are fetched for the longest lookback of any policy; each group only sees its own
+        since = epoch_seconds(metric_data.end_time) - policy['lookback_minutes'] * 60
+        instance_ids = [instance['InstanceId'] for instance in instances]
+        scores = [0.0] * len(instances)
+        # Weight of signals that could not be read because of throttling
+        unknown = [0.0] * len(instances)
+        per_instance = [{} for _ in instances]
         
-        total_read_bytes = 0
-        total_write_bytes = 0
-        volumes_with_data = 0
-        volume_details = []
-        any_volume_active = False
-        active_volumes_count = 0
+        for metric_name in INSTANCE_METRICS:
+            settings = policy['metrics'][metric_name]
+            windows, throttled = self.load_windows(metric_data, instance_ids, metric_name, since)
+            values = aggregate_windows(windows, window_points, settings['aggregation'])
+            for row, value in enumerate(values):
+                if row in throttled:
+                    status, value, is_low = 'THROTTLED', None, False
+                    unknown[row] += settings['weight']
+                elif windows[row] is None:
+                    status, value, is_low = 'ERROR', None, True
+                elif is_missing(value):
+                    status, value, is_low = 'NO_DATA', None, True
+                else:
+                    value = float(value)
+                    is_low = value < settings['threshold']
+                    status = 'LOW' if is_low else 'HIGH'
+                per_instance[row][metric_name] = {'status': status, 'value': value, 'is_low': is_low}
+                if is_low:
+                    scores[row] += settings['weight']
         
-        for volume_id in volume_ids:
-            try:
-                # Check VolumeReadBytes
-                read_response = self.cloudwatch_client.get_metric_statistics(
-                    Namespace='AWS/EBS',
-                    MetricName='VolumeReadBytes',
-                    Dimensions=[{'Name': 'VolumeId', 'Value': volume_id}],
-                    StartTime=datetime.utcnow() - timedelta(minutes=70),
-                    EndTime=datetime.utcnow(),
-                    Period=300,
-                    Statistics=['Sum']
-                )
-                
-                # Check VolumeWriteBytes
-                write_response = self.cloudwatch_client.get_metric_statistics(
-                    Namespace='AWS/EBS',
-                    MetricName='VolumeWriteBytes',
-                    Dimensions=[{'Name': 'VolumeId', 'Value': volume_id}],
-                    StartTime=datetime.utcnow() - timedelta(minutes=70),
-                    EndTime=datetime.utcnow(),
-                    Period=300,
-                    Statistics=['Sum']
-                )
-                
-                # Calculate averages for this volume
-                read_avg = self.calculate_average_from_datapoints(read_response['Datapoints'])
-                write_avg = self.calculate_average_from_datapoints(write_response['Datapoints'])
-                
-                read_avg = read_avg if read_avg else 0
-                write_avg = write_avg if write_avg else 0
-                
-                volume_activity = read_avg + write_avg
-                
-                # ANY VOLUME ACTIVE APPROACH: Consider volume active if > 100 KB/s
-                volume_is_active = volume_activity > 102400  # 100 KB threshold
-                
-                if volume_is_active:
-                    any_volume_active = True
-                    active_volumes_count += 1
-                
-                volume_info = {
-                    'volume_id': volume_id,
-                    'read_bytes': read_avg,
-                    'write_bytes': write_avg,
-                    'total_activity': volume_activity,
-                    'is_active': volume_is_active,
-                    'has_data': read_avg > 0 or write_avg > 0
-                }
-                volume_details.append(volume_info)
-                
-                # Add to totals for overall calculation (for display only)
-                total_read_bytes += read_avg
-                total_write_bytes += write_avg
-                
-                if volume_info['has_data']:
-                    volumes_with_data += 1
-                    
-            except Exception as e:
-                print(f"Error checking EBS metrics for volume {volume_id}: {e}")
-                # Mark volume as error but continue with others
-                volume_details.append({
+        # EBS: aggregate every volume of every instance at once, then fold back per instance
+        settings = policy['metrics']['EBSDiskActivity']
+        owners = []
+        volume_ids = []
+        for row, instance in enumerate(instances):
+            for volume_id in instance.get('VolumeIds', []):
+                owners.append(row)
+                volume_ids.append(volume_id)
+        
+        read_windows, read_throttled = self.load_windows(metric_data, volume_ids, 'VolumeReadBytes', since)
+        write_windows, write_throttled = self.load_windows(metric_data, volume_ids, 'VolumeWriteBytes', since)
+        reads = aggregate_windows(read_windows, window_points, settings['aggregation'])
+        writes = aggregate_windows(write_windows, window_points, settings['aggregation'])
+        
+        volume_details = [[] for _ in instances]
+        for index, volume_id in enumerate(volume_ids):
+            if read_windows[index] is None or write_windows[index] is None:
+                throttled = index in read_throttled or index in write_throttled
+                volume_details[owners[index]].append({
                     'volume_id': volume_id,
                     'read_bytes': 0,
                     'write_bytes': 0,
                     'total_activity': 0,
                     'is_active': False,
                     'has_data': False,
-                    'error': str(e)
+                    'throttled': throttled,
+                    'error': 'metric query throttled' if throttled else 'metric query failed'
                 })
                 continue
+            read = 0 if is_missing(reads[index]) else float(reads[index])
+            write = 0 if is_missing(writes[index]) else float(writes[index])
+            volume_details[owners[index]].append({
+                'volume_id': volume_id,
+                'read_bytes': read,
+                'write_bytes': write,
+                'total_activity': read + write,
+                'is_active': read + write > settings['threshold'],
+                'has_data': read > 0 or write > 0
+            })
         
-        # Calculate overall activity (for display purposes)
-        total_activity = total_read_bytes + total_write_bytes
-        avg_activity_per_volume = total_activity / len(volume_ids) if volume_ids else 0
-        
-        # ANY VOLUME ACTIVE APPROACH: Disk activity is LOW only if NO volumes are active
-        is_low_overall = not any_volume_active
+        evaluations = {}
+        for row, instance_id in enumerate(instance_ids):
+            details = volume_details[row]
+            active_count = sum(1 for volume in details if volume['is_active'])
+            if not details:
+                ebs_result = {
+                    'status': 'NO_VOLUMES',
+                    'value': 0,
+                    'is_low': True,
+                    'volume_details': [],
+                    'any_volume_active': False,
+                    'active_volumes_count': 0,
+                    'volume_count': 0
+                }
+            else:
+                total_read = sum(volume['read_bytes'] for volume in details)
+                total_write = sum(volume['write_bytes'] for volume in details)
+                # One active volume settles the signal; otherwise a throttled volume leaves it unknown
+                throttled = not active_count and any(volume.get('throttled') for volume in details)
+                ebs_result = {
+                    'status': 'HIGH' if active_count else 'THROTTLED' if throttled else 'LOW',
+                    'value': (total_read + total_write) / len(details),
+                    'is_low': not active_count and not throttled,
+                    'read_bytes': total_read,
+                    'write_bytes': total_write,
+                    'volume_count': len(details),
+                    'volumes_with_data': sum(1 for volume in details if volume['has_data']),
+                    'any_volume_active': active_count > 0,
+                    'active_volumes_count': active_count,
+                    'volume_details': details
+                }
+            per_instance[row]['EBSDiskActivity'] = ebs_result
+            if ebs_result['is_low']:
+                scores[row] += settings['weight']
+            elif ebs_result['status'] == 'THROTTLED':
+                unknown[row] += settings['weight']
+            
+            is_unused = scores[row] >= policy['min_low_score']
+            evaluations[instance_id] = {
+                'metric_results': per_instance[row],
+                'low_score': scores[row],
+                'is_unused': is_unused,
+                # Throttled signals could still reach the idle score: no decision either way this run
+                'undecided': not is_unused and scores[row] + unknown[row] >= policy['min_low_score'],
+                'policy': policy
+            }
+        return evaluations
+
+idle_policy_engine = None
+
+def get_idle_policy_engine():
+    """Idle policy loaded once per container"""
+    global idle_policy_engine
+    if idle_policy_engine is None:
+        idle_policy_engine = IdlePolicyEngine.from_environment()
+    return idle_policy_engine
+
+class EC2AutoShutdown:
+    def __init__(self, monitoring_role_arn, ses_role_arn, region='us-west-2'):
+        self.region = region
+        self.monitoring_role_arn = monitoring_role_arn
+        self.ses_role_arn = ses_role_arn
+        self.ec2_client = None
+        self.cloudwatch_client = None
+        self.metric_data = None
+        self.policy = get_idle_policy_engine()
+        self.evaluations = {}
+        self.setup_clients()
         
-        return {
-            'status': 'LOW' if is_low_overall else 'HIGH',
-            'value': avg_activity_per_volume,
-            'is_low': is_low_overall,
-            'read_bytes': total_read_bytes,
-            'write_bytes': total_write_bytes,
-            'volume_count': len(volume_ids),
-            'volumes_with_data': volumes_with_data,
-            'any_volume_active': any_volume_active,
-            'active_volumes_count': active_volumes_count,
-            'volume_details': volume_details
-        }
+    def setup_clients(self):
+        """Setup AWS clients with assumed role (cached across warm invocations)"""
+        self.ec2_client = get_client('ec2', self.region, self.monitoring_role_arn, "EC2MonitoringSession")
+        self.cloudwatch_client = get_client('cloudwatch', self.region, self.monitoring_role_arn, "EC2MonitoringSession")
     
-    def check_instance_metrics_with_details(self, instance_id, volume_ids):
-        """Check instance metrics and return detailed results"""
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(minutes=70)
+    def iter_instances(self, tag_expression):
+        """Yield running instances matching a tag expression, following every describe_instances page"""
+        server_filters, matches = compile_tag_expression(tag_expression)
+        filters = [{'Name': 'instance-state-name', 'Values': ['running']}] + server_filters
         
-        metrics_config = {
-            'CPUUtilization': {'threshold': 3.0, 'unit': '%'},
-            'NetworkIn': {'threshold': 10000, 'unit': 'Bytes'},
-            'NetworkOut': {'threshold': 10000, 'unit': 'Bytes'},
-        }
+        paginator = self.ec2_client.get_paginator('describe_instances')
+        pages = paginator.paginate(Filters=filters, PaginationConfig={'PageSize': DESCRIBE_INSTANCES_PAGE_SIZE})
         
-        metric_results = {}
-        low_activity_count = 0
+        try:
+            page_iterator = iter(pages)
+            while True:
+                # Only the page fetch counts as discovery; consumers run between pages
+                with run_metrics.phase('discovery'):
+                    page = next(page_iterator, None)
+                if page is None:
+                    break
+                for reservation in page['Reservations']:
+                    for instance in reservation['Instances']:
+                        tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+                        if not matches(tags):
+                            continue
+                        
+                        # Keep only the fields the sweep needs, not the full API response
+                        yield {
+                            'InstanceId': instance['InstanceId'],
+                            'InstanceType': instance['InstanceType'],
+                            'LaunchTime': instance['LaunchTime'],
+                            'Name': tags.get('Name', 'No-Name'),
+                            'Tags': instance.get('Tags', []),
+                            'VolumeIds': [
+                                block_device['Ebs']['VolumeId']
+                                for block_device in instance.get('BlockDeviceMappings', [])
+                                if 'Ebs' in block_device
+                            ]
+                        }
+        except Exception as e:
+            print(f"Error getting instances by tags: {e}")
+    
+    def get_instances_by_tags(self, tags):
+        """Get instances matching specific tags"""
+        return list(self.iter_instances(tags))
+    
+    def get_instance_name(self, instance):
+        """Extract instance name from tags"""
+        for tag in instance.get('Tags', []):
+            if tag['Key'] == 'Name':
+                return tag['Value']
+        return 'No-Name'
+    
+    def build_metric_collector(self, instances, seen=None, cache=None, budget=None, unreached=None):
+        """
+        Fetch CPU, network and EBS metrics for the given instances in batched GetMetricData calls.
+        With a budget, collection stops METRIC_COLLECTION_RESERVE_SECONDS before it runs out; the ids
+        of the remaining instances are only listed, into unreached, for a continuation.
+        """
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(minutes=self.policy.lookback_minutes())
+        collector = MetricDataCollector(self.cloudwatch_client, start_time, end_time, cache=cache)
         
-        # Check standard EC2 metrics
-        for metric_name, config in metrics_config.items():
-            try:
-                response = self.cloudwatch_client.get_metric_statistics(
-                    Namespace='AWS/EC2',
-                    MetricName=metric_name,
-                    Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-                    StartTime=start_time,
-                    EndTime=end_time,
-                    Period=300,
-                    Statistics=['Average']
-                )
-                
-                datapoints = response['Datapoints']
-                
-                if not datapoints:
-                    metric_results[metric_name] = {
-                        'status': 'NO_DATA',
-                        'value': None,
-                        'is_low': True
-                    }
-                    low_activity_count += 1
-                    continue
-                
-                datapoints.sort(key=lambda x: x['Timestamp'])
-                last_hour_points = datapoints[-12:] if len(datapoints) >= 12 else datapoints
-                
-                total = sum(point['Average'] for point in last_hour_points)
-                average = total / len(last_hour_points)
-                
-                is_low = average < config['threshold']
-                
-                metric_results[metric_name] = {
-                    'status': 'LOW' if is_low else 'HIGH',
-                    'value': average,
-                    'is_low': is_low
-                }
-                
-                if is_low:
-                    low_activity_count += 1
-                    
-            except Exception as e:
-                print(f"Error checking {metric_name} for {instance_id}: {e}")
-                metric_results[metric_name] = {
-                    'status': 'ERROR',
-                    'value': None,
-                    'is_low': True
-                }
-                low_activity_count += 1
+        collecting = True
+        # instances may be a generator: full batches are sent while discovery continues
+        for instance in instances:
+            if collecting and budget is not None and budget.exhausted(METRIC_COLLECTION_RESERVE_SECONDS):
+                print("Time budget nearly exhausted - listing the remaining instances without collecting metrics")
+                collecting = False
+            if not collecting:
+                if budget.exhausted():
+                    print("Time budget exhausted during discovery - undiscovered instances wait for the next "
+                          "scheduled run")
+                    break
+                if unreached is not None:
+                    unreached.append(instance['InstanceId'])
                 continue
+            if seen is not None:
+                seen.append(instance)
+            instance_id = instance.get('InstanceId')
+            if instance_id:
+                for metric_name in ('CPUUtilization', 'NetworkIn', 'NetworkOut'):
+                    collector.add('AWS/EC2', metric_name, 'InstanceId', instance_id, 'Average')
+            for volume_id in instance.get('VolumeIds', []):
+                for metric_name in ('VolumeReadBytes', 'VolumeWriteBytes'):
+                    collector.add('AWS/EBS', metric_name, 'VolumeId', volume_id, 'Sum')
+        
+        collector.flush()
+        return collector
+    
+    def collect_metrics(self, instances, budget=None, unreached=None, tags=None):
+        """Prefetch metrics for the whole fleet (matched by tags) and return the instances collected"""
+        seen = []
+        # With METRIC_CACHE_BUCKET set, series cached by the previous run only fetch the new datapoints
+        cache = MetricWindowCache.for_target(self.monitoring_role_arn, self.region, tags)
+        if cache:
+            with run_metrics.phase('metric_cache'):
+                cache.load()
         
-        # Check EBS metrics for disk activity with ANY VOLUME ACTIVE approach
-        ebs_result = self.check_ebs_metrics_detailed(volume_ids)
-        metric_results['EBSDiskActivity'] = ebs_result
+        self.metric_data = self.build_metric_collector(instances, seen, cache, budget, unreached)
+        print(f"Collected {len(self.metric_data.results)} metric series "
+              f"({len(self.metric_data.delta_keys)} incremental, {self.metric_data.datapoints_fetched} datapoints fetched) "
+              f"with {self.metric_data.api_calls} GetMetricData call(s)")
         
-        # ANY VOLUME ACTIVE APPROACH: Only count as low activity if NO volumes are active
-        if not ebs_result['any_volume_active']:
-            low_activity_count += 1
-            print(f"  - EBS Activity: All {ebs_result['volume_count']} volumes inactive")
-        else:
-            print(f"  - EBS Activity: {ebs_result['active_volumes_count']} volume(s) active")
+        if cache:
+            with run_metrics.phase('metric_cache'):
+                cache.save(self.metric_data.start_time, self.metric_data.end_time, self.metric_data.period)
         
-        return metric_results, low_activity_count
+        # Score the whole fleet in one pass; per-instance checks read the results
+        self.evaluate_instances(seen)
+        return seen
+    
+    def evaluate_instances(self, instances, metric_data=None):
+        """Score instances with the idle policy; results are kept for is_instance_unused"""
+        metric_data = metric_data or self.metric_data
+        with run_metrics.phase('evaluate'):
+            evaluations = self.policy.evaluate(instances, metric_data)
+        self.evaluations.update(evaluations)
+        return evaluations
+    
+    def evaluate_instance(self, instance_id, volume_ids, metric_data=None):
+        """Evaluation for one instance, reusing the fleet-wide pass when available"""
+        if metric_data is None and instance_id in self.evaluations:
+            return self.evaluations[instance_id]
+        if metric_data is None:
+            metric_data = self.metric_data or self.build_metric_collector(
+                [{'InstanceId': instance_id, 'VolumeIds': volume_ids}]
+            )
+        instance = {'InstanceId': instance_id, 'VolumeIds': volume_ids, 'Tags': []}
+        return self.policy.evaluate([instance], metric_data)[instance_id]
+    
+    def check_instance_metrics_with_details(self, instance_id, volume_ids, metric_data=None):
+        """Check instance metrics and return detailed results with the weighted low-activity score"""
+        evaluation = self.evaluate_instance(instance_id, volume_ids, metric_data)
+        return evaluation['metric_results'], evaluation['low_score']
     
-    def print_metric_details(self, instance_id, metric_results):
+    def print_metric_details(self, instance_id, metric_results, policy=None):
         """Print detailed metric information with multi-volume support"""
+        policy = policy or self.policy.default
         print(f"Detailed metrics for {instance_id}:")
         
         for metric_name, result in metric_results.items():
             if metric_name == 'CPUUtilization':
-                threshold = 3.0
+                threshold = policy['metrics'][metric_name]['threshold']
                 threshold_display = f"{threshold} %"
                 if result['status'] == 'NO_DATA':
                     print(f"  {metric_name}: NO DATA (assuming inactive)")
+                elif result['status'] == 'THROTTLED':
+                    print(f"  {metric_name}: THROTTLED (not counted as inactive)")
                 elif result['status'] == 'ERROR':
                     print(f"  {metric_name}: ERROR (assuming inactive)")
                 else:
@@ -364,11 +1422,13 @@ class EC2AutoShutdown:
                     print(f"  {status} {metric_name}: {value_display} (threshold: {threshold_display})")
             
             elif metric_name in ['NetworkIn', 'NetworkOut']:
-                threshold = 10000
+                threshold = policy['metrics'][metric_name]['threshold']
                 threshold_display = f"{threshold} Bytes ({format_bytes_to_readable(threshold)})"
                 
                 if result['status'] == 'NO_DATA':
                     print(f"  {metric_name}: NO DATA (assuming inactive)")
+                elif result['status'] == 'THROTTLED':
+                    print(f"  {metric_name}: THROTTLED (not counted as inactive)")
                 elif result['status'] == 'ERROR':
                     print(f"  {metric_name}: ERROR (assuming inactive)")
                 else:
@@ -377,13 +1437,15 @@ class EC2AutoShutdown:
                     print(f"  {status} {metric_name}: {value_display} (threshold: {threshold_display})")
             
             elif metric_name == 'EBSDiskActivity':
-                threshold = 102400
+                threshold = policy['metrics'][metric_name]['threshold']
                 threshold_display = f"{threshold} Bytes ({format_bytes_to_readable(threshold)})"
                 
                 if result['status'] == 'NO_DATA':
                     print(f"  EBS Disk Activity: NO DATA across {result['volume_count']} volumes")
                 elif result['status'] == 'NO_VOLUMES':
                     print(f"  EBS Disk Activity: NO EBS VOLUMES")
+                elif result['status'] == 'THROTTLED':
+                    print(f"  EBS Disk Activity: THROTTLED (not counted as inactive)")
                 elif result['status'] == 'ERROR':
                     print(f"  EBS Disk Activity: ERROR")
                 else:
@@ -408,231 +1470,586 @@ class EC2AutoShutdown:
     
     def is_instance_unused(self, instance_id, volume_ids):
         """Check if instance is unused based on metrics with detailed logging"""
-        metric_results, low_activity_count = self.check_instance_metrics_with_details(instance_id, volume_ids)
-        self.print_metric_details(instance_id, metric_results)
+        evaluation = self.evaluate_instance(instance_id, volume_ids)
+        metric_results = evaluation['metric_results']
         
-        # We now have 4 metrics: CPU, NetworkIn, NetworkOut, EBSDiskActivity
-        # Consider unused if 3 out of 4 metrics show low activity
-        # With ANY VOLUME ACTIVE approach, EBSDiskActivity is low only if NO volumes are active
-        return low_activity_count >= 3
+        # ANY VOLUME ACTIVE APPROACH: EBSDiskActivity is low only if NO volumes are active
+        if debug_enabled():
+            ebs_result = metric_results['EBSDiskActivity']
+            if not ebs_result['any_volume_active']:
+                print(f"  - EBS Activity: All {ebs_result['volume_count']} volumes inactive")
+            else:
+                print(f"  - EBS Activity: {ebs_result['active_volumes_count']} volume(s) active")
+            self.print_metric_details(instance_id, metric_results, evaluation['policy'])
+        
+        # Weighted score of low signals against the policy (default: 3 of 4 signals low)
+        print(f"  - Low-activity score: {evaluation['low_score']:g} "
+              f"(unused at {evaluation['policy']['min_low_score']:g})")
+        return evaluation['is_unused']
     
-    def send_warning_email(self, instance_id, instance_name):
-        """Send warning email for idle instance"""
-        html_body = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; }}
-                .header {{ color: #ff6600; font-size: 18px; font-weight: bold; }}
-                .info {{ background-color: #f5f5f5; padding: 15px; border-radius: 5px; }}
-                .warning {{ color: #cc0000; font-weight: bold; }}
-            </style>
-        </head>
-        <body>
-            <div class="header">🚨 EC2 Instance Auto-Stop Warning</div>
-            <p>Your EC2 instance has been detected as inactive and will be automatically stopped in 15 minutes.</p>
-            
-            <div class="info">
-                <strong>Instance Details:</strong><br>
-                • Name: {instance_name}<br>
-                • ID: {instance_id}<br>
-                • Region: {self.region}<br>
-                • Detection Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}<br>
-                • Scheduled Stop: {(datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')}
-            </div>
-            
-            <p class="warning">⚠️ To prevent shutdown, simply use the instance (SSH/RDP or run commands) to generate activity.</p>
-            
-            <p>
-                <strong>AWS Console:</strong><br>
-                <a href="https://{self.region}.console.aws.amazon.com/ec2/home?region={self.region}#InstanceDetails:instanceId={instance_id}">
-                    View Instance in AWS Console
-                </a>
-            </p>
-            
-            <p>This is an automated message from EC2 Auto-Shutdown System.</p>
-        </body>
-        </html>
-        """
+    def stop_instances(self, instance_ids):
+        """Stop instances in chunked multi-instance calls; returns {instance_id: error message or None}"""
+        results = {}
+        for start in range(0, len(instance_ids), STOP_INSTANCES_CHUNK_SIZE):
+            self.stop_chunk(instance_ids[start:start + STOP_INSTANCES_CHUNK_SIZE], results)
+        if VERIFY_STOPS:
+            self.verify_stopped([instance_id for instance_id, error in results.items() if error is None], results)
+        return results
+    
+    def stop_chunk(self, instance_ids, results):
+        """Stop one chunk, bisecting on failure until the instances that cannot be stopped are isolated"""
+        try:
+            response = self.ec2_client.stop_instances(InstanceIds=instance_ids)
+        except ClientError as e:
+            # StopInstances fails the whole call for a single bad id. Throttling has already been
+            # retried by the client, so splitting the chunk would only add load.
+            if len(instance_ids) == 1 or is_throttling_error(e.response['Error']['Code']):
+                for instance_id in instance_ids:
+                    results[instance_id] = str(e)
+                return
+            middle = len(instance_ids) // 2
+            self.stop_chunk(instance_ids[:middle], results)
+            self.stop_chunk(instance_ids[middle:], results)
+            return
+        except Exception as e:
+            for instance_id in instance_ids:
+                results[instance_id] = str(e)
+            return
         
-        return send_email_SES(html_body, self.ses_role_arn, instance_id)
+        stopping = {change['InstanceId'] for change in response.get('StoppingInstances', [])}
+        for instance_id in instance_ids:
+            results[instance_id] = None if instance_id in stopping else "Not reported in StoppingInstances"
     
-    def send_shutdown_email(self, instance_id, instance_name):
-        """Send shutdown notification email"""
-        html_body = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; }}
-                .header {{ color: #cc0000; font-size: 18px; font-weight: bold; }}
-                .info {{ background-color: #f5f5f5; padding: 15px; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <div class="header">🛑 EC2 Instance Stopped</div>
-            <p>Your EC2 instance has been stopped due to inactivity.</p>
-            
-            <div class="info">
-                <strong>Instance Details:</strong><br>
-                • Name: {instance_name}<br>
-                • ID: {instance_id}<br>
-                • Region: {self.region}<br>
-                • Stop Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-            </div>
+    def verify_stopped(self, instance_ids, results):
+        """Confirm stopped instances report stopping/stopped; the rest are recorded as failed stops"""
+        pending = list(instance_ids)
+        states = {}
+        for attempt in range(VERIFY_STOPS_ATTEMPTS):
+            if attempt:
+                time.sleep(VERIFY_STOPS_DELAY_SECONDS)
+            for start in range(0, len(pending), DESCRIBE_INSTANCES_PAGE_SIZE):
+                try:
+                    response = self.ec2_client.describe_instances(
+                        InstanceIds=pending[start:start + DESCRIBE_INSTANCES_PAGE_SIZE]
+                    )
+                except Exception as e:
+                    # The stop call succeeded; an unverifiable state is not a failed stop
+                    print(f"Could not verify stopped instances: {e}")
+                    return
+                for reservation in response['Reservations']:
+                    for instance in reservation['Instances']:
+                        states[instance['InstanceId']] = instance['State']['Name']
+            pending = [instance_id for instance_id in pending if states.get(instance_id) not in ('stopping', 'stopped')]
+            if not pending:
+                return
+        for instance_id in pending:
+            results[instance_id] = f"Still {states.get(instance_id, 'unknown')} after the stop request"
+
+class ShutdownStateStore:
+    """Warning state for one sweep: loaded in batches up front, written back in batches at the end"""
+    
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.dynamodb = get_resource('dynamodb')
+        self.items = {}
+        self.loaded = False
+        self.puts = {}
+        self.deletes = set()
+        self.lock = threading.Lock()
+    
+    def load(self, instance_ids):
+        """Read state for all instance ids with BatchGetItem (100 keys per request)"""
+        instance_ids = list(dict.fromkeys(instance_ids))
+        try:
+            for i in range(0, len(instance_ids), DYNAMODB_BATCH_GET_MAX_KEYS):
+                chunk = instance_ids[i:i + DYNAMODB_BATCH_GET_MAX_KEYS]
+                request = {self.table_name: {'Keys': [{'InstanceId': instance_id} for instance_id in chunk]}}
+                attempt = 0
+                while request:
+                    response = self.dynamodb.batch_get_item(RequestItems=request)
+                    for item in response.get('Responses', {}).get(self.table_name, []):
+                        self.items[item['InstanceId']] = item
+                    request = response.get('UnprocessedKeys') or None
+                    if request:
+                        # Throttled keys come back unprocessed; retry them with backoff
+                        attempt += 1
+                        time.sleep(min(0.05 * (2 ** attempt), 2.0))
+            self.loaded = True
+            print(f"Loaded {len(self.items)} state item(s) for {len(instance_ids)} instances")
+        except Exception as e:
+            print(f"DynamoDB state load failed, falling back to unconditional deletes: {e}")
+        return self.items
+    
+    def get(self, instance_id):
+        """Return the warning state for an instance, or None"""
+        with self.lock:
+            return self.items.get(instance_id)
+    
+    def put(self, item):
+        """Queue a state item to be written at flush()"""
+        with self.lock:
+            self.items[item['InstanceId']] = item
+            self.puts[item['InstanceId']] = item
+            self.deletes.discard(item['InstanceId'])
+    
+    def delete(self, instance_id):
+        """Queue a delete; returns False when there is no state to remove"""
+        with self.lock:
+            if self.loaded and instance_id not in self.items:
+                return False
+            self.items.pop(instance_id, None)
+            self.puts.pop(instance_id, None)
+            self.deletes.add(instance_id)
+            return True
+    
+    def flush(self):
+        """Apply queued puts and deletes through a batch writer (25 items per request)"""
+        with self.lock:
+            puts = list(self.puts.values())
+            deletes = sorted(self.deletes)
+            self.puts = {}
+            self.deletes = set()
+        
+        if not puts and not deletes:
+            return 0
+        
+        try:
+            table = self.dynamodb.Table(self.table_name)
+            with table.batch_writer(overwrite_by_pkeys=['InstanceId']) as batch:
+                for item in puts:
+                    batch.put_item(Item=item)
+                for instance_id in deletes:
+                    batch.delete_item(Key={'InstanceId': instance_id})
+            print(f"Saved state: {len(puts)} put(s), {len(deletes)} delete(s)")
+        except Exception as e:
+            print(f"Failed to save state to DynamoDB: {e}")
+        return len(puts) + len(deletes)
+
+class TimeBudget:
+    """Remaining time of the invocation; once only the reserve is left no new work is started"""
+    
+    def __init__(self, context, reserve_seconds=TIME_BUDGET_RESERVE_SECONDS):
+        self.context = context
+        self.reserve_seconds = reserve_seconds
+    
+    def remaining_seconds(self):
+        """Seconds left before the Lambda timeout, or None outside Lambda (no context)"""
+        if self.context is None or not hasattr(self.context, 'get_remaining_time_in_millis'):
+            return None
+        return self.context.get_remaining_time_in_millis() / 1000
+    
+    def exhausted(self, margin_seconds=0):
+        """True once only the reserve (plus margin_seconds) is left"""
+        remaining = self.remaining_seconds()
+        return remaining is not None and remaining <= self.reserve_seconds + margin_seconds
+
+class SweepCheckpoint:
+    """Unfinished sweep work saved in the state table between chained invocations"""
+    
+    def __init__(self, table_name):
+        self.table = get_resource('dynamodb').Table(table_name)
+    
+    def save(self, targets, sequence):
+        """Store the remaining targets (with their unprocessed instance ids) and return the checkpoint id"""
+        # Checkpoint keys cannot collide with instance ids in the same table
+        checkpoint_id = f"checkpoint#{uuid.uuid4()}"
+        self.table.put_item(Item={
+            'InstanceId': checkpoint_id,
+            'targets': targets,
+            'sequence': sequence,
+            'created': datetime.now().isoformat(),
+            'expiry_time': int((datetime.now() + timedelta(hours=24)).timestamp())  # TTL for 24 hours
+        })
+        return checkpoint_id
+    
+    def load(self, checkpoint_id):
+        """Remaining targets of a checkpoint, or None if it no longer exists"""
+        response = self.table.get_item(Key={'InstanceId': checkpoint_id}, ConsistentRead=True)
+        item = response.get('Item')
+        return item['targets'] if item else None
+    
+    def delete(self, checkpoint_id):
+        self.table.delete_item(Key={'InstanceId': checkpoint_id})
+
+def schedule_continuation(context, table_name, targets, sequence):
+    """Checkpoint the remaining work and re-invoke this function asynchronously to finish it"""
+    if sequence > MAX_CONTINUATIONS:
+        print(f"Not continuing: {MAX_CONTINUATIONS} continuation(s) already used; "
+              f"remaining work waits for the next scheduled run")
+        return None
+    
+    checkpoint_id = SweepCheckpoint(table_name).save(targets, sequence)
+    payload = {'continuation': {'checkpoint_id': checkpoint_id, 'sequence': sequence}}
+    get_client('lambda').invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps(payload).encode()
+    )
+    print(f"Checkpointed remaining work as {checkpoint_id} and started continuation {sequence}")
+    return payload['continuation']
+
+def process_instance(automator, state, notifications, instance, target_region):
+    """Evaluate one instance and take the warning/stop action; returns an outcome dict"""
+    outcome = {
+        'instance_id': instance['InstanceId'],
+        'warning_queued': False,
+        'stop_requested': False,
+        'stopped': False,
+        'deferred': False,
+        'undecided': False,
+        'errors': []
+    }
+    instance_id = instance['InstanceId']
+    instance_name = instance['Name']
+    volume_ids = instance.get('VolumeIds', [])
+    
+    print(f"Checking instance: {instance_name} ({instance_id})")
+    if debug_enabled():
+        print(f"EBS Volumes: {volume_ids}")
+    
+    try:
+        # Check metrics and get detailed results
+        is_unused = automator.is_instance_unused(instance_id, volume_ids)
+        
+        if not is_unused and automator.evaluate_instance(instance_id, volume_ids)['undecided']:
+            # Leave warning state untouched: throttling is not evidence either way
+            print(f"  - Metrics were throttled - no decision this run")
+            outcome['undecided'] = True
+        elif is_unused:
+            print(f"  - Instance is UNUSED (low-activity score reached the idle policy)")
             
-            <p>The instance was stopped after remaining inactive for 75+ minutes total.</p>
-            <p>You can start the instance again when needed from the AWS Console.</p>
+            # Existing warning state (loaded in batch before processing)
+            instance_state = state.get(instance_id)
             
-            <p>
-                <strong>AWS Console:</strong><br>
-                <a href="https://{self.region}.console.aws.amazon.com/ec2/home?region={self.region}#InstanceDetails:instanceId={instance_id}">
-                    View Instance in AWS Console
-                </a>
-            </p>
+            current_time = datetime.now().isoformat()
             
-            <p>This is an automated message from EC2 Auto-Shutdown System.</p>
-        </body>
-        </html>
-        """
-        
-        return send_email_SES(html_body, self.ses_role_arn, instance_id)
+            if instance_state:
+                # Check if 15 minutes have passed since warning
+                warning_time = datetime.fromisoformat(instance_state['warning_sent'])
+                if datetime.now() - warning_time >= timedelta(minutes=15):
+                    # Time to shutdown
+                    # Stops go out in batched calls once the target's instances are processed
+                    print(f"  - 15 minutes elapsed since warning - stop queued")
+                    outcome['stop_requested'] = True
+                else:
+                    time_remaining = 15 - (datetime.now() - warning_time).total_seconds() / 60
+                    print(f"  - Waiting for shutdown: {time_remaining:.1f} minutes remaining")
+            else:
+                # First time detecting inactivity - send warning and store state
+                state_item = {
+                    'InstanceId': instance_id,
+                    'instance_name': instance_name,
+                    'warning_sent': current_time,
+                    'first_detected': current_time,
+                    'region': target_region,
+                    'expiry_time': int((datetime.now() + timedelta(hours=24)).timestamp())  # TTL for 24 hours
+                }
+                
+                state.put(state_item)
+                
+                # Warnings go out in one digest per recipient after the sweep
+                notifications.add_warning(instance, target_region)
+                outcome['warning_queued'] = True
+                print(f"  - Warning queued for digest")
+                    
+        else:
+            print(f"  - Instance is IN USE")
+            # Remove from state if it became active again
+            if state.delete(instance_id):
+                print(f"  - Removed from tracking (became active)")
+                
+    except Exception as e:
+        error_msg = f"Error processing {instance_id}: {str(e)}"
+        print(f"  - {error_msg}")
+        outcome['errors'].append(error_msg)
     
-    def stop_instance(self, instance_id, instance_name):
-        """Stop EC2 instance"""
+    return outcome
+
+def deferred_outcome(instance):
+    """Outcome for an instance left for the next invocation because the time budget ran out"""
+    return {
+        'instance_id': instance['InstanceId'],
+        'warning_queued': False,
+        'stop_requested': False,
+        'stopped': False,
+        'deferred': True,
+        'undecided': False,
+        'errors': []
+    }
+
+def process_instances(automator, instances, state, notifications, target_region, max_workers=1, slots=None,
+                      budget=None):
+    """Process instances serially or on a bounded worker pool; outcomes keep instance order"""
+    # slots is an optional semaphore shared by all sweep targets (global concurrency cap)
+    slots = slots or nullcontext()
+    budget = budget or TimeBudget(None)
+    
+    if max_workers <= 1 or len(instances) <= 1:
+        outcomes = []
+        for instance in instances:
+            if budget.exhausted():
+                outcomes.append(deferred_outcome(instance))
+                continue
+            with slots:
+                outcomes.append(process_instance(automator, state, notifications, instance, target_region))
+        return outcomes
+    
+    # boto3 clients (EC2, CloudWatch, SES) are thread-safe and shared; the
+    # state store is in memory and guarded by its own lock
+    def run(instance):
+        if budget.exhausted():
+            return deferred_outcome(instance), ''
+        output = io.StringIO()
+        with slots, thread_stdout.capture(output):
+            outcome = process_instance(automator, state, notifications, instance, target_region)
+        return outcome, output.getvalue()
+    
+    print(f"Processing {len(instances)} instances with {max_workers} workers")
+    outcomes = []
+    with thread_stdout.installed():
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields in submission order, so logs and results stay deterministic
+            for outcome, output in executor.map(run, instances):
+                sys.stdout.write(output)
+                outcomes.append(outcome)
+    return outcomes
+
+def execute_stops(automator, state, notifications, instances, outcomes, target_region):
+    """Stop the queued instances in batched calls, then clear state and queue shutdown digests for the stopped ones"""
+    requested = [outcome for outcome in outcomes if outcome['stop_requested']]
+    if not requested:
+        return
+    
+    print(f"Stopping {len(requested)} instance(s) in {target_region}")
+    with run_metrics.phase('stop'):
+        stop_errors = automator.stop_instances([outcome['instance_id'] for outcome in requested])
+    
+    instances_by_id = {instance['InstanceId']: instance for instance in instances}
+    for outcome in requested:
+        instance_id = outcome['instance_id']
+        instance = instances_by_id[instance_id]
+        error = stop_errors.get(instance_id)
+        if error is None:
+            print(f"Successfully stopped instance: {instance['Name']} ({instance_id})")
+            notifications.add_stop(instance, target_region)
+            # Remove from state after shutdown
+            state.delete(instance_id)
+            outcome['stopped'] = True
+        else:
+            # The warning state stays, so the stop is retried on the next run
+            print(f"Failed to stop instance {instance_id}: {error}")
+            outcome['errors'].append(f"Failed to stop {instance_id}: {error}")
+
+def run_target(target, ses_role_arn, notifications, default_tags, table_name, instance_workers=1, slots=None,
+               budget=None):
+    """Sweep one (monitoring role, region) target and return its results"""
+    region = target.get('region', 'us-west-2')
+    role_arn = target['role_arn']
+    tags = target.get('tags', default_tags)
+    # A continuation resumes a target with only the instances the previous invocation did not reach
+    instance_ids = set(target['instance_ids']) if target.get('instance_ids') is not None else None
+    budget = budget or TimeBudget(None)
+    
+    results = {
+        'role_arn': role_arn,
+        'region': region,
+        'checked_instances': 0,
+        'warnings_queued': 0,
+        'instances_stopped': 0,
+        'instances_undecided': 0,
+        'deferred': False,
+        'deferred_instances': [],
+        'errors': []
+    }
+    
+    if budget.exhausted():
+        print(f"Time budget exhausted - deferring {role_arn} in {region} to the next invocation")
+        results['deferred'] = True
+        return results
+    
+    # Instances the budget left no time to collect metrics for
+    unreached = []
+    try:
+        # Initialize the automator
+        automator = EC2AutoShutdown(role_arn, ses_role_arn, region)
+        
+        # Discover target instances page by page; metric batches go out as soon as they fill
+        discovered = automator.iter_instances(tags)
+        if instance_ids is not None:
+            discovered = (instance for instance in discovered if instance['InstanceId'] in instance_ids)
+        instances = automator.collect_metrics(discovered, budget, unreached, tags)
+        print(f"Found {len(instances)} running instances in {region} with tags {tags}")
+        results['checked_instances'] = len(instances)
+        
+        state = ShutdownStateStore(table_name)
+        with run_metrics.phase('state'):
+            state.load(instance['InstanceId'] for instance in instances)
+        
+        # Instances with a pending warning go first, so a due stop is never the work pushed to a continuation
+        instances.sort(key=lambda instance: state.get(instance['InstanceId']) is None)
         try:
-            self.ec2_client.stop_instances(InstanceIds=[instance_id])
-            print(f"Successfully stopped instance: {instance_name} ({instance_id})")
-            return True
-            
-        except Exception as e:
-            print(f"Failed to stop instance {instance_id}: {e}")
-            return False
+            outcomes = process_instances(
+                automator, instances, state, notifications, region, instance_workers, slots, budget
+            )
+            execute_stops(automator, state, notifications, instances, outcomes, region)
+        finally:
+            with run_metrics.phase('state'):
+                state.flush()
+    except Exception as e:
+        error_msg = f"Error sweeping {role_arn} in {region}: {str(e)}"
+        print(error_msg)
+        results['errors'].append(error_msg)
+        return results
+    
+    for outcome in outcomes:
+        if outcome['deferred']:
+            results['deferred_instances'].append(outcome['instance_id'])
+            continue
+        results['warnings_queued'] += int(outcome['warning_queued'])
+        results['instances_stopped'] += int(outcome['stopped'])
+        results['instances_undecided'] += int(outcome['undecided'])
+        results['errors'].extend(outcome['errors'])
+    results['checked_instances'] -= len(results['deferred_instances'])
+    results['deferred_instances'].extend(unreached)
+    if results['deferred_instances']:
+        print(f"Time budget exhausted - {len(results['deferred_instances'])} instance(s) in {region} deferred")
+    return results
+
+def run_sweep(targets, ses_role_arn, notifications, default_tags, table_name, instance_workers=1, max_concurrency=8,
+              budget=None):
+    """Sweep several (role, region) targets in parallel under one global concurrency cap"""
+    slots = threading.BoundedSemaphore(max_concurrency)
+    
+    def run(target):
+        output = io.StringIO()
+        with thread_stdout.capture(output):
+            target_results = run_target(
+                target, ses_role_arn, notifications, default_tags, table_name, instance_workers, slots, budget
+            )
+        return target_results, output.getvalue()
+    
+    print(f"Sweeping {len(targets)} targets with a global concurrency cap of {max_concurrency}")
+    target_results = []
+    with thread_stdout.installed():
+        with ThreadPoolExecutor(max_workers=min(len(targets), max_concurrency)) as executor:
+            for results, output in executor.map(run, targets):
+                sys.stdout.write(output)
+                target_results.append(results)
+    return target_results
 
 def lambda_handler(event, context):
     """
     Main Lambda handler function
     """
     print("EC2 Auto Shutdown Lambda Started")
+    run_metrics.reset()
     
     # Configuration from environment variables
-    MONITORING_ROLE_ARN = os.environ['MONITORING_ROLE_ARN']
     SES_ROLE_ARN = os.environ['SES_ROLE_ARN']
     TARGET_REGION = os.environ.get('TARGET_REGION', 'us-west-2')
+    INSTANCE_WORKERS = int(os.environ.get('INSTANCE_WORKERS', '1'))
+    SWEEP_MAX_CONCURRENCY = int(os.environ.get('SWEEP_MAX_CONCURRENCY', '8'))
     
     # Parse tags from environment variable
     tags_json = os.environ.get('TAGS_FOR_MATCHING', '{"Environment": "Mainline", "System": "Xbox"}')
     TARGET_TAGS = json.loads(tags_json)
     
-    # Initialize the automator
-    automator = EC2AutoShutdown(MONITORING_ROLE_ARN, SES_ROLE_ARN, TARGET_REGION)
+    # Use DynamoDB for state tracking
+    state_table_name = 'ec2-auto-shutdown-state'
     
-    # Get target instances
-    instances = automator.get_instances_by_tags(TARGET_TAGS)
-    print(f"Found {len(instances)} running instances with tags {TARGET_TAGS}")
+    # Warnings and stops from every target are collected into per-recipient digests
+    notifications = NotificationDigest(SES_ROLE_ARN)
     
-    results = {
-        'checked_instances': len(instances),
-        'warnings_sent': 0,
-        'instances_stopped': 0,
-        'errors': []
-    }
+    budget = TimeBudget(context)
+    continuation = (event or {}).get('continuation')
     
-    # Use DynamoDB for state tracking
-    state_table_name = 'ec2-auto-shutdown-state'
-    dynamodb = boto3.resource('dynamodb')
+    if continuation:
+        # Continuation of a sweep that ran out of time: only the checkpointed work is left
+        checkpoint = SweepCheckpoint(state_table_name)
+        targets = checkpoint.load(continuation['checkpoint_id'])
+        if targets is None:
+            print(f"Checkpoint {continuation['checkpoint_id']} not found - already completed")
+            targets = []
+        print(f"Continuation {continuation['sequence']}: resuming {len(targets)} target(s)")
+    else:
+        # SWEEP_TARGETS: [{"role_arn": ..., "region": ..., "tags": {...}}, ...]; defaults to one target
+        targets_json = os.environ.get('SWEEP_TARGETS')
+        if targets_json:
+            targets = json.loads(targets_json)
+        else:
+            targets = [{'role_arn': os.environ['MONITORING_ROLE_ARN'], 'region': TARGET_REGION}]
     
-    try:
-        table = dynamodb.Table(state_table_name)
-    except Exception as e:
-        print(f"DynamoDB table error: {e}")
-        # Fallback to in-memory state (for testing)
-        state_data = {}
+    if len(targets) > 1:
+        target_results = run_sweep(
+            targets, SES_ROLE_ARN, notifications, TARGET_TAGS, state_table_name,
+            INSTANCE_WORKERS, SWEEP_MAX_CONCURRENCY, budget
+        )
+    else:
+        target_results = [
+            run_target(target, SES_ROLE_ARN, notifications, TARGET_TAGS, state_table_name, INSTANCE_WORKERS,
+                       budget=budget)
+            for target in targets
+        ]
     
-    for instance in instances:
-        instance_id = instance['InstanceId']
-        instance_name = instance['Name']
-        volume_ids = instance.get('VolumeIds', [])
-        
-        print(f"Checking instance: {instance_name} ({instance_id})")
-        print(f"EBS Volumes: {volume_ids}")
-        
+    # Whatever the time budget did not reach goes to a checkpoint and a new invocation
+    remaining = []
+    for target, target_result in zip(targets, target_results):
+        if target_result['deferred']:
+            remaining.append(target)
+        elif target_result['deferred_instances']:
+            remaining.append(dict(target, instance_ids=target_result['deferred_instances']))
+        target_result['instances_deferred'] = len(target_result.pop('deferred_instances'))
+    
+    next_continuation = None
+    progressed = any(r['checked_instances'] for r in target_results)
+    if remaining and not progressed:
+        # Discovery and metric collection alone used up the budget; another invocation would do the same
+        print("Not continuing: no instance was processed in this invocation; raise the timeout or "
+              "TIME_BUDGET_RESERVE_SECONDS is too large. Remaining work waits for the next scheduled run")
+    elif remaining:
+        sequence = continuation['sequence'] + 1 if continuation else 1
         try:
-            # Check metrics and get detailed results
-            is_unused = automator.is_instance_unused(instance_id, volume_ids)
-            
-            if is_unused:
-                print(f"  - Instance is UNUSED (3/4 metrics show low activity)")
-                
-                # Check DynamoDB for existing state
-                try:
-                    response = table.get_item(Key={'InstanceId': instance_id})
-                    state = response.get('Item')
-                except:
-                    state = None
-                
-                current_time = datetime.now().isoformat()
-                
-                if state:
-                    # Check if 15 minutes have passed since warning
-                    warning_time = datetime.fromisoformat(state['warning_sent'])
-                    if datetime.now() - warning_time >= timedelta(minutes=15):
-                        # Time to shutdown
-                        print(f"  - 15 minutes elapsed since warning - stopping instance")
-                        if automator.stop_instance(instance_id, instance_name):
-                            automator.send_shutdown_email(instance_id, instance_name)
-                            # Remove from state after shutdown
-                            try:
-                                table.delete_item(Key={'InstanceId': instance_id})
-                            except:
-                                pass
-                            results['instances_stopped'] += 1
-                        else:
-                            results['errors'].append(f"Failed to stop {instance_id}")
-                    else:
-                        time_remaining = 15 - (datetime.now() - warning_time).total_seconds() / 60
-                        print(f"  - Waiting for shutdown: {time_remaining:.1f} minutes remaining")
-                else:
-                    # First time detecting inactivity - send warning and store state
-                    state_item = {
-                        'InstanceId': instance_id,
-                        'instance_name': instance_name,
-                        'warning_sent': current_time,
-                        'first_detected': current_time,
-                        'region': TARGET_REGION,
-                        'expiry_time': int((datetime.now() + timedelta(hours=24)).timestamp())  # TTL for 24 hours
-                    }
-                    
-                    try:
-                        table.put_item(Item=state_item)
-                    except Exception as e:
-                        print(f"  - Failed to save state to DynamoDB: {e}")
-                    
-                    if automator.send_warning_email(instance_id, instance_name):
-                        results['warnings_sent'] += 1
-                        print(f"  - Warning email sent")
-                    else:
-                        results['errors'].append(f"Failed to send warning for {instance_id}")
-                        
-            else:
-                print(f"  - Instance is IN USE")
-                # Remove from state if it became active again
-                try:
-                    table.delete_item(Key={'InstanceId': instance_id})
-                    print(f"  - Removed from tracking (became active)")
-                except:
-                    pass
-                    
+            next_continuation = schedule_continuation(context, state_table_name, remaining, sequence)
         except Exception as e:
-            error_msg = f"Error processing {instance_id}: {str(e)}"
-            print(f"  - {error_msg}")
-            results['errors'].append(error_msg)
+            print(f"Failed to schedule continuation: {e}")
+    if continuation:
+        checkpoint.delete(continuation['checkpoint_id'])
+    
+    with run_metrics.phase('notify'):
+        delivery = notifications.send()
+    
+    # Merge every target into one report
+    results = {
+        'checked_instances': sum(r['checked_instances'] for r in target_results),
+        'warnings_sent': delivery['warnings_delivered'],
+        'instances_stopped': sum(r['instances_stopped'] for r in target_results),
+        'instances_undecided': sum(r['instances_undecided'] for r in target_results),
+        'digests_sent': delivery['digests_sent'],
+        'errors': [error for r in target_results for error in r['errors']] + delivery['errors']
+    }
+    if remaining:
+        results['instances_deferred'] = sum(r['instances_deferred'] for r in target_results)
+        results['targets_deferred'] = sum(int(r['deferred']) for r in target_results)
+        results['continuation'] = next_continuation
+    if len(target_results) > 1:
+        results['targets'] = target_results
     
     print(f"Processing completed: {results}")
+    
+    instrumentation = run_metrics.summary()
+    if EMIT_METRICS:
+        function_name = (getattr(context, 'function_name', None)
+                         or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'ec2-auto-shutdown'))
+        # One JSON document per line; CloudWatch Logs extracts the metrics from EMF log events
+        for document in run_metrics.emf_documents(function_name, results):
+            print(json.dumps(document))
+    
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': 'EC2 Auto Shutdown completed',
             'results': results,
+            'instrumentation': instrumentation,
             'timestamp': datetime.now().isoformat()
         })
-    }
\ No newline at end of file
+    }